@@ -4,9 +4,11 @@
 """
 
 import re
+import sqlite3
 from pathlib import Path
 
 XPO_PATH = "templates/PrivateProject_CUS_Layer_Export.xpo"
+DB_PATH = "indexXPO_cus/xpo_index.db"
 
 def extract_class(xpo_content, class_name):
     """Извлечение полного класса из XPO"""
@@ -95,12 +97,30 @@ def find_method_calls(method_content):
     return calls
 
 def find_class_hierarchy(xpo_content, class_name):
-    """Поиск наследования класса"""
+    """Поиск цепочки предков класса (от родителя к корню)
+    
+    Берётся из таблицы class_hierarchy индекса; без индекса — только
+    прямой родитель из объявления класса в XPO.
+    """
+    if Path(DB_PATH).exists():
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            rows = conn.execute("""
+                SELECT ancestor FROM class_hierarchy
+                WHERE descendant = ?
+                ORDER BY depth
+            """, (class_name,)).fetchall()
+            return [row[0] for row in rows]
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            conn.close()
+    
     pattern = rf'class\s+{re.escape(class_name)}\s+extends\s+(\w+)'
     match = re.search(pattern, xpo_content)
     if match:
-        return match.group(1)
-    return None
+        return [match.group(1)]
+    return []
 
 def main():
     print("=" * 70)
@@ -123,9 +143,9 @@ def main():
     print("=" * 70)
     
     for cls in key_classes:
-        parent = find_class_hierarchy(content, cls)
+        ancestors = find_class_hierarchy(content, cls)
         print(f"\n{cls}")
-        print(f"  Родитель: {parent or 'Нет (базовый класс)'}")
+        print(f"  Предки: {' -> '.join(ancestors) or 'Нет (базовый класс)'}")
     
     print("\n" + "=" * 70)
     print("2. МЕТОДЫ КЛАССОВ")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверка актуальности SQLite индекса XPO
+
+Сравнивает index_meta индекса с текущим XPO файлом: размер и время
+изменения (файл не читается), при расхождении времени — выборочный хэш
+(быстрый отказ) и, только если он совпал, полный хэш; сколько мегабайт
+прочитано ради полного хэша, выводится отдельной строкой. Дополнительные
+источники (--source) сверяются по таблице sources. С флагом --deep полный
+хэш сверяется всегда и выполняется PRAGMA quick_check базы.
+"""
+import sys
+import time
+import sqlite3
+from pathlib import Path
+from typing import Dict, List
+
+# Добавляем корень проекта в путь для импорта utils, а каталог скрипта — для
+# xpo_indexer_sqlite (скрипт может импортироваться не из indexXPO_cus)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from utils.xpo_index_meta import read_index_meta, source_freshness_report
+from xpo_indexer_sqlite import SCHEMA_VERSION
+
+
+def check_index_health(xpo_file: str, db_file: str, deep: bool = False) -> Dict:
+    """
+    Проверяет, что индекс построен текущей схемой по текущему XPO
+
+    Args:
+        xpo_file: Путь к XPO файлу
+        db_file: Путь к базе индекса
+        deep: Сверять полный хэш XPO и целостность базы
+
+    Returns:
+        Словарь: issues (список проблем, пустой — индекс актуален), meta и
+        full_hash_bytes — сколько байт XPO прочитано ради полного хэша
+    """
+    if not Path(db_file).exists():
+        return {'issues': [f"база данных не найдена: {db_file}"], 'meta': None, 'full_hash_bytes': 0}
+
+    conn = sqlite3.connect(db_file)
+    try:
+        issues: List[str] = []
+        full_hash_bytes = 0
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            issues.append(f"версия схемы {version}, ожидается {SCHEMA_VERSION} (нужна полная перестройка)")
+
+        meta = read_index_meta(conn)
+        if meta is None:
+            issues.append("нет таблицы index_meta (индекс построен старой версией индексатора)")
+        else:
+            source_issues, hashed = source_freshness_report(meta, xpo_file, deep=deep)
+            issues.extend(source_issues)
+            full_hash_bytes += hashed
+
+        # Дополнительные источники (слои VAR, проекты) проверяются по своим отпечаткам
+        try:
+            conn.row_factory = sqlite3.Row
+            extra_sources = conn.execute("SELECT * FROM sources WHERE priority > 0 ORDER BY priority").fetchall()
+        except sqlite3.OperationalError:
+            extra_sources = []
+        for source in extra_sources:
+            source_meta = {key: (str(source[key]) if source[key] is not None else None) for key in source.keys()}
+            source_issues, hashed = source_freshness_report(source_meta, source['path'], deep=deep)
+            issues.extend(f"[{source['layer']}] {issue}" for issue in source_issues)
+            full_hash_bytes += hashed
+
+        if deep:
+            result = conn.execute("PRAGMA quick_check").fetchone()[0]
+            if result != 'ok':
+                issues.append(f"PRAGMA quick_check: {result}")
+    finally:
+        conn.close()
+
+    return {'issues': issues, 'meta': meta, 'full_hash_bytes': full_hash_bytes}
+
+
+def main():
+    # Флаги отделяем от позиционных аргументов
+    deep = '--deep' in sys.argv
+    args_without_flags = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+
+    # Пути по умолчанию — как у xpo_indexer_sqlite.py
+    xpo_file = "../AOT_cus/PrivateProject_CUS_Layer_Export.xpo"
+    if len(args_without_flags) > 0:
+        xpo_file = args_without_flags[0]
+
+    db_file = "xpo_index.db"
+    if len(args_without_flags) > 1:
+        db_file = args_without_flags[1]
+
+    script_dir = Path(__file__).parent
+    xpo_path = (script_dir / xpo_file).resolve()
+    db_path = script_dir / db_file
+
+    started = time.perf_counter()
+    result = check_index_health(str(xpo_path), str(db_path), deep=deep)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    print(f"XPO файл: {xpo_path}")
+    print(f"База данных: {db_path}")
+
+    meta = result['meta']
+    if meta:
+        print(f"Построен: {meta.get('built_at')} ({meta.get('mode')}, {meta.get('build_seconds')} с)")
+        print(f"Источник: {meta.get('source_path')}, {meta.get('source_size')} байт")
+        print(f"Элементов: {meta.get('elements_count')}, методов: {meta.get('methods_count')}")
+        if meta.get('source_path') != str(xpo_path):
+            print("Внимание: индекс построен по другому пути")
+
+    if result['full_hash_bytes']:
+        # Время изменения другое при совпавшем выборочном хэше (или --deep): XPO прочитан целиком
+        print(f"Полный хэш: прочитано {result['full_hash_bytes']} байт XPO "
+              f"({result['full_hash_bytes'] / (1024 * 1024):.1f} МБ)")
+
+    if result['issues']:
+        print(f"\nИНДЕКС УСТАРЕЛ ({elapsed_ms:.1f} мс):")
+        for issue in result['issues']:
+            print(f"  - {issue}")
+        print("Обновите: python indexXPO_cus/xpo_indexer_sqlite.py --update")
+        sys.exit(1)
+
+    print(f"\nOK: индекс актуален ({elapsed_ms:.1f} мс{', полная проверка' if deep else ''})")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение двух выгрузок XPO по хэшам элементов и методов
+
+Каждая сторона — либо база индекса (берутся сохранённые content_hash и
+body_hash основного источника), либо сам XPO файл (хэши считаются
+потоковым проходом: сканер границ и пул процессов, без разбора ссылок,
+меток и FTS). Текст выгрузок построчно не сравнивается, поэтому ответ
+«что изменилось» для экспорта в сотни мегабайт получается за секунды.
+
+Результат — добавленные, удалённые и изменённые элементы и методы; с
+флагом --json он выводится в виде JSON для инкрементальной
+переиндексации и повторного извлечения элементов.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Добавляем корень проекта в путь для импорта utils
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.xpo_utils import index_source_spans
+from xpo_indexer_sqlite import (
+    _batch_spans,
+    _extract_element_name,
+    _read_batch,
+    _run_pipeline,
+    iter_element_boundaries,
+)
+
+
+# Ключ элемента: (тип, имя)
+ElementKey = Tuple[str, str]
+
+
+def _element_hashes_worker(xpo_file: str, spans: List[Tuple[int, int, str]]) -> List[Tuple]:
+    """Задача пула: тип, имя, позиция и sha1 каждого элемента участка файла"""
+    base, text = _read_batch(xpo_file, spans)
+    records = []
+    for start_pos, end_pos, element_type in spans:
+        content = text[start_pos - base:end_pos - base]
+        element_name = _extract_element_name(element_type, content)
+        if element_name:
+            records.append((element_type, element_name, start_pos, end_pos - start_pos,
+                            hashlib.sha1(content.encode('latin-1')).hexdigest()))
+    return records
+
+
+def load_xpo_hashes(xpo_file: str, workers: Optional[int] = None) -> Dict[ElementKey, Dict]:
+    """
+    Считает хэши элементов XPO файла потоковым проходом
+
+    Хэш элемента совпадает с content_hash индекса, поэтому сторону из XPO
+    можно сравнивать со стороной из базы. Методы на этом проходе не
+    разбираются (methods = None): их хэши нужны только для изменённых
+    элементов и досчитываются load_xpo_method_hashes.
+
+    Args:
+        xpo_file: Путь к XPO файлу
+        workers: Число процессов (по умолчанию — по числу ядер)
+
+    Returns:
+        Словарь {(тип, имя): {file_position, size, content_hash, methods}}
+    """
+    if not Path(xpo_file).exists():
+        raise FileNotFoundError(f"Файл не найден: {xpo_file}")
+
+    elements = {}
+
+    def consume(records):
+        for element_type, element_name, file_position, size, content_hash in records:
+            elements[(element_type, element_name)] = {
+                'file_position': file_position,
+                'size': size,
+                'content_hash': content_hash,
+                'methods': None,
+            }
+
+    tasks = ((xpo_file, batch) for batch in _batch_spans(iter_element_boundaries(xpo_file)))
+    _run_pipeline(_element_hashes_worker, tasks, workers or os.cpu_count() or 1, consume)
+    return elements
+
+
+def load_xpo_method_hashes(xpo_file: str, elements: Dict[ElementKey, Dict], keys: Iterable[ElementKey]):
+    """Заполняет methods ({путь метода: body_hash}) у элементов keys, читая их из XPO"""
+    spans = sorted((elements[key]['file_position'], elements[key]['file_position'] + elements[key]['size'], key)
+                   for key in keys if elements[key]['methods'] is None)
+    for batch in _batch_spans(spans):
+        base, text = _read_batch(xpo_file, batch)
+        for start_pos, end_pos, key in batch:
+            content = text[start_pos - base:end_pos - base]
+            elements[key]['methods'] = {
+                path: hashlib.sha1(content[span['body_start']:span['body_end']].encode('latin-1')).hexdigest()
+                for path, span in index_source_spans(content).items()}
+
+
+def load_index_hashes(db_file: str) -> Dict[ElementKey, Dict]:
+    """
+    Читает хэши элементов и методов из базы индекса
+
+    Берётся только основной источник (слой CUS): дополнительные слои
+    (--source) в сравнение выгрузок не входят.
+
+    Returns:
+        Словарь того же вида, что и load_xpo_hashes
+    """
+    if not Path(db_file).exists():
+        raise FileNotFoundError(f"База данных не найдена: {db_file}")
+
+    conn = sqlite3.connect(db_file)
+    try:
+        try:
+            rows = conn.execute("""
+                SELECT id, element_type, element_name, file_position, size, content_hash
+                FROM elements WHERE source_id = 1
+            """).fetchall()
+        except sqlite3.OperationalError:
+            raise ValueError(f"В базе нет хэшей элементов (индекс построен старой версией): {db_file}")
+
+        elements = {}
+        by_id = {}
+        for element_id, element_type, element_name, file_position, size, content_hash in rows:
+            element = {'file_position': file_position, 'size': size, 'content_hash': content_hash, 'methods': {}}
+            elements[(element_type, element_name)] = element
+            by_id[element_id] = element
+
+        for element_id, path, body_hash in conn.execute("SELECT element_id, path, body_hash FROM methods"):
+            element = by_id.get(element_id)
+            if element is not None:
+                element['methods'][path] = body_hash
+    finally:
+        conn.close()
+    return elements
+
+
+def load_export_hashes(path: str, workers: Optional[int] = None) -> Dict[ElementKey, Dict]:
+    """Хэши одной стороны сравнения: база индекса (.db) или XPO файл"""
+    if Path(path).suffix.lower() == '.db':
+        return load_index_hashes(path)
+    return load_xpo_hashes(path, workers)
+
+
+def diff_exports(old: Dict[ElementKey, Dict], new: Dict[ElementKey, Dict]) -> Dict[str, Dict[str, List[Dict]]]:
+    """
+    Сравнивает хэши двух выгрузок
+
+    Элемент изменён, если различается его content_hash (в том числе при
+    изменении только свойств); методы сравниваются внутри элементов,
+    присутствующих в обеих выгрузках, поэтому у изменённых элементов
+    methods должны быть заполнены. Позиции берутся из новой выгрузки,
+    для удалённых — из старой.
+
+    Returns:
+        {'elements': {'added', 'removed', 'modified'}, 'methods': {...}};
+        элемент — {element_type, element_name, file_position, size},
+        метод — {element_type, element_name, path}. Списки отсортированы
+    """
+    def element_entry(key, element):
+        return {'element_type': key[0], 'element_name': key[1],
+                'file_position': element['file_position'], 'size': element['size']}
+
+    def method_entries(key, paths):
+        return [{'element_type': key[0], 'element_name': key[1], 'path': path} for path in sorted(paths)]
+
+    result = {
+        'elements': {'added': [], 'removed': [], 'modified': []},
+        'methods': {'added': [], 'removed': [], 'modified': []},
+    }
+    elements = result['elements']
+    methods = result['methods']
+
+    for key in sorted(new.keys() - old.keys()):
+        elements['added'].append(element_entry(key, new[key]))
+    for key in sorted(old.keys() - new.keys()):
+        elements['removed'].append(element_entry(key, old[key]))
+
+    for key in sorted(old.keys() & new.keys()):
+        old_element, new_element = old[key], new[key]
+        if old_element['content_hash'] == new_element['content_hash']:
+            continue
+        elements['modified'].append(element_entry(key, new_element))
+
+        old_methods, new_methods = old_element['methods'], new_element['methods']
+        methods['added'].extend(method_entries(key, new_methods.keys() - old_methods.keys()))
+        methods['removed'].extend(method_entries(key, old_methods.keys() - new_methods.keys()))
+        methods['modified'].extend(method_entries(key, [path for path in old_methods.keys() & new_methods.keys()
+                                                        if old_methods[path] != new_methods[path]]))
+    return result
+
+
+def compare_exports(old_path: str, new_path: str, workers: Optional[int] = None) -> Tuple[Dict, Dict, Dict]:
+    """
+    Сравнивает две выгрузки (каждая — база индекса или XPO файл)
+
+    Сначала сравниваются только хэши элементов; методы из XPO разбираются
+    лишь у элементов, хэш которых изменился.
+
+    Returns:
+        (хэши старой выгрузки, хэши новой, результат diff_exports)
+    """
+    old = load_export_hashes(old_path, workers)
+    new = load_export_hashes(new_path, workers)
+
+    changed = [key for key in old.keys() & new.keys() if old[key]['content_hash'] != new[key]['content_hash']]
+    for path, elements in ((old_path, old), (new_path, new)):
+        load_xpo_method_hashes(path, elements, changed)
+    return old, new, diff_exports(old, new)
+
+
+def main():
+    # Флаги отделяем от позиционных аргументов
+    as_json = '--json' in sys.argv
+    workers = next((int(arg.split('=', 1)[1]) for arg in sys.argv if arg.startswith('--workers=')), None)
+    args_without_flags = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+
+    if len(args_without_flags) != 2:
+        print("Использование: python xpo_export_diff.py <старый.xpo|старый.db> <новый.xpo|новый.db> "
+              "[--json] [--workers=N]")
+        sys.exit(2)
+
+    # Пути — относительно папки скрипта, как у xpo_indexer_sqlite.py
+    script_dir = Path(__file__).parent
+    old_path, new_path = [(script_dir / arg).resolve() for arg in args_without_flags]
+
+    started = time.perf_counter()
+    old, new, result = compare_exports(str(old_path), str(new_path), workers)
+    elapsed = time.perf_counter() - started
+
+    if as_json:
+        print(json.dumps({'old': str(old_path), 'new': str(new_path), **result}, ensure_ascii=False, indent=2))
+        return
+
+    print(f"Старая выгрузка: {old_path} (элементов: {len(old)})")
+    print(f"Новая выгрузка: {new_path} (элементов: {len(new)})")
+    print("-" * 60)
+
+    titles = {'added': "Добавлены", 'removed': "Удалены", 'modified': "Изменены"}
+    for status, title in titles.items():
+        entries = result['elements'][status]
+        print(f"\n{title} элементы ({len(entries)}):")
+        for entry in entries:
+            print(f"  {entry['element_type']} {entry['element_name']}")
+    for status, title in titles.items():
+        entries = result['methods'][status]
+        print(f"\n{title} методы ({len(entries)}):")
+        for entry in entries:
+            print(f"  {entry['element_type']} {entry['element_name']}.{entry['path']}")
+
+    print(f"\nСравнение заняло {elapsed:.2f} с")
+    if any(result['elements'].values()):
+        print("Обновите индекс: python indexXPO_cus/xpo_indexer_sqlite.py --update")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,460 @@
 SQLite индексатор для полнотекстового поиска в XPO файлах
 Создает базу данных с индексацией всех элементов из XPO файла
 """
+import os
 import re
+import sys
+import glob
+import lzma
+import zlib
+import queue
+import hashlib
 import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from itertools import groupby
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Добавляем корень проекта в путь для импорта utils
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.xpo_utils import (
+    EXTENDS_PATTERN,
+    PROPERTIES_PATTERN,
+    clean_xpo_code,
+    decode_xpo_bytes,
+    extract_code_references,
+    extract_field_references,
+    extract_label_references,
+    extract_macros,
+    extract_variable_types,
+    index_source_spans,
+    mask_code_literals,
+    name_humps,
+    name_trigrams,
+    parse_method_signature,
+    parse_table_schema,
+)
+from utils.xpo_index_meta import read_index_meta, source_fingerprint, write_index_meta
+
+
+# Версия схемы индекса (PRAGMA user_version): повышается при каждом изменении
+# таблиц, индекс другой версии не обновляется инкрементально, а строится заново.
+# Все file_position и size хранятся в байтах файла, а не в символах текста.
+SCHEMA_VERSION = 14
+
+# Пакет строк для executemany при загрузке
+BULK_BATCH_SIZE = 1000
+
+# Кэш SQLite на время полной перестройки, КиБ
+BUILD_CACHE_KIB = 256 * 1024
+
+# Кэш на время VACUUM: копия базы получает такой же кэш, поэтому он меньше
+VACUUM_CACHE_KIB = 32 * 1024
+
+# Слой основного XPO (первого источника индекса)
+PRIMARY_LAYER = 'cus'
+
+# Сжатие текста элементов для element_blobs (--blobs=zlib|lzma)
+BLOB_CODECS = {
+    'zlib': zlib.compress,
+    'lzma': lzma.compress,
+}
+
+# Объём XPO (в байтах), который обрабатывает одна задача пула
+PIPELINE_BATCH_BYTES = 4 * 1024 * 1024
+
+# Буфер последовательного чтения XPO при поиске границ элементов
+SCAN_BUFFER_BYTES = 1024 * 1024
+
+# Заголовок элемента в байтах файла
+ELEMENT_HEADER_PATTERN = re.compile(rb'^\*\*\*Element:\s*(\w+)', re.MULTILINE)
+
+# Шаблоны имени элемента по типу
+ELEMENT_NAME_PATTERNS = {
+    'CLS': re.compile(r'CLASS\s+#(\w+)'),
+    'TAB': re.compile(r'TABLE\s+#(\w+)'),
+    'FRM': re.compile(r'FORM\s+#(\w+)'),
+    'MCR': re.compile(r'MACRO\s+#(\w+)'),
+    'ENU': re.compile(r'ENUM\s+#(\w+)'),
+    'EDT': re.compile(r'EDT\s+#(\w+)'),
+    'SPV': re.compile(r'PRIVILEGE\s+#(\w+)'),
+    'JOB': re.compile(r'JOB\s+#(\w+)'),
+    'MAP': re.compile(r'MAP\s+#(\w+)'),
+    'QTY': re.compile(r'QUERY\s+#(\w+)'),
+}
+
+
+def _extract_element_name(element_type: str, content: str) -> Optional[str]:
+    """Извлекает имя элемента в зависимости от типа"""
+    pattern = ELEMENT_NAME_PATTERNS.get(element_type)
+    if pattern:
+        match = pattern.search(content)
+        if match:
+            return match.group(1)
+    
+    # Для других типов пробуем найти имя в PROPERTIES
+    name_match = re.search(r'Name\s+#(\w+)', content)
+    if name_match:
+        return name_match.group(1)
+    
+    # Пробуем найти в первой строке после Element
+    first_line_match = re.search(r'^\s*(\w+)\s+#(\w+)', content, re.MULTILINE)
+    if first_line_match:
+        return first_line_match.group(2)
+    
+    return None
+
+
+def _extract_element_record(element_type: str, content: str, file_position: int) -> Dict:
+    """Разбирает один элемент XPO в запись индекса
+    
+    Чистая функция: не обращается ни к файлу, ни к базе данных.
+    
+    Args:
+        element_type: Тип элемента (CLS/TAB/FRM...)
+        content: Текст элемента, декодированный как latin-1 (символ = байт)
+        file_position: Байтовое смещение элемента в файле
+    
+    Returns:
+        Словарь с полями элемента и списком методов; у каждого метода
+        байтовое смещение и длина тела (строки между SOURCE и ENDSOURCE),
+        число строк и sha1 тела. xrefs — ссылки на другие элементы:
+        (индекс метода в methods или None, вид, цель, метод цели, смещение).
+        У метода также modifiers (через пробел), return_type и params —
+        [(имя, тип, значение по умолчанию)] из объявления; без объявления
+        (classDeclaration) modifiers и return_type — None.
+        labels — ссылки на метки: (индекс метода или None, ID метки, смещение).
+        field_refs — обращения к полям таблиц: (индекс метода, таблица или
+        None, поле, вид, смещение).
+        macro_defs — определения макросов: (индекс метода, имя, вид, значение,
+        смещение); MCR-элемент — библиотека (вид 'library', значение — весь код).
+        macro_refs — использования макросов: (индекс метода, имя, смещение).
+        extends_name — родитель из свойства Extends или None.
+        table_schema — структура таблицы (parse_table_schema) для TAB, иначе None
+    """
+    element_name = _extract_element_name(element_type, content)
+    
+    methods = []
+    xrefs = []
+    labels = []
+    field_refs = []
+    macro_defs = []
+    macro_refs = []
+    extends_name = None
+    if element_name:
+        spans = index_source_spans(content)
+        
+        # Переменные classDeclaration видны во всех методах класса
+        class_declaration = spans.get('classDeclaration')
+        member_types = {}
+        if class_declaration:
+            member_types = extract_variable_types(mask_code_literals(
+                content[class_declaration['body_start']:class_declaration['body_end']]))
+        
+        for path, span in spans.items():
+            body = content[span['body_start']:span['body_end']]
+            body_position = file_position + span['body_start']
+            for kind, target, target_method, offset in extract_code_references(body, element_name, member_types):
+                xrefs.append((len(methods), kind, target, target_method, body_position + offset))
+            for table, field, kind, offset in extract_field_references(body, element_name, member_types):
+                field_refs.append((len(methods), table, field, kind, body_position + offset))
+            definitions, usages = extract_macros(body)
+            if element_type == 'MCR':
+                macro_defs.append((len(methods), element_name, 'library', _method_fts_text(body), body_position))
+            for name, kind, value, offset in definitions:
+                macro_defs.append((len(methods), name, kind,
+                                   None if value is None else decode_xpo_bytes(value.encode('latin-1')),
+                                   body_position + offset))
+            for name, offset in usages:
+                macro_refs.append((len(methods), name, body_position + offset))
+            signature = parse_method_signature(body) or {'modifiers': None, 'return_type': None, 'parameters': []}
+            methods.append({
+                'method_name': span['name'],
+                'path': path,
+                'file_position': body_position,
+                'size': len(body),
+                'line_count': body.count('\n'),
+                'body_hash': hashlib.sha1(body.encode('latin-1')).hexdigest(),
+                'modifiers': None if signature['modifiers'] is None else ' '.join(signature['modifiers']),
+                'return_type': signature['return_type'],
+                # Значения по умолчанию могут содержать строки — в настоящей кодировке
+                'params': [(param['name'], param['type'],
+                            None if param['default'] is None else decode_xpo_bytes(param['default'].encode('latin-1')))
+                           for param in signature['parameters']],
+            })
+        
+        properties_match = PROPERTIES_PATTERN.search(content)
+        if properties_match:
+            extends_match = EXTENDS_PATTERN.search(properties_match.group(1))
+            if extends_match:
+                extends_name = extends_match.group(1)
+                xrefs.append((None, 'extends', extends_name, None,
+                              file_position + properties_match.start(1) + extends_match.start()))
+        
+        # Метки ищем по всему элементу (в т.ч. Label в PROPERTIES) и относим к методу по смещению
+        body_starts = [span['body_start'] for span in spans.values()]
+        body_ends = [span['body_end'] for span in spans.values()]
+        for label_id, offset in extract_label_references(content):
+            index = bisect_right(body_starts, offset) - 1
+            method_index = index if index >= 0 and offset < body_ends[index] else None
+            labels.append((method_index, label_id, file_position + offset))
+    
+    table_schema = None
+    if element_name and element_type == 'TAB':
+        # Значения свойств (Label, HelpText) — в настоящей кодировке файла
+        table_schema = parse_table_schema(decode_xpo_bytes(content.encode('latin-1')))
+    
+    return {
+        'element_type': element_type,
+        'element_name': element_name,
+        'file_position': file_position,
+        'size': len(content),
+        'content_hash': hashlib.sha1(content.encode('latin-1')).hexdigest(),
+        'extends_name': extends_name,
+        'methods': methods,
+        'xrefs': xrefs,
+        'labels': labels,
+        'field_refs': field_refs,
+        'macro_defs': macro_defs,
+        'macro_refs': macro_refs,
+        'table_schema': table_schema,
+    }
+
+
+def _param_count(method: Dict) -> Optional[int]:
+    """Число параметров метода; None, если у блока нет объявления"""
+    return None if method['modifiers'] is None else len(method['params'])
+
+
+def _method_fts_text(body: str) -> str:
+    """Текст тела метода для methods_fts: настоящая кодировка, без префикса '#'"""
+    return clean_xpo_code(decode_xpo_bytes(body.encode('latin-1')))
+
+
+def _fts_methods_string(method_names) -> str:
+    """Строка методов элемента для FTS: уникальные имена по алфавиту"""
+    return " ".join(sorted(set(method_names)))
+
+
+def iter_element_boundaries(xpo_file: str, buffer_size: int = SCAN_BUFFER_BYTES) -> Iterator[Tuple[int, int, str]]:
+    """Находит байтовые границы элементов XPO файла, читая его потоком
+    
+    Файл читается последовательно буферами по buffer_size байт; между
+    буферами переносится только незаконченная строка, поэтому память не
+    зависит ни от размера файла, ни от размера элементов. Границы
+    отдаются по мере нахождения, без декодирования и разбора элементов.
+    
+    Yields:
+        (начало, конец, тип_элемента) в порядке следования в файле
+    """
+    previous = None     # (начало, тип) последнего найденного заголовка
+    offset = 0          # смещение tail в файле
+    tail = b''
+    with open(xpo_file, 'rb') as f:
+        while True:
+            chunk = f.read(buffer_size)
+            data = tail + chunk
+            # Заголовок — целая строка: ищем только до последнего перевода строки
+            searchable = len(data) if not chunk else data.rfind(b'\n') + 1
+            for match in ELEMENT_HEADER_PATTERN.finditer(data, 0, searchable):
+                start_pos = offset + match.start()
+                if previous:
+                    yield previous[0], start_pos, previous[1]
+                previous = (start_pos, match.group(1).decode('ascii'))
+            if not chunk:
+                break
+            tail = data[searchable:]
+            offset += searchable
+    
+    if previous:
+        yield previous[0], offset + len(tail), previous[1]
+
+
+def _batch_spans(spans: Iterable[Tuple], batch_bytes: int = PIPELINE_BATCH_BYTES) -> Iterator[List[Tuple]]:
+    """Группирует подряд идущие диапазоны (начало, конец, ...) в пакеты по объёму"""
+    batch = []
+    batch_size = 0
+    for span in spans:
+        batch.append(span)
+        batch_size += span[1] - span[0]
+        if batch_size >= batch_bytes:
+            yield batch
+            batch = []
+            batch_size = 0
+    if batch:
+        yield batch
+
+
+def _read_batch(xpo_file: str, spans: List[Tuple]) -> Tuple[int, str]:
+    """Читает одним pread участок файла, покрывающий пакет диапазонов
+    
+    Returns:
+        (смещение участка, текст участка в latin-1)
+    """
+    start_pos = min(span[0] for span in spans)
+    end_pos = max(span[1] for span in spans)
+    with open(xpo_file, 'rb') as f:
+        if hasattr(os, 'pread'):
+            data = os.pread(f.fileno(), end_pos - start_pos, start_pos)
+        else:
+            f.seek(start_pos)
+            data = f.read(end_pos - start_pos)
+    return start_pos, data.decode('latin-1')
+
+
+def _extract_records_worker(xpo_file: str, spans: List[Tuple[int, int, str]], with_bodies: bool,
+                            blob_codec: Optional[str] = None) -> List[Dict]:
+    """Задача пула: читает свой участок файла и разбирает элементы
+    
+    При with_bodies у каждого метода добавляется fts_body — текст для methods_fts,
+    при blob_codec у записи появляется blob — сжатые байты элемента.
+    """
+    base, text = _read_batch(xpo_file, spans)
+    records = []
+    for start_pos, end_pos, element_type in spans:
+        content = text[start_pos - base:end_pos - base]
+        record = _extract_element_record(element_type, content, start_pos)
+        if blob_codec:
+            record['blob'] = BLOB_CODECS[blob_codec](content.encode('latin-1'))
+        if with_bodies:
+            for method in record['methods']:
+                body_start = method['file_position'] - base
+                method['fts_body'] = _method_fts_text(text[body_start:body_start + method['size']])
+        records.append(record)
+    return records
+
+
+def _method_bodies_worker(xpo_file: str, rows: List[Tuple[int, int, int]]) -> List[Tuple[int, str]]:
+    """Задача пула: тексты для methods_fts по строкам (начало, конец, id метода)"""
+    base, text = _read_batch(xpo_file, rows)
+    return [(method_id, _method_fts_text(text[start_pos - base:end_pos - base]))
+            for start_pos, end_pos, method_id in rows]
+
+
+def _run_pipeline(worker: Callable, tasks: Iterable[Tuple], workers: int, consume: Callable):
+    """Выполняет задачи в пуле процессов, результаты пишет один поток-писатель
+    
+    Одновременно в работе не больше 2 * workers задач, результаты передаются
+    писателю в порядке задач, поэтому id в базе не зависят от числа процессов.
+    При workers <= 1 всё выполняется последовательно в текущем потоке.
+    
+    Args:
+        worker: Функция уровня модуля (должна сериализоваться pickle)
+        tasks: Кортежи аргументов worker
+        workers: Число процессов
+        consume: Обработчик результата одной задачи (выполняется в потоке-писателе)
+    """
+    if workers <= 1:
+        for task in tasks:
+            consume(worker(*task))
+        return
+    
+    results = queue.Queue(maxsize=workers * 2)
+    errors = []
+    
+    def writer():
+        while True:
+            result = results.get()
+            if result is None:
+                return
+            if errors:
+                continue  # Дочитываем очередь, чтобы не заблокировать пул
+            try:
+                consume(result)
+            except BaseException as e:
+                errors.append(e)
+    
+    writer_thread = threading.Thread(target=writer, name="xpo-index-writer")
+    writer_thread.start()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for task in tasks:
+                pending.append(executor.submit(worker, *task))
+                if len(pending) >= workers * 2:
+                    results.put(pending.popleft().result())
+                if errors:
+                    break
+            while pending:
+                results.put(pending.popleft().result())
+    finally:
+        results.put(None)
+        writer_thread.join()
+    
+    if errors:
+        raise errors[0]
+
+
+def parse_source_arg(value: str) -> List[Tuple[str, str]]:
+    """Разбирает аргумент --source=путь[:слой]
+    
+    Путь может быть шаблоном (XPO/SharedProject_*.xpo); слой по умолчанию —
+    имя файла без расширения. Двоеточие диска Windows (C:\\...) слоем не считается.
+    
+    Returns:
+        Список (путь, слой) в порядке сортировки путей
+    """
+    path, layer = value, None
+    head, sep, tail = value.rpartition(':')
+    if sep and head and re.fullmatch(r'\w+', tail) and len(head) > 1:
+        path, layer = head, tail
+    
+    paths = sorted(glob.glob(path)) if glob.has_magic(path) else [path]
+    return [(item, layer or Path(item).stem) for item in paths]
 
 
 class XPOSQLiteIndexer:
-    def __init__(self, xpo_file_path: str, db_file: str = "xpo_index.db"):
+    def __init__(self, xpo_file_path: str, db_file: str = "xpo_index.db", workers: Optional[int] = None,
+                 blob_codec: Optional[str] = None, sources: Optional[List[Tuple[str, str]]] = None):
+        """
+        Args:
+            xpo_file_path: Путь к основному XPO файлу (слой PRIMARY_LAYER)
+            db_file: Путь к базе индекса
+            workers: Число процессов разбора (по умолчанию — по числу ядер)
+            blob_codec: 'zlib' или 'lzma' — хранить сжатый текст элементов
+                в element_blobs, чтобы читать код без XPO файла
+            sources: Дополнительные XPO (путь, слой); каждый следующий
+                перекрывает предыдущие в effective_elements. None при
+                обновлении — взять источники, записанные в базе
+        """
+        if blob_codec is not None and blob_codec not in BLOB_CODECS:
+            raise ValueError(f"Неизвестное сжатие: {blob_codec} (доступно: {', '.join(BLOB_CODECS)})")
+        
         self.xpo_file_path = Path(xpo_file_path)
+        self.extra_sources = sources
+        # Источники индекса: id, path, layer, priority (больше — важнее)
+        self.sources = self._make_sources(sources or [])
         self.db_file = Path(db_file)
+        self.workers = workers or os.cpu_count() or 1
+        self.blob_codec = blob_codec
         self.conn = None
+        # Режим methods_fts: 'delete' — строки удаляются точечно,
+        # 'rebuild' — SQLite без contentless_delete, таблица перестраивается
+        self.methods_fts_mode = None
+        self._defer_methods_fts = False
+    
+    def _make_sources(self, extra_sources: List[Tuple[str, str]]) -> List[Dict]:
+        """Строит список источников: основной XPO и дополнительные по порядку"""
+        sources = [{'path': self.xpo_file_path, 'layer': PRIMARY_LAYER}]
+        sources.extend({'path': Path(path), 'layer': layer} for path, layer in extra_sources)
+        resolved = [source['path'].resolve() for source in sources]
+        if len(set(resolved)) != len(resolved):
+            raise ValueError("Один и тот же XPO указан как несколько источников")
+        for priority, source in enumerate(sources):
+            source['id'] = priority + 1
+            source['priority'] = priority
+        return sources
+    
+    @staticmethod
+    def _connect(db_file: Path) -> sqlite3.Connection:
+        """Открывает базу; соединение используется и потоком-писателем конвейера"""
+        return sqlite3.connect(db_file, check_same_thread=False)
     
     def create_database(self):
         """Создает структуру базы данных"""
@@ -22,19 +465,63 @@ class XPOSQLiteIndexer:
             print(f"Удаление существующей базы данных: {self.db_file}")
             self.db_file.unlink()
         
-        self.conn = sqlite3.connect(self.db_file)
+        self.conn = self._connect(self.db_file)
         cursor = self.conn.cursor()
         
+        self._create_tables(cursor)
+        self._create_indexes(cursor)
+        self._create_fts_tables(cursor)
+        
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.commit()
+        print(f"База данных создана: {self.db_file}")
+    
+    def _create_tables(self, cursor: sqlite3.Cursor):
+        """Создает основные таблицы"""
+        # Проиндексированные XPO: слой и отпечаток файла, по которому
+        # посчитаны байтовые позиции элементов этого источника
+        cursor.execute("""
+            CREATE TABLE sources (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                layer TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                source_size TEXT,
+                source_mtime_ns TEXT,
+                sample_hash TEXT,
+                full_hash TEXT
+            )
+        """)
+        
         # Таблица элементов
         cursor.execute("""
             CREATE TABLE elements (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source_id INTEGER NOT NULL DEFAULT 1,
                 element_type TEXT NOT NULL,
                 element_name TEXT NOT NULL,
                 file_position INTEGER,
                 size INTEGER,
                 method_count INTEGER DEFAULT 0,
-                UNIQUE(element_type, element_name)
+                content_hash TEXT,
+                extends_name TEXT COLLATE NOCASE,
+                UNIQUE(element_type, element_name, source_id),
+                FOREIGN KEY (source_id) REFERENCES sources(id)
+            )
+        """)
+        
+        # Действующая версия каждого элемента: из источника с наибольшим
+        # priority (проект перекрывает CUS). Подзапрос идёт по UNIQUE-индексу.
+        cursor.execute("""
+            CREATE VIEW effective_elements AS
+            SELECT e.*, s.layer, s.path AS source_path
+            FROM elements e
+            JOIN sources s ON s.id = e.source_id
+            WHERE s.priority = (
+                SELECT MAX(s2.priority)
+                FROM elements e2
+                JOIN sources s2 ON s2.id = e2.source_id
+                WHERE e2.element_type = e.element_type AND e2.element_name = e.element_name
             )
         """)
         
@@ -44,17 +531,244 @@ class XPOSQLiteIndexer:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 element_id INTEGER,
                 method_name TEXT NOT NULL,
+                path TEXT,
+                file_position INTEGER,
+                size INTEGER,
+                line_count INTEGER,
+                body_hash TEXT,
+                modifiers TEXT,
+                return_type TEXT COLLATE NOCASE,
+                param_count INTEGER,
+                FOREIGN KEY (element_id) REFERENCES elements(id)
+            )
+        """)
+        
+        # Параметры из объявлений методов: "методы с параметром SalesTable"
+        cursor.execute("""
+            CREATE TABLE method_params (
+                method_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                param_name TEXT NOT NULL COLLATE NOCASE,
+                param_type TEXT NOT NULL COLLATE NOCASE,
+                default_value TEXT,
+                PRIMARY KEY (method_id, position),
+                FOREIGN KEY (method_id) REFERENCES methods(id)
+            ) WITHOUT ROWID
+        """)
+        
+        # Перекрестные ссылки: кто создает, вызывает, наследует элемент.
+        # Имена в X++ нечувствительны к регистру, отсюда COLLATE NOCASE.
+        cursor.execute("""
+            CREATE TABLE xrefs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                element_id INTEGER NOT NULL,
+                method_id INTEGER,
+                kind TEXT NOT NULL,
+                target_element TEXT COLLATE NOCASE,
+                target_method TEXT COLLATE NOCASE,
+                file_position INTEGER,
+                FOREIGN KEY (element_id) REFERENCES elements(id),
+                FOREIGN KEY (method_id) REFERENCES methods(id)
+            )
+        """)
+        
+        # Использования меток @MIK/@SYS/@GMS/@KOR (label_id без '@': MIK4140)
+        cursor.execute("""
+            CREATE TABLE labels (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                element_id INTEGER NOT NULL,
+                method_id INTEGER,
+                label_id TEXT NOT NULL COLLATE NOCASE,
+                file_position INTEGER,
+                FOREIGN KEY (element_id) REFERENCES elements(id),
+                FOREIGN KEY (method_id) REFERENCES methods(id)
+            )
+        """)
+        
+        # Обращения к полям таблиц: чтение/запись buffer.Field (таблица —
+        # объявленный тип buffer, NULL — если тип неизвестен) и fieldNum/fieldStr
+        cursor.execute("""
+            CREATE TABLE field_refs (
+                id INTEGER PRIMARY KEY,
+                element_id INTEGER NOT NULL,
+                method_id INTEGER,
+                table_name TEXT COLLATE NOCASE,
+                field_name TEXT NOT NULL COLLATE NOCASE,
+                kind TEXT NOT NULL,
+                file_position INTEGER,
+                FOREIGN KEY (element_id) REFERENCES elements(id),
+                FOREIGN KEY (method_id) REFERENCES methods(id)
+            )
+        """)
+        
+        # Макросы: определения (#define, #localmacro, библиотеки MCR целиком)
+        # и использования #Имя со смещениями
+        cursor.execute("""
+            CREATE TABLE macro_defs (
+                id INTEGER PRIMARY KEY,
+                element_id INTEGER NOT NULL,
+                method_id INTEGER,
+                macro_name TEXT NOT NULL COLLATE NOCASE,
+                kind TEXT NOT NULL,
+                value TEXT,
+                file_position INTEGER,
+                FOREIGN KEY (element_id) REFERENCES elements(id),
+                FOREIGN KEY (method_id) REFERENCES methods(id)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE macro_refs (
+                id INTEGER PRIMARY KEY,
+                element_id INTEGER NOT NULL,
+                method_id INTEGER,
+                macro_name TEXT NOT NULL COLLATE NOCASE,
+                file_position INTEGER,
+                FOREIGN KEY (element_id) REFERENCES elements(id),
+                FOREIGN KEY (method_id) REFERENCES methods(id)
+            )
+        """)
+        
+        # Транзитивное замыкание наследования классов: все пары
+        # (предок, потомок) с расстоянием depth (1 — прямой родитель).
+        # Предки могут быть системными классами, которых нет в elements.
+        cursor.execute("""
+            CREATE TABLE class_hierarchy (
+                ancestor TEXT NOT NULL COLLATE NOCASE,
+                descendant TEXT NOT NULL COLLATE NOCASE,
+                depth INTEGER NOT NULL,
+                PRIMARY KEY (ancestor, descendant)
+            ) WITHOUT ROWID
+        """)
+        
+        # Структура таблиц (TAB): свойства, поля, индексы и связи.
+        # Строки удаляются и вставляются вместе с элементом.
+        cursor.execute("""
+            CREATE TABLE table_properties (
+                element_id INTEGER NOT NULL,
+                name TEXT NOT NULL COLLATE NOCASE,
+                value TEXT,
+                PRIMARY KEY (element_id, name)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            CREATE TABLE table_fields (
+                id INTEGER PRIMARY KEY,
+                element_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                field_name TEXT NOT NULL COLLATE NOCASE,
+                field_type TEXT,
+                edt TEXT COLLATE NOCASE,
+                enum_type TEXT COLLATE NOCASE,
+                label TEXT,
                 FOREIGN KEY (element_id) REFERENCES elements(id)
             )
         """)
+        # is_unique — AllowDuplicates = No; is_clustered и is_primary — по
+        # свойствам ClusterIndex и PrimaryIndex таблицы
+        cursor.execute("""
+            CREATE TABLE table_indexes (
+                id INTEGER PRIMARY KEY,
+                element_id INTEGER NOT NULL,
+                index_name TEXT NOT NULL COLLATE NOCASE,
+                is_unique INTEGER NOT NULL,
+                is_clustered INTEGER NOT NULL,
+                is_primary INTEGER NOT NULL,
+                enabled INTEGER NOT NULL,
+                FOREIGN KEY (element_id) REFERENCES elements(id)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE table_index_fields (
+                index_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                field_name TEXT NOT NULL COLLATE NOCASE,
+                PRIMARY KEY (index_id, position),
+                FOREIGN KEY (index_id) REFERENCES table_indexes(id)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            CREATE TABLE table_relations (
+                id INTEGER PRIMARY KEY,
+                element_id INTEGER NOT NULL,
+                relation_name TEXT NOT NULL COLLATE NOCASE,
+                related_table TEXT COLLATE NOCASE,
+                FOREIGN KEY (element_id) REFERENCES elements(id)
+            )
+        """)
+        # link_type: NORMAL (field = related_field), THISFIXED/EXTERNFIXED (поле = value)
+        cursor.execute("""
+            CREATE TABLE table_relation_fields (
+                relation_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                link_type TEXT NOT NULL,
+                field_name TEXT COLLATE NOCASE,
+                related_field TEXT COLLATE NOCASE,
+                value TEXT,
+                PRIMARY KEY (relation_id, position),
+                FOREIGN KEY (relation_id) REFERENCES table_relations(id)
+            ) WITHOUT ROWID
+        """)
+        
+        # Уникальные имена элементов для подсказок: префикс (индекс по
+        # name), CamelCase-горбы (RIEIIS) и триграммы для поиска с опечатками
+        cursor.execute("""
+            CREATE TABLE element_names (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+                humps TEXT NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE name_trigrams (
+                trigram TEXT NOT NULL,
+                name_id INTEGER NOT NULL,
+                PRIMARY KEY (trigram, name_id)
+            ) WITHOUT ROWID
+        """)
         
+        # Сжатый текст элементов (заполняется при --blobs): база
+        # самодостаточна, читатель распаковывает только нужный элемент
+        cursor.execute("""
+            CREATE TABLE element_blobs (
+                element_id INTEGER PRIMARY KEY,
+                codec TEXT NOT NULL,
+                raw_size INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                FOREIGN KEY (element_id) REFERENCES elements(id)
+            )
+        """)
+    
+    def _create_indexes(self, cursor: sqlite3.Cursor):
+        """Создает вторичные индексы"""
         # Индексы для быстрого поиска
         cursor.execute("CREATE INDEX idx_element_type ON elements(element_type)")
         cursor.execute("CREATE INDEX idx_element_name ON elements(element_name)")
         cursor.execute("CREATE INDEX idx_method_name ON methods(method_name)")
         cursor.execute("CREATE INDEX idx_element_id ON methods(element_id)")
-        
-        # Полнотекстовый поиск (FTS5)
+        cursor.execute("CREATE INDEX idx_methods_return_type ON methods(return_type)")
+        cursor.execute("CREATE INDEX idx_method_params_type ON method_params(param_type)")
+        cursor.execute("CREATE INDEX idx_xrefs_target ON xrefs(target_element, target_method)")
+        cursor.execute("CREATE INDEX idx_xrefs_target_method ON xrefs(target_method)")
+        cursor.execute("CREATE INDEX idx_xrefs_element_id ON xrefs(element_id)")
+        cursor.execute("CREATE INDEX idx_labels_label_id ON labels(label_id)")
+        cursor.execute("CREATE INDEX idx_labels_element_id ON labels(element_id)")
+        cursor.execute("CREATE INDEX idx_field_refs_field ON field_refs(field_name, table_name)")
+        cursor.execute("CREATE INDEX idx_field_refs_element_id ON field_refs(element_id)")
+        cursor.execute("CREATE INDEX idx_macro_defs_name ON macro_defs(macro_name)")
+        cursor.execute("CREATE INDEX idx_macro_defs_element_id ON macro_defs(element_id)")
+        cursor.execute("CREATE INDEX idx_macro_refs_name ON macro_refs(macro_name)")
+        cursor.execute("CREATE INDEX idx_macro_refs_element_id ON macro_refs(element_id, macro_name)")
+        cursor.execute("CREATE INDEX idx_class_hierarchy_descendant ON class_hierarchy(descendant, depth)")
+        cursor.execute("CREATE INDEX idx_element_names_humps ON element_names(humps)")
+        cursor.execute("CREATE INDEX idx_table_fields_element ON table_fields(element_id, field_name)")
+        cursor.execute("CREATE INDEX idx_table_fields_edt ON table_fields(edt)")
+        cursor.execute("CREATE INDEX idx_table_indexes_element ON table_indexes(element_id)")
+        cursor.execute("CREATE INDEX idx_table_index_fields_field ON table_index_fields(field_name)")
+        cursor.execute("CREATE INDEX idx_table_relations_element ON table_relations(element_id)")
+        cursor.execute("CREATE INDEX idx_table_relations_related ON table_relations(related_table)")
+    
+    def _create_fts_tables(self, cursor: sqlite3.Cursor):
+        """Создает таблицы полнотекстового поиска (FTS5)"""
         try:
             cursor.execute("""
                 CREATE VIRTUAL TABLE elements_fts USING fts5(
@@ -70,139 +784,728 @@ class XPOSQLiteIndexer:
                 print("Внимание: FTS5 не доступен, создаю без полнотекстового поиска")
             else:
                 raise
+        else:
+            self._create_methods_fts(cursor)
+    
+    def _create_methods_fts(self, cursor: sqlite3.Cursor):
+        """Создает contentless FTS5 по телам методов (rowid = methods.id)
         
-        self.conn.commit()
-        print(f"База данных создана: {self.db_file}")
+        Предпочтительно trigram (поиск подстрок) с contentless_delete=1
+        (SQLite 3.43+); при их отсутствии — варианты попроще.
+        """
+        variants = [
+            ("tokenize='trigram', contentless_delete=1", 'delete'),
+            ("tokenize='trigram'", 'rebuild'),
+            ("contentless_delete=1", 'delete'),
+            ("", 'rebuild'),
+        ]
+        for options, mode in variants:
+            try:
+                cursor.execute(f"""
+                    CREATE VIRTUAL TABLE methods_fts USING fts5(
+                        body,
+                        content=''{', ' + options if options else ''}
+                    )
+                """)
+            except sqlite3.OperationalError:
+                continue
+            self.methods_fts_mode = mode
+            if 'trigram' not in options:
+                print("Внимание: токенизатор trigram не доступен, поиск по телам методов только по словам")
+            return
     
-    def index_file(self):
-        """Индексирует XPO файл"""
-        print(f"Индексация файла: {self.xpo_file_path}")
+    def _detect_methods_fts_mode(self):
+        """Определяет режим methods_fts существующей базы"""
+        row = self.conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type='table' AND name='methods_fts'"
+        ).fetchone()
+        if row is None:
+            self.methods_fts_mode = None
+        elif 'contentless_delete' in row[0]:
+            self.methods_fts_mode = 'delete'
+        else:
+            self.methods_fts_mode = 'rebuild'
+    
+    def _populate_fts(self, cursor: sqlite3.Cursor):
+        """Заполняет FTS-таблицы по уже загруженным элементам и методам"""
+        if not self._has_fts5():
+            return
         
-        if not self.xpo_file_path.exists():
-            raise FileNotFoundError(f"Файл не найден: {self.xpo_file_path}")
+        print("Заполнение FTS...")
+        # Строки читаются курсором по порядку id и сразу вставляются:
+        # методы всех элементов в памяти не собираются
+        reader = self.conn.cursor()
+        reader.execute("""
+            SELECT e.id, e.element_name, e.element_type, m.method_name
+            FROM elements e
+            LEFT JOIN methods m ON m.element_id = e.id
+            ORDER BY e.id
+        """)
+        cursor.executemany("""
+            INSERT INTO elements_fts (rowid, element_name, element_type, methods)
+            VALUES (?, ?, ?, ?)
+        """, ((element_id, element_name, element_type,
+               _fts_methods_string(row[3] for row in rows if row[3] is not None))
+              for (element_id, element_name, element_type), rows
+              in groupby(reader, key=lambda row: row[:3])))
         
-        element_pattern = re.compile(r'^\*\*\*Element:\s*(\w+)', re.MULTILINE)
+        if self.methods_fts_mode:
+            self._rebuild_methods_fts(cursor)
+    
+    def _rebuild_methods_fts(self, cursor: sqlite3.Cursor):
+        """Перестраивает methods_fts по текущим позициям методов"""
+        cursor.execute("INSERT INTO methods_fts (methods_fts) VALUES ('delete-all')")
         
-        print("Чтение файла...")
-        with open(self.xpo_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
+        def consume(bodies):
+            cursor.executemany("INSERT INTO methods_fts (rowid, body) VALUES (?, ?)", bodies)
         
-        file_size_mb = len(content) / 1024 / 1024
-        print(f"Размер файла: {file_size_mb:.2f} MB")
+        # Позиции методов считаны в файле своего источника; строки читаются
+        # отдельным курсором по мере отправки пакетов в пул
+        reader = self.conn.cursor()
+        for source in self.sources:
+            reader.execute("""
+                SELECT m.file_position, m.file_position + m.size, m.id
+                FROM methods m
+                JOIN elements e ON e.id = m.element_id
+                WHERE e.source_id = ?
+                ORDER BY m.file_position
+            """, (source['id'],))
+            tasks = ((str(source['path']), batch) for batch in _batch_spans(reader))
+            _run_pipeline(_method_bodies_worker, tasks, self.workers, consume)
+    
+    def _for_each_record(self, consume_record: Callable[[Dict], None], with_bodies: bool):
+        """Разбирает все элементы всех источников и передает записи consume_record
         
-        elements = list(element_pattern.finditer(content))
-        total = len(elements)
-        print(f"Найдено элементов: {total}")
+        Границы элементов находит потоковый сканер, разбор выполняет пул
+        процессов, каждый из которых сам читает свой участок файла
+        (пакет около PIPELINE_BATCH_BYTES, но не меньше одного элемента);
+        пиковая память ограничена пакетами в работе, а не размером
+        файла. consume_record вызывается в одном потоке-писателе в порядке
+        следования элементов, у каждой записи есть source_id. Байты
+        декодируются как latin-1, поэтому позиции в тексте совпадают с
+        байтовыми смещениями (и для cp1251, и для UTF-8).
+        """
+        for source in self.sources:
+            xpo_file = source['path']
+            if not xpo_file.exists():
+                raise FileNotFoundError(f"Файл не найден: {xpo_file}")
+            
+            file_size = xpo_file.stat().st_size
+            print(f"Источник [{source['layer']}]: {xpo_file} ({file_size / 1024 / 1024:.2f} MB)")
+            print(f"Процессов: {self.workers}")
+            
+            processed = 0
+            
+            def consume(records):
+                nonlocal processed
+                for record in records:
+                    record['source_id'] = source['id']
+                    consume_record(record)
+                processed += len(records)
+                if records and file_size:
+                    position = records[-1]['file_position'] + records[-1]['size']
+                    print(f"Обработано: {processed} элементов ({position / file_size * 100:.1f}%)")
+            
+            # Границы, пакеты и задачи — генераторы: в памяти одновременно
+            # только задачи, которые сейчас в работе у пула
+            spans = iter_element_boundaries(str(xpo_file))
+            tasks = ((str(xpo_file), batch, with_bodies, self.blob_codec) for batch in _batch_spans(spans))
+            _run_pipeline(_extract_records_worker, tasks, self.workers, consume)
+            print(f"Найдено элементов: {processed}")
+    
+    def _register_sources(self, cursor: sqlite3.Cursor):
+        """Записывает источники в таблицу sources вместе с отпечатками файлов
         
+        Отпечаток снимается до разбора: если XPO изменят во время
+        индексации, проверка актуальности это заметит.
+        """
+        for source in self.sources:
+            fingerprint = source_fingerprint(str(source['path']))
+            cursor.execute("""
+                INSERT OR REPLACE INTO sources
+                    (id, path, layer, priority, source_size, source_mtime_ns, sample_hash, full_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (source['id'], fingerprint['source_path'], source['layer'], source['priority'],
+                  fingerprint['source_size'], fingerprint['source_mtime_ns'],
+                  fingerprint['sample_hash'], fingerprint['full_hash']))
+    
+    def _has_fts5(self) -> bool:
+        """Проверяет наличие таблицы FTS5"""
         cursor = self.conn.cursor()
-        
-        # Проверяем наличие FTS5
-        has_fts5 = False
         try:
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='elements_fts'")
-            has_fts5 = cursor.fetchone() is not None
-        except:
-            pass
+            return cursor.fetchone() is not None
+        except sqlite3.Error:
+            return False
+    
+    def _insert_element(self, cursor: sqlite3.Cursor, element: Dict, has_fts5: bool) -> int:
+        """Вставляет элемент, его методы и строку FTS; возвращает id элемента"""
+        cursor.execute("""
+            INSERT INTO elements (source_id, element_type, element_name, file_position, size, method_count,
+                                  content_hash, extends_name)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (element['source_id'], element['element_type'], element['element_name'], element['file_position'],
+              element['size'], len(element['methods']), element['content_hash'], element['extends_name']))
+        
+        element_id = cursor.lastrowid
+        self._insert_element_details(cursor, element_id, element, has_fts5)
+        return element_id
+    
+    def _insert_element_details(self, cursor: sqlite3.Cursor, element_id: int, element: Dict, has_fts5: bool):
+        """Вставляет методы элемента, ссылки и строки FTS"""
+        method_ids = []
+        for method in element['methods']:
+            cursor.execute("""
+                INSERT INTO methods (element_id, method_name, path, file_position, size, line_count, body_hash,
+                                     modifiers, return_type, param_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (element_id, method['method_name'], method['path'], method['file_position'],
+                  method['size'], method['line_count'], method['body_hash'], method['modifiers'],
+                  method['return_type'], _param_count(method)))
+            method_ids.append(cursor.lastrowid)
+            cursor.executemany("""
+                INSERT INTO method_params (method_id, position, param_name, param_type, default_value)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(cursor.lastrowid, position) + param for position, param in enumerate(method['params'], 1)])
+            
+            if self.methods_fts_mode and not self._defer_methods_fts:
+                cursor.execute("""
+                    INSERT INTO methods_fts (rowid, body) VALUES (?, ?)
+                """, (cursor.lastrowid, method['fts_body']))
+        
+        cursor.executemany("""
+            INSERT INTO xrefs (element_id, method_id, kind, target_element, target_method, file_position)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(element_id, None if method_index is None else method_ids[method_index],
+               kind, target, target_method, position)
+              for method_index, kind, target, target_method, position in element['xrefs']])
+        
+        cursor.executemany("""
+            INSERT INTO labels (element_id, method_id, label_id, file_position) VALUES (?, ?, ?, ?)
+        """, [(element_id, None if method_index is None else method_ids[method_index], label_id, position)
+              for method_index, label_id, position in element['labels']])
+        
+        cursor.executemany("""
+            INSERT INTO field_refs (element_id, method_id, table_name, field_name, kind, file_position)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(element_id, method_ids[method_index], table, field, kind, position)
+              for method_index, table, field, kind, position in element['field_refs']])
+        
+        cursor.executemany("""
+            INSERT INTO macro_defs (element_id, method_id, macro_name, kind, value, file_position)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(element_id, method_ids[method_index], name, kind, value, position)
+              for method_index, name, kind, value, position in element['macro_defs']])
+        cursor.executemany("""
+            INSERT INTO macro_refs (element_id, method_id, macro_name, file_position) VALUES (?, ?, ?, ?)
+        """, [(element_id, method_ids[method_index], name, position)
+              for method_index, name, position in element['macro_refs']])
+        
+        if 'blob' in element:
+            cursor.execute("""
+                INSERT INTO element_blobs (element_id, codec, raw_size, data) VALUES (?, ?, ?, ?)
+            """, (element_id, self.blob_codec, element['size'], element['blob']))
+        
+        if element['table_schema']:
+            self._insert_table_schema(cursor, element_id, element['table_schema'])
+        
+        if has_fts5:
+            methods_str = _fts_methods_string(method['method_name'] for method in element['methods'])
+            cursor.execute("""
+                INSERT INTO elements_fts (rowid, element_name, element_type, methods)
+                VALUES (?, ?, ?, ?)
+            """, (element_id, element['element_name'], element['element_type'], methods_str))
+    
+    def _insert_table_schema(self, cursor: sqlite3.Cursor, element_id: int, schema: Dict):
+        """Вставляет свойства, поля, индексы и связи таблицы"""
+        properties = schema['properties']
+        cursor.executemany("""
+            INSERT OR REPLACE INTO table_properties (element_id, name, value) VALUES (?, ?, ?)
+        """, [(element_id, name, value) for name, value in properties.items()])
+        
+        cursor.executemany("""
+            INSERT INTO table_fields (element_id, position, field_name, field_type, edt, enum_type, label)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(element_id, position, field['name'], field['field_type'],
+               field['properties'].get('ExtendedDataType') or None, field['properties'].get('EnumType') or None,
+               field['properties'].get('Label') or None)
+              for position, field in enumerate(schema['fields'], 1)])
+        
+        cluster_index = properties.get('ClusterIndex', '').lower()
+        primary_index = properties.get('PrimaryIndex', '').lower()
+        for index in schema['indexes']:
+            index_properties = index['properties']
+            cursor.execute("""
+                INSERT INTO table_indexes (element_id, index_name, is_unique, is_clustered, is_primary, enabled)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (element_id, index['name'],
+                  index_properties.get('AllowDuplicates', 'Yes') == 'No',
+                  index['name'].lower() == cluster_index,
+                  index['name'].lower() == primary_index,
+                  index_properties.get('Enabled', 'Yes') != 'No'))
+            index_id = cursor.lastrowid
+            cursor.executemany("""
+                INSERT INTO table_index_fields (index_id, position, field_name) VALUES (?, ?, ?)
+            """, [(index_id, position, field_name) for position, field_name in enumerate(index['fields'], 1)])
+        
+        for relation in schema['relations']:
+            cursor.execute("""
+                INSERT INTO table_relations (element_id, relation_name, related_table) VALUES (?, ?, ?)
+            """, (element_id, relation['name'], relation['properties'].get('Table') or None))
+            relation_id = cursor.lastrowid
+            cursor.executemany("""
+                INSERT INTO table_relation_fields (relation_id, position, link_type, field_name, related_field, value)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(relation_id, position, link['type'], link['properties'].get('Field') or None,
+                   link['properties'].get('RelatedField') or None, link['properties'].get('Value') or None)
+                  for position, link in enumerate(relation['links'], 1)])
+    
+    def _delete_element_details(self, cursor: sqlite3.Cursor, element_id: int,
+                                element_type: str, element_name: str, has_fts5: bool):
+        """Удаляет методы элемента и его строку FTS"""
+        if has_fts5:
+            # Для external content FTS5 удаление требует прежних значений колонок
+            cursor.execute("SELECT method_name FROM methods WHERE element_id = ?", (element_id,))
+            methods_str = _fts_methods_string(row[0] for row in cursor.fetchall())
+            cursor.execute("""
+                INSERT INTO elements_fts (elements_fts, rowid, element_name, element_type, methods)
+                VALUES ('delete', ?, ?, ?, ?)
+            """, (element_id, element_name, element_type, methods_str))
+        
+        if self.methods_fts_mode == 'delete':
+            cursor.execute("""
+                DELETE FROM methods_fts WHERE rowid IN (SELECT id FROM methods WHERE element_id = ?)
+            """, (element_id,))
+        
+        cursor.execute("DELETE FROM xrefs WHERE element_id = ?", (element_id,))
+        cursor.execute("DELETE FROM labels WHERE element_id = ?", (element_id,))
+        cursor.execute("DELETE FROM field_refs WHERE element_id = ?", (element_id,))
+        cursor.execute("DELETE FROM macro_defs WHERE element_id = ?", (element_id,))
+        cursor.execute("DELETE FROM macro_refs WHERE element_id = ?", (element_id,))
+        cursor.execute("DELETE FROM element_blobs WHERE element_id = ?", (element_id,))
+        cursor.execute("""
+            DELETE FROM table_index_fields
+            WHERE index_id IN (SELECT id FROM table_indexes WHERE element_id = ?)
+        """, (element_id,))
+        cursor.execute("""
+            DELETE FROM table_relation_fields
+            WHERE relation_id IN (SELECT id FROM table_relations WHERE element_id = ?)
+        """, (element_id,))
+        for table in ('table_properties', 'table_fields', 'table_indexes', 'table_relations'):
+            cursor.execute(f"DELETE FROM {table} WHERE element_id = ?", (element_id,))
+        cursor.execute("""
+            DELETE FROM method_params WHERE method_id IN (SELECT id FROM methods WHERE element_id = ?)
+        """, (element_id,))
+        cursor.execute("DELETE FROM methods WHERE element_id = ?", (element_id,))
+    
+    def index_file(self):
+        """Индексирует XPO файлы всех источников
+        
+        Строки вставляются пакетами через executemany с заранее выданными id.
+        Строки FTS пишутся сразу, если FTS-таблицы уже созданы; при полной
+        перестройке (build_index) они заполняются после загрузки.
+        Одноимённые элементы разных источников хранятся отдельно, дубликаты
+        внутри одного источника пропускаются с предупреждением.
+        """
+        print(f"Индексация файла: {self.xpo_file_path}")
+        
+        cursor = self.conn.cursor()
+        has_fts5 = self._has_fts5()
+        self._detect_methods_fts_mode()
+        self._register_sources(cursor)
+        
+        next_element_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM elements").fetchone()[0] + 1
+        next_method_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM methods").fetchone()[0] + 1
+        seen = {(row[0], row[1], row[2])
+                for row in cursor.execute("SELECT source_id, element_type, element_name FROM elements")}
+        duplicates = []
+        
+        element_rows, method_rows, element_fts_rows, method_fts_rows, xref_rows, label_rows, blob_rows = [], [], [], [], [], [], []
+        param_rows, field_ref_rows, macro_def_rows, macro_ref_rows = [], [], [], []
+        
+        def flush():
+            cursor.executemany("""
+                INSERT INTO elements (id, source_id, element_type, element_name, file_position, size,
+                                      method_count, content_hash, extends_name)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, element_rows)
+            cursor.executemany("""
+                INSERT INTO methods (id, element_id, method_name, path, file_position, size, line_count, body_hash,
+                                     modifiers, return_type, param_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, method_rows)
+            cursor.executemany("""
+                INSERT INTO method_params (method_id, position, param_name, param_type, default_value)
+                VALUES (?, ?, ?, ?, ?)
+            """, param_rows)
+            cursor.executemany("""
+                INSERT INTO xrefs (element_id, method_id, kind, target_element, target_method, file_position)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, xref_rows)
+            cursor.executemany("""
+                INSERT INTO labels (element_id, method_id, label_id, file_position) VALUES (?, ?, ?, ?)
+            """, label_rows)
+            cursor.executemany("""
+                INSERT INTO field_refs (element_id, method_id, table_name, field_name, kind, file_position)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, field_ref_rows)
+            cursor.executemany("""
+                INSERT INTO macro_defs (element_id, method_id, macro_name, kind, value, file_position)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, macro_def_rows)
+            cursor.executemany("""
+                INSERT INTO macro_refs (element_id, method_id, macro_name, file_position) VALUES (?, ?, ?, ?)
+            """, macro_ref_rows)
+            cursor.executemany("""
+                INSERT INTO element_blobs (element_id, codec, raw_size, data) VALUES (?, ?, ?, ?)
+            """, blob_rows)
+            if element_fts_rows:
+                cursor.executemany("""
+                    INSERT INTO elements_fts (rowid, element_name, element_type, methods)
+                    VALUES (?, ?, ?, ?)
+                """, element_fts_rows)
+            if method_fts_rows:
+                cursor.executemany("INSERT INTO methods_fts (rowid, body) VALUES (?, ?)", method_fts_rows)
+            for rows in (element_rows, method_rows, param_rows, element_fts_rows, method_fts_rows, xref_rows, label_rows,
+                         field_ref_rows, macro_def_rows, macro_ref_rows, blob_rows):
+                rows.clear()
         
         processed = 0
         skipped = 0
         
-        for i, element_match in enumerate(elements):
-            if i % 100 == 0 and i > 0:
-                progress = (i / total) * 100
-                print(f"Обработано: {i}/{total} ({progress:.1f}%)")
-                self.conn.commit()
-            
-            element_type = element_match.group(1)
-            start_pos = element_match.start()
-            end_pos = elements[i + 1].start() if i + 1 < len(elements) else len(content)
-            
-            # Извлекаем контекст элемента (первые 10000 символов для анализа)
-            element_content = content[start_pos:min(start_pos + 10000, end_pos)]
-            element_name = self._extract_element_name(element_type, element_content)
-            
-            if not element_name:
+        def consume_record(element):
+            nonlocal next_element_id, next_method_id, processed, skipped
+            key = (element['source_id'], element['element_type'], element['element_name'])
+            if not element['element_name'] or key in seen:
+                # Пропускаем безымянные элементы и дубликаты
                 skipped += 1
-                continue
+                if element['element_name']:
+                    duplicates.append(f"{key[1]} {key[2]}")
+                return
+            seen.add(key)
             
-            methods = []
-            if element_type in ['CLS', 'TAB', 'FRM']:
-                methods = self._extract_methods(element_content)
+            element_id = next_element_id
+            next_element_id += 1
+            element_rows.append((element_id, key[0], key[1], key[2], element['file_position'], element['size'],
+                                 len(element['methods']), element['content_hash'], element['extends_name']))
+            if 'blob' in element:
+                blob_rows.append((element_id, self.blob_codec, element['size'], element['blob']))
+            if element['table_schema']:
+                self._insert_table_schema(cursor, element_id, element['table_schema'])
+            first_method_id = next_method_id
+            for method_index, kind, target, target_method, position in element['xrefs']:
+                xref_rows.append((element_id, None if method_index is None else first_method_id + method_index,
+                                  kind, target, target_method, position))
+            for method_index, label_id, position in element['labels']:
+                label_rows.append((element_id, None if method_index is None else first_method_id + method_index,
+                                   label_id, position))
+            for method_index, table, field, kind, position in element['field_refs']:
+                field_ref_rows.append((element_id, first_method_id + method_index, table, field, kind, position))
+            for method_index, name, kind, value, position in element['macro_defs']:
+                macro_def_rows.append((element_id, first_method_id + method_index, name, kind, value, position))
+            for method_index, name, position in element['macro_refs']:
+                macro_ref_rows.append((element_id, first_method_id + method_index, name, position))
+            for method in element['methods']:
+                method_rows.append((next_method_id, element_id, method['method_name'], method['path'],
+                                    method['file_position'], method['size'], method['line_count'],
+                                    method['body_hash'], method['modifiers'], method['return_type'],
+                                    _param_count(method)))
+                param_rows.extend((next_method_id, position) + param for position, param in enumerate(method['params'], 1))
+                if self.methods_fts_mode:
+                    method_fts_rows.append((next_method_id, method['fts_body']))
+                next_method_id += 1
+            if has_fts5:
+                element_fts_rows.append((element_id, key[2], key[1], _fts_methods_string(
+                    method['method_name'] for method in element['methods'])))
             
-            try:
-                # Вставляем элемент
-                cursor.execute("""
-                    INSERT INTO elements (element_type, element_name, file_position, size, method_count)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (element_type, element_name, start_pos, end_pos - start_pos, len(methods)))
-                
-                element_id = cursor.lastrowid
-                
-                # Вставляем методы
-                for method_name in methods:
-                    cursor.execute("""
-                        INSERT INTO methods (element_id, method_name)
-                        VALUES (?, ?)
-                    """, (element_id, method_name))
-                
-                # Обновляем FTS индекс если доступен
-                if has_fts5:
-                    methods_str = " ".join(methods)
-                    cursor.execute("""
-                        INSERT INTO elements_fts (rowid, element_name, element_type, methods)
-                        VALUES (?, ?, ?, ?)
-                    """, (element_id, element_name, element_type, methods_str))
-                
-                processed += 1
-                
-            except sqlite3.IntegrityError:
-                # Пропускаем дубликаты
-                skipped += 1
-                continue
+            processed += 1
+            if len(element_rows) >= BULK_BATCH_SIZE:
+                flush()
         
+        self._for_each_record(consume_record, with_bodies=bool(self.methods_fts_mode))
+        flush()
+        self._rebuild_class_hierarchy(cursor)
+        self._sync_element_names(cursor)
         self.conn.commit()
         print(f"\nИндексация завершена!")
         print(f"Обработано элементов: {processed}")
         print(f"Пропущено: {skipped}")
+        if duplicates:
+            print(f"Дубликаты внутри одного источника ({len(duplicates)}): {', '.join(duplicates[:10])}"
+                  f"{' ...' if len(duplicates) > 10 else ''}")
+    
+    def build_index(self):
+        """Полностью перестраивает индекс в режиме массовой загрузки
+        
+        База строится во временном файле рядом с целевым: журнал и fsync
+        отключены, кэш увеличен, вторичные индексы и FTS создаются после
+        загрузки данных. Затем ANALYZE и VACUUM, и готовый файл атомарно
+        подменяет старый — читатели никогда не видят недостроенный индекс.
+        Сортировки и копия базы при VACUUM идут через временные файлы, а не
+        в памяти, поэтому пик памяти не растёт с размером экспорта.
+        """
+        if not self.xpo_file_path.exists():
+            raise FileNotFoundError(f"Файл не найден: {self.xpo_file_path}")
+        
+        started = time.perf_counter()
+        tmp_file = self.db_file.with_name(self.db_file.name + ".tmp")
+        if tmp_file.exists():
+            tmp_file.unlink()
+        
+        self.conn = self._connect(tmp_file)
+        cursor = self.conn.cursor()
+        cursor.execute("PRAGMA journal_mode = OFF")
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute(f"PRAGMA cache_size = -{BUILD_CACHE_KIB}")
+        
+        self._create_tables(cursor)
+        self.methods_fts_mode = None
+        self.index_file()
+        
+        print("Создание индексов...")
+        self._create_indexes(cursor)
+        self._create_fts_tables(cursor)
+        self._populate_fts(cursor)
+        
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._write_index_meta(cursor, 'build', started)
+        self.conn.commit()
+        cursor.execute("ANALYZE")
+        self.conn.commit()
+        cursor.execute(f"PRAGMA cache_size = -{VACUUM_CACHE_KIB}")
+        cursor.execute("VACUUM")
+        self.conn.close()
+        
+        os.replace(tmp_file, self.db_file)
+        self.conn = self._connect(self.db_file)
+        print(f"База данных создана: {self.db_file}")
+    
+    def can_update(self) -> bool:
+        """Проверяет, что существующую базу можно обновить инкрементально"""
+        if not self.db_file.exists():
+            return False
+        
+        conn = sqlite3.connect(self.db_file)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+        return version == SCHEMA_VERSION
+    
+    def update_index(self) -> Dict[str, int]:
+        """Инкрементально обновляет индекс по хэшам элементов
+        
+        Новые элементы добавляются, изменённые перезаписываются (вместе с
+        методами и строками FTS), исчезнувшие удаляются; у неизменённых
+        элементов обновляются только позиции. Всё выполняется в одной
+        транзакции, поэтому читатели видят либо старый, либо новый индекс.
+        Без явного списка источников обновляются все источники из базы;
+        с явным — источники, которых нет в списке, удаляются из индекса.
+        
+        Returns:
+            Счётчики added/updated/deleted/moved/unchanged
+        """
+        print(f"Инкрементальное обновление индекса: {self.xpo_file_path}")
+        
+        started = time.perf_counter()
+        self.conn = self._connect(self.db_file)
+        has_fts5 = self._has_fts5()
+        self._detect_methods_fts_mode()
+        if self.blob_codec is None:
+            # Индекс с блобами остаётся с блобами и без повторного --blobs
+            self.blob_codec = (read_index_meta(self.conn) or {}).get('blob_codec') or None
+        # Без contentless_delete строки methods_fts не удалить точечно
+        self._defer_methods_fts = self.methods_fts_mode == 'rebuild'
+        cursor = self.conn.cursor()
+        removed_source_ids = self._match_stored_sources(cursor)
+        
+        cursor.execute("""
+            SELECT id, source_id, element_type, element_name, file_position, size, content_hash
+            FROM elements
+        """)
+        stored = {(row[1], row[2], row[3]): row for row in cursor.fetchall()}
+        
+        stats = {'added': 0, 'updated': 0, 'deleted': 0, 'moved': 0, 'unchanged': 0}
+        seen = set()
+        
+        def consume_record(element):
+            key = (element['source_id'], element['element_type'], element['element_name'])
+            if not element['element_name'] or key in seen:
+                return
+            seen.add(key)
+            
+            old = stored.get(key)
+            if old is None:
+                self._insert_element(cursor, element, has_fts5)
+                stats['added'] += 1
+                return
+            
+            element_id, _, _, _, old_position, old_size, old_hash = old
+            if old_hash == element['content_hash']:
+                if (old_position, old_size) != (element['file_position'], element['size']):
+                    cursor.execute("""
+                        UPDATE elements SET file_position = ?, size = ? WHERE id = ?
+                    """, (element['file_position'], element['size'], element_id))
+                    for table in ('methods', 'xrefs', 'labels', 'field_refs', 'macro_defs', 'macro_refs'):
+                        cursor.execute(f"""
+                            UPDATE {table} SET file_position = file_position + ? WHERE element_id = ?
+                        """, (element['file_position'] - old_position, element_id))
+                    stats['moved'] += 1
+                else:
+                    stats['unchanged'] += 1
+                return
+            
+            self._delete_element_details(cursor, element_id, key[1], key[2], has_fts5)
+            cursor.execute("""
+                UPDATE elements
+                SET file_position = ?, size = ?, method_count = ?, content_hash = ?, extends_name = ?
+                WHERE id = ?
+            """, (element['file_position'], element['size'], len(element['methods']),
+                  element['content_hash'], element['extends_name'], element_id))
+            self._insert_element_details(cursor, element_id, element, has_fts5)
+            stats['updated'] += 1
+        
+        with self.conn:
+            self._register_sources(cursor)
+            self._for_each_record(consume_record, with_bodies=self.methods_fts_mode == 'delete')
+            
+            # Сюда попадают и все элементы источников, убранных из списка
+            for key, old in stored.items():
+                if key in seen:
+                    continue
+                element_id = old[0]
+                self._delete_element_details(cursor, element_id, key[1], key[2], has_fts5)
+                cursor.execute("DELETE FROM elements WHERE id = ?", (element_id,))
+                stats['deleted'] += 1
+            
+            cursor.executemany("DELETE FROM sources WHERE id = ?", [(source_id,) for source_id in removed_source_ids])
+            
+            if stats['added'] or stats['updated'] or stats['deleted']:
+                self._rebuild_class_hierarchy(cursor)
+            if stats['added'] or stats['deleted']:
+                self._sync_element_names(cursor)
+            
+            if self._defer_methods_fts and (stats['added'] or stats['updated'] or stats['deleted']):
+                print("Перестроение methods_fts...")
+                self._rebuild_methods_fts(cursor)
+            
+            self._write_index_meta(cursor, 'update', started)
+        
+        self._defer_methods_fts = False
+        
+        print(f"\nОбновление завершено!")
+        print(f"Добавлено: {stats['added']}, изменено: {stats['updated']}, "
+              f"удалено: {stats['deleted']}, сдвинуто: {stats['moved']}, без изменений: {stats['unchanged']}")
+        return stats
     
-    def _extract_element_name(self, element_type: str, content: str) -> str:
-        """Извлекает имя элемента в зависимости от типа"""
-        patterns = {
-            'CLS': r'CLASS\s+#(\w+)',
-            'TAB': r'TABLE\s+#(\w+)',
-            'FRM': r'FORM\s+#(\w+)',
-            'MCR': r'MACRO\s+#(\w+)',
-            'ENU': r'ENUM\s+#(\w+)',
-            'EDT': r'EDT\s+#(\w+)',
-            'SPV': r'PRIVILEGE\s+#(\w+)',
-            'JOB': r'JOB\s+#(\w+)',
-            'MAP': r'MAP\s+#(\w+)',
-            'QTY': r'QUERY\s+#(\w+)',
-        }
-        
-        pattern = patterns.get(element_type)
-        if pattern:
-            match = re.search(pattern, content)
-            if match:
-                return match.group(1)
-        
-        # Для других типов пробуем найти имя в PROPERTIES
-        name_match = re.search(r'Name\s+#(\w+)', content)
-        if name_match:
-            return name_match.group(1)
-        
-        # Пробуем найти в первой строке после Element
-        first_line_match = re.search(r'^\s*(\w+)\s+#(\w+)', content, re.MULTILINE)
-        if first_line_match:
-            return first_line_match.group(2)
-        
-        return None
-    
-    def _extract_methods(self, content: str) -> List[str]:
-        """Извлекает список методов из элемента"""
-        # Ищем SOURCE #MethodName
-        methods = re.findall(r'SOURCE\s+#(\w+)', content)
-        return sorted(list(set(methods)))  # Убираем дубликаты и сортируем
+    def _match_stored_sources(self, cursor: sqlite3.Cursor) -> List[int]:
+        """Сопоставляет источники индексатора с записанными в базе
+        
+        Без явного списка берутся все источники базы (основной — по
+        текущему пути). Явно заданные источники сохраняют свои id по пути
+        файла, новые получают новые id.
+        
+        Returns:
+            id источников базы, которых больше нет в списке
+        """
+        cursor.execute("SELECT id, path, layer, priority FROM sources ORDER BY priority")
+        stored = cursor.fetchall()
+        
+        if self.extra_sources is None:
+            self.sources = [{'id': source_id, 'path': Path(path), 'layer': layer, 'priority': priority}
+                            for source_id, path, layer, priority in stored]
+            if self.sources:
+                self.sources[0]['path'] = self.xpo_file_path
+            else:
+                self.sources = self._make_sources([])
+            return []
+        
+        ids_by_path = {path: source_id for source_id, path, _, _ in stored}
+        next_id = max(ids_by_path.values(), default=0) + 1
+        for source in self.sources:
+            source_id = ids_by_path.pop(str(source['path'].resolve()), None)
+            if source_id is None:
+                source_id = next_id
+                next_id += 1
+            source['id'] = source_id
+        return list(ids_by_path.values())
+    
+    def _write_index_meta(self, cursor: sqlite3.Cursor, mode: str, started: float):
+        """Записывает в index_meta отпечаток основного XPO, версию схемы, длительность и счётчики"""
+        cursor.execute("""
+            SELECT path, source_size, source_mtime_ns, sample_hash, full_hash
+            FROM sources ORDER BY priority LIMIT 1
+        """)
+        meta = dict(zip(('source_path', 'source_size', 'source_mtime_ns', 'sample_hash', 'full_hash'),
+                        cursor.fetchone()))
+        meta.update({
+            'schema_version': SCHEMA_VERSION,
+            'mode': mode,
+            'built_at': datetime.now().isoformat(timespec='seconds'),
+            'build_seconds': f"{time.perf_counter() - started:.2f}",
+            'blob_codec': self.blob_codec or '',
+        })
+        for table in ('sources', 'elements', 'methods', 'xrefs', 'labels', 'field_refs'):
+            meta[f"{table}_count"] = cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        write_index_meta(cursor, meta)
+    
+    def _rebuild_class_hierarchy(self, cursor: sqlite3.Cursor):
+        """Пересчитывает class_hierarchy по extends_name классов
+        
+        Замыкание строится целиком: классов в CUS-слое немного, а цепочки
+        короткие, поэтому это дешевле точечного обновления. Учитывается
+        действующая версия класса (effective_elements).
+        """
+        cursor.execute("""
+            SELECT element_name, extends_name FROM effective_elements
+            WHERE element_type = 'CLS' AND extends_name IS NOT NULL
+        """)
+        parents = {name.lower(): (name, extends_name) for name, extends_name in cursor.fetchall()}
+        
+        rows = []
+        for name, parent in parents.values():
+            depth = 1
+            seen = {name.lower()}
+            # Идём вверх по цепочке; цикл в Extends обрывает обход
+            while parent and parent.lower() not in seen:
+                rows.append((parent, name, depth))
+                seen.add(parent.lower())
+                parent = parents.get(parent.lower(), (None, None))[1]
+                depth += 1
+        
+        cursor.execute("DELETE FROM class_hierarchy")
+        cursor.executemany("""
+            INSERT OR IGNORE INTO class_hierarchy (ancestor, descendant, depth) VALUES (?, ?, ?)
+        """, rows)
+    
+    def _sync_element_names(self, cursor: sqlite3.Cursor):
+        """Приводит element_names и name_trigrams к именам из elements
+        
+        Добавляются только новые имена и удаляются исчезнувшие, поэтому
+        при обновлении индекса работа пропорциональна числу изменений.
+        """
+        cursor.execute("SELECT id, name FROM element_names")
+        stored = {name.lower(): (name_id, name) for name_id, name in cursor.fetchall()}
+        cursor.execute("SELECT DISTINCT element_name FROM elements")
+        current = {name.lower(): name for (name,) in cursor.fetchall()}
+        
+        for key in stored.keys() - current.keys():
+            name_id, name = stored[key]
+            cursor.executemany("DELETE FROM name_trigrams WHERE trigram = ? AND name_id = ?",
+                               [(trigram, name_id) for trigram in name_trigrams(name)])
+            cursor.execute("DELETE FROM element_names WHERE id = ?", (name_id,))
+        
+        next_id = max((name_id for name_id, _ in stored.values()), default=0) + 1
+        name_rows = []
+        trigram_rows = []
+        for name_id, key in enumerate(sorted(current.keys() - stored.keys()), next_id):
+            name = current[key]
+            name_rows.append((name_id, name, name_humps(name)))
+            trigram_rows.extend((trigram, name_id) for trigram in name_trigrams(name))
+        cursor.executemany("INSERT INTO element_names (id, name, humps) VALUES (?, ?, ?)", name_rows)
+        # В порядке первичного ключа: вставка в конец страниц B-tree
+        trigram_rows.sort()
+        cursor.executemany("INSERT INTO name_trigrams (trigram, name_id) VALUES (?, ?)", trigram_rows)
     
     def get_statistics(self) -> dict:
         """Возвращает статистику по индексу"""
@@ -226,6 +1529,16 @@ class XPOSQLiteIndexer:
         """)
         stats["by_type"] = dict(cursor.fetchall())
         
+        # По источникам (слоям)
+        cursor.execute("""
+            SELECT s.layer, COUNT(e.id)
+            FROM sources s
+            LEFT JOIN elements e ON e.source_id = s.id
+            GROUP BY s.id
+            ORDER BY s.priority
+        """)
+        stats["by_layer"] = dict(cursor.fetchall())
+        
         # Общее количество методов
         cursor.execute("SELECT COUNT(*) FROM methods")
         stats["total_methods"] = cursor.fetchone()[0]
@@ -250,31 +1563,45 @@ class XPOSQLiteIndexer:
 def main():
     import sys
     
+    # Флаги отделяем от позиционных аргументов
+    update = '--update' in sys.argv
+    workers = next((int(arg.split('=', 1)[1]) for arg in sys.argv if arg.startswith('--workers=')), None)
+    blob_codec = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--blobs=')), None)
+    args_without_flags = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    
     # Путь к XPO файлу относительно корня проекта
     xpo_file = "../AOT_cus/PrivateProject_CUS_Layer_Export.xpo"
-    if len(sys.argv) > 1:
-        xpo_file = sys.argv[1]
+    if len(args_without_flags) > 0:
+        xpo_file = args_without_flags[0]
     
     # База данных в текущей папке
     db_file = "xpo_index.db"
-    if len(sys.argv) > 2:
-        db_file = sys.argv[2]
+    if len(args_without_flags) > 1:
+        db_file = args_without_flags[1]
     
     # Преобразуем в абсолютные пути
     script_dir = Path(__file__).parent
     xpo_path = (script_dir / xpo_file).resolve()
     db_path = script_dir / db_file
+    # Дополнительные источники — тоже относительно папки скрипта
+    sources = [source for arg in sys.argv if arg.startswith('--source=')
+               for source in parse_source_arg(str(script_dir / arg.split('=', 1)[1]))] or None
     
     print(f"Скрипт индексации XPO файла")
     print(f"XPO файл: {xpo_path}")
     print(f"База данных: {db_path}")
     print("-" * 60)
     
-    indexer = XPOSQLiteIndexer(str(xpo_path), str(db_path))
+    indexer = XPOSQLiteIndexer(str(xpo_path), str(db_path), workers=workers, blob_codec=blob_codec,
+                               sources=sources)
     
     try:
-        indexer.create_database()
-        indexer.index_file()
+        if update and indexer.can_update():
+            indexer.update_index()
+        else:
+            if update:
+                print("Инкрементальное обновление невозможно (нет базы или старая схема), полная перестройка")
+            indexer.build_index()
         
         # Выводим статистику
         stats = indexer.get_statistics()
@@ -287,6 +1614,10 @@ def main():
         print("\nПо типам:")
         for elem_type, count in sorted(stats.get('by_type', {}).items(), key=lambda x: x[1], reverse=True):
             print(f"  {elem_type}: {count}")
+        if len(stats.get('by_layer', {})) > 1:
+            print("\nПо слоям (в порядке приоритета):")
+            for layer, count in stats['by_layer'].items():
+                print(f"  {layer}: {count}")
         
         db_size_mb = db_path.stat().st_size / 1024 / 1024
         print(f"\nРазмер базы данных: {db_size_mb:.2f} MB")
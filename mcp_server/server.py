@@ -48,8 +48,6 @@ def initialize_components():
     # Проверяем существование файлов
     if not ALD_FILE.exists():
         raise FileNotFoundError(f"ALD файл не найден: {ALD_FILE}")
-    if not XPO_FILE.exists():
-        raise FileNotFoundError(f"XPO файл не найден: {XPO_FILE}")
     if not DB_FILE.exists():
         raise FileNotFoundError(f"База данных не найдена: {DB_FILE}")
     
@@ -62,6 +60,12 @@ def initialize_components():
         import traceback
         traceback.print_exc(file=sys.stderr)
         raise
+    
+    if not XPO_FILE.exists():
+        # Индекс, построенный с --blobs, отдает код без XPO файла
+        if not xpo_reader.has_blobs():
+            raise FileNotFoundError(f"XPO файл не найден: {XPO_FILE}")
+        print(f"XPO файл не найден: {XPO_FILE}; код читается только из блобов индекса", file=sys.stderr)
 
 
 # Создаем MCP сервер
@@ -86,6 +90,10 @@ async def list_tools() -> List[Tool]:
                         "type": "string",
                         "description": "Тип элемента (CLS/TAB/FRM)",
                         "enum": ["CLS", "TAB", "FRM"]
+                    },
+                    "layer": {
+                        "type": "string",
+                        "description": "Слой источника (например, 'cus' или 'proj'); по умолчанию — действующая версия"
                     }
                 },
                 "required": ["element_name"]
@@ -109,11 +117,58 @@ async def list_tools() -> List[Tool]:
                         "type": "string",
                         "description": "Тип элемента (CLS/TAB/FRM)",
                         "enum": ["CLS", "TAB", "FRM"]
+                    },
+                    "layer": {
+                        "type": "string",
+                        "description": "Слой источника (например, 'cus' или 'proj'); по умолчанию — действующая версия"
                     }
                 },
                 "required": ["element_name", "method_name"]
             }
         ),
+        Tool(
+            name="get_element_layers",
+            description="Показывает, в каких слоях (CUS, VAR, проекты) есть элемент и какая версия действует",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "element_name": {
+                        "type": "string",
+                        "description": "Имя элемента"
+                    },
+                    "element_type": {
+                        "type": "string",
+                        "description": "Тип элемента (CLS/TAB/FRM)",
+                        "enum": ["CLS", "TAB", "FRM"]
+                    }
+                },
+                "required": ["element_name"]
+            }
+        ),
+        Tool(
+            name="suggest_elements",
+            description="Подсказывает имена элементов по части имени, CamelCase-аббревиатуре (RIEIIS) или имени с опечаткой",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Начало имени, аббревиатура или имя с опечаткой (например, 'RabitIntEngine')"
+                    },
+                    "element_type": {
+                        "type": "string",
+                        "description": "Тип элемента для фильтрации (опционально)",
+                        "enum": ["CLS", "TAB", "FRM"]
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Максимальное количество подсказок (по умолчанию 20)",
+                        "default": 20
+                    }
+                },
+                "required": ["query"]
+            }
+        ),
         Tool(
             name="search_labels_in_code",
             description="Ищет метки @MIK в коде элемента/метода и расшифровывает их из ALD",
@@ -158,7 +213,7 @@ async def list_tools() -> List[Tool]:
         ),
         Tool(
             name="fulltext_search",
-            description="Полнотекстовый поиск по коду в XPO файле",
+            description="Полнотекстовый поиск по коду методов в XPO файле (поиск подстроки, от 3 символов)",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -175,6 +230,169 @@ async def list_tools() -> List[Tool]:
                 "required": ["query"]
             }
         ),
+        Tool(
+            name="find_references",
+            description="Находит, кто использует элемент: new X(), X::m(), obj.m(), tableNum/classNum и наследование (по индексу xrefs)",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "element_name": {
+                        "type": "string",
+                        "description": "Имя целевого элемента (класса, таблицы)"
+                    },
+                    "method_name": {
+                        "type": "string",
+                        "description": "Имя целевого метода (опционально)"
+                    },
+                    "kind": {
+                        "type": "string",
+                        "description": "Вид ссылки",
+                        "enum": ["new", "static", "call", "tablenum", "classnum", "extends"]
+                    }
+                },
+                "required": ["element_name"]
+            }
+        ),
+        Tool(
+            name="find_field_usage",
+            description="Находит, где читается и записывается поле таблицы (buffer.Field с типом buffer из объявлений) и где оно передается в fieldNum/fieldStr (по индексу field_refs) — для анализа влияния изменения поля",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "table_name": {
+                        "type": "string",
+                        "description": "Имя таблицы (например, 'SalesTable')"
+                    },
+                    "field_name": {
+                        "type": "string",
+                        "description": "Имя поля (например, 'CustAccount')"
+                    },
+                    "kind": {
+                        "type": "string",
+                        "description": "Вид обращения (опционально)",
+                        "enum": ["read", "write", "fieldnum", "fieldstr"]
+                    },
+                    "include_unresolved": {
+                        "type": "boolean",
+                        "description": "Добавить обращения к полю с таким именем, где тип переменной не определен (опционально)"
+                    }
+                },
+                "required": ["table_name", "field_name"]
+            }
+        ),
+        Tool(
+            name="resolve_macro",
+            description="Раскрывает макрос #Имя в его определение (#define, #localmacro или MCR-библиотека целиком) с учетом области видимости: метод, classDeclaration элемента и его предков, подключенные MCR-библиотеки (по индексу macro_defs)",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "macro_name": {
+                        "type": "string",
+                        "description": "Имя макроса без '#' (например, 'CurrentList' или 'InventDimJoin')"
+                    },
+                    "element_name": {
+                        "type": "string",
+                        "description": "Элемент, где встречен макрос (опционально) — для выбора действующего определения"
+                    },
+                    "element_type": {
+                        "type": "string",
+                        "description": "Тип этого элемента (опционально)",
+                        "enum": ["CLS", "TAB", "FRM", "JOB", "MCR"]
+                    },
+                    "method_name": {
+                        "type": "string",
+                        "description": "Метод, где встречен макрос (опционально)"
+                    }
+                },
+                "required": ["macro_name"]
+            }
+        ),
+        Tool(
+            name="find_macro_usage",
+            description="Находит все использования макроса #Имя и подключения MCR-библиотеки (по индексу macro_refs)",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "macro_name": {
+                        "type": "string",
+                        "description": "Имя макроса или MCR-библиотеки без '#'"
+                    }
+                },
+                "required": ["macro_name"]
+            }
+        ),
+        Tool(
+            name="find_methods_by_signature",
+            description="Ищет методы по объявлению: модификаторы, тип результата, типы параметров (по индексу methods/method_params). С одним method_name — все реализации метода с сигнатурами",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "method_name": {
+                        "type": "string",
+                        "description": "Имя метода (опционально)"
+                    },
+                    "return_type": {
+                        "type": "string",
+                        "description": "Тип результата (опционально), например 'container'"
+                    },
+                    "param_type": {
+                        "type": "string",
+                        "description": "Тип одного из параметров (опционально), например 'SalesTable'"
+                    },
+                    "modifier": {
+                        "type": "string",
+                        "description": "Модификатор (опционально)",
+                        "enum": ["public", "private", "protected", "static", "final", "abstract", "server", "client",
+                                 "display", "edit"]
+                    },
+                    "element_type": {
+                        "type": "string",
+                        "description": "Тип элемента (опционально)",
+                        "enum": ["CLS", "TAB", "FRM", "JOB", "MAP", "QTY"]
+                    }
+                }
+            }
+        ),
+        Tool(
+            name="get_class_hierarchy",
+            description="Показывает цепочку предков класса и всех его наследников (по индексу class_hierarchy)",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "class_name": {
+                        "type": "string",
+                        "description": "Имя класса (например, 'RunBaseBatch')"
+                    },
+                    "max_depth": {
+                        "type": "integer",
+                        "description": "Максимальная глубина наследников (опционально, 1 — только прямые)"
+                    }
+                },
+                "required": ["class_name"]
+            }
+        ),
+        Tool(
+            name="get_table_schema",
+            description="Показывает структуру таблицы из индекса: свойства (TableGroup, CacheLookup...), поля с EDT, индексы (поля по порядку, unique, clustered) и связи",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "table_name": {
+                        "type": "string",
+                        "description": "Имя таблицы (например, 'SalesTable')"
+                    },
+                    "field_name": {
+                        "type": "string",
+                        "description": "Поле (опционально): показать, какие индексы его покрывают и на какой позиции"
+                    },
+                    "layer": {
+                        "type": "string",
+                        "description": "Слой источника (опционально); по умолчанию — действующая версия"
+                    }
+                },
+                "required": ["table_name"]
+            }
+        ),
         Tool(
             name="find_label_usage",
             description="Ищет все места использования конкретной метки в коде",
@@ -183,7 +401,7 @@ async def list_tools() -> List[Tool]:
                 "properties": {
                     "label_id": {
                         "type": "string",
-                        "description": "ID метки (например, 'MIK4140' или '4140')"
+                        "description": "ID метки (например, 'MIK4140', '@SYS12345' или '4140')"
                     }
                 },
                 "required": ["label_id"]
@@ -234,8 +452,9 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
         if name == "get_element_code":
             element_name = arguments.get("element_name")
             element_type = arguments.get("element_type")
+            layer = arguments.get("layer")
             
-            element_data = xpo_reader.get_element_code(element_name, element_type)
+            element_data = xpo_reader.get_element_code(element_name, element_type, layer)
             if not element_data:
                 return [TextContent(
                     type="text",
@@ -259,8 +478,9 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
             element_name = arguments.get("element_name")
             method_name = arguments.get("method_name")
             element_type = arguments.get("element_type")
+            layer = arguments.get("layer")
             
-            method_code = xpo_reader.get_method_code(element_name, method_name, element_type)
+            method_code = xpo_reader.get_method_code(element_name, method_name, element_type, layer)
             if not method_code:
                 return [TextContent(
                     type="text",
@@ -279,6 +499,54 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
                     text=f"Ошибка при сохранении метода '{method_name}'"
                 )]
         
+        elif name == "get_element_layers":
+            element_name = arguments.get("element_name")
+            element_type = arguments.get("element_type")
+            
+            versions = xpo_reader.get_element_layers(element_name, element_type)
+            if not versions:
+                return [TextContent(
+                    type="text",
+                    text=f"Элемент '{element_name}' не найден"
+                )]
+            
+            result_lines = [f"Версии '{element_name}': {len(versions)}"]
+            for version in versions:
+                marker = " (действует)" if version['effective'] else ""
+                result_lines.append(
+                    f"\n{version['element_type']} [{version['layer'] or 'cus'}]{marker}: "
+                    f"{version['source_path']}, методов: {version['method_count']}"
+                )
+            
+            return [TextContent(
+                type="text",
+                text="\n".join(result_lines)
+            )]
+        
+        elif name == "suggest_elements":
+            query = arguments.get("query")
+            element_type = arguments.get("element_type")
+            limit = arguments.get("limit", 20)
+            
+            suggestions = xpo_reader.suggest_elements(query, element_type, limit)
+            if not suggestions:
+                return [TextContent(
+                    type="text",
+                    text=f"Похожие на '{query}' элементы не найдены"
+                )]
+            
+            result_lines = [f"Подсказки для '{query}': {len(suggestions)}"]
+            for suggestion in suggestions:
+                result_lines.append(
+                    f"\n{suggestion['element_type']} {suggestion['element_name']} "
+                    f"({suggestion['match']}, {suggestion['score']})"
+                )
+            
+            return [TextContent(
+                type="text",
+                text="\n".join(result_lines)
+            )]
+        
         elif name == "search_labels_in_code":
             element_name = arguments.get("element_name")
             method_name = arguments.get("method_name")
@@ -382,12 +650,259 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
                     text=f"По запросу '{query}' ничего не найдено"
                 )]
             
-            result_lines = [f"Найдено элементов: {len(results)}"]
+            result_lines = [f"Найдено совпадений: {len(results)}"]
             for result in results[:20]:  # Показываем первые 20
-                result_lines.append(f"\n{result['element_type']}: {result['element_name']}")
+                location = f"{result['element_type']}: {result['element_name']}"
+                if result.get('path'):
+                    location += f".{result['path']}"
+                result_lines.append(f"\n{location}")
             
             if len(results) > 20:
-                result_lines.append(f"\n... и еще {len(results) - 20} элементов")
+                result_lines.append(f"\n... и еще {len(results) - 20} совпадений")
+            
+            return [TextContent(
+                type="text",
+                text="\n".join(result_lines)
+            )]
+        
+        elif name == "find_references":
+            element_name = arguments.get("element_name")
+            method_name = arguments.get("method_name")
+            kind = arguments.get("kind")
+            
+            results = xpo_reader.find_references(element_name, method_name, kind)
+            
+            target = f"{element_name}.{method_name}" if method_name else element_name
+            if not results:
+                return [TextContent(
+                    type="text",
+                    text=f"Ссылки на '{target}' не найдены"
+                )]
+            
+            result_lines = [f"Ссылки на '{target}': {len(results)}"]
+            for result in results:
+                source = f"{result['element_type']} {result['element_name']}"
+                if result['layer']:
+                    source += f" [{result['layer']}]"
+                if result['path']:
+                    source += f".{result['path']}"
+                reference = result['target_element'] or '?'
+                if result['target_method']:
+                    reference += f".{result['target_method']}"
+                result_lines.append(f"\n{source}: {result['kind']} {reference} (байт {result['file_position']})")
+            
+            return [TextContent(
+                type="text",
+                text="\n".join(result_lines)
+            )]
+        
+        elif name == "find_field_usage":
+            table_name = arguments.get("table_name")
+            field_name = arguments.get("field_name")
+            kind = arguments.get("kind")
+            include_unresolved = arguments.get("include_unresolved", False)
+            
+            results = xpo_reader.find_field_usage(table_name, field_name, kind, include_unresolved)
+            
+            target = f"{table_name}.{field_name}"
+            if not results:
+                return [TextContent(
+                    type="text",
+                    text=f"Обращения к полю '{target}' не найдены"
+                )]
+            
+            result_lines = [f"Обращения к полю '{target}': {len(results)}"]
+            for result in results:
+                source = f"{result['element_type']} {result['element_name']}"
+                if result['layer']:
+                    source += f" [{result['layer']}]"
+                if result['path']:
+                    source += f".{result['path']}"
+                table = result['table_name'] or '? (тип не определен)'
+                result_lines.append(f"\n{source}: {result['kind']} {table}.{result['field_name']} "
+                                    f"(байт {result['file_position']})")
+            
+            return [TextContent(
+                type="text",
+                text="\n".join(result_lines)
+            )]
+        
+        elif name == "resolve_macro":
+            macro_name = arguments.get("macro_name")
+            results = xpo_reader.resolve_macro(macro_name, arguments.get("element_name"),
+                                               arguments.get("element_type"), arguments.get("method_name"))
+            
+            if not results:
+                return [TextContent(
+                    type="text",
+                    text=f"Определение макроса '#{macro_name}' не найдено"
+                )]
+            
+            scope_titles = {
+                'method': "в этом методе",
+                'element': "classDeclaration элемента",
+                'ancestor': "classDeclaration предка",
+                'included_library': "подключенная библиотека",
+                'library': "MCR-библиотека",
+                'other': "вне области видимости",
+            }
+            result_lines = [f"Определения макроса '#{macro_name}': {len(results)}"]
+            for result in results:
+                source = f"{result['element_type']} {result['element_name']}"
+                if result['layer']:
+                    source += f" [{result['layer']}]"
+                if result['path']:
+                    source += f".{result['path']}"
+                result_lines.append(f"\n{source}: {result['kind']} ({scope_titles[result['scope']]}, "
+                                    f"байт {result['file_position']})")
+                if result['value'] is not None:
+                    result_lines.append(f"```xpp\n{result['value']}\n```")
+            
+            return [TextContent(
+                type="text",
+                text="\n".join(result_lines)
+            )]
+        
+        elif name == "find_macro_usage":
+            macro_name = arguments.get("macro_name")
+            results = xpo_reader.find_macro_usage(macro_name)
+            
+            if not results:
+                return [TextContent(
+                    type="text",
+                    text=f"Использования макроса '#{macro_name}' не найдены"
+                )]
+            
+            result_lines = [f"Использования макроса '#{macro_name}': {len(results)}"]
+            for result in results:
+                source = f"{result['element_type']} {result['element_name']}"
+                if result['layer']:
+                    source += f" [{result['layer']}]"
+                if result['path']:
+                    source += f".{result['path']}"
+                result_lines.append(f"\n{source} (байт {result['file_position']})")
+            
+            return [TextContent(
+                type="text",
+                text="\n".join(result_lines)
+            )]
+        
+        elif name == "find_methods_by_signature":
+            results = xpo_reader.find_methods_by_signature(
+                arguments.get("method_name"), arguments.get("return_type"), arguments.get("param_type"),
+                arguments.get("modifier"), arguments.get("element_type"))
+            
+            if not results:
+                return [TextContent(
+                    type="text",
+                    text="Методы с такой сигнатурой не найдены (укажите хотя бы method_name, return_type, "
+                         "param_type или modifier)"
+                )]
+            
+            result_lines = [f"Найдено методов: {len(results)}"]
+            for result in results:
+                source = f"{result['element_type']} {result['element_name']}"
+                if result['layer']:
+                    source += f" [{result['layer']}]"
+                if result['param_count'] is None:
+                    result_lines.append(f"\n{source}.{result['path']}: без объявления метода")
+                    continue
+                parameters = ", ".join(
+                    f"{param['param_type']} {param['param_name']}"
+                    + (f" = {param['default_value']}" if param['default_value'] is not None else "")
+                    for param in result['parameters'])
+                declaration = " ".join(part for part in (result['modifiers'], result['return_type']) if part)
+                result_lines.append(f"\n{source}.{result['path']}: {declaration} {result['method_name']}({parameters})")
+            
+            return [TextContent(
+                type="text",
+                text="\n".join(result_lines)
+            )]
+        
+        elif name == "get_class_hierarchy":
+            class_name = arguments.get("class_name")
+            max_depth = arguments.get("max_depth")
+            
+            ancestors = xpo_reader.get_ancestors(class_name)
+            descendants = xpo_reader.get_descendants(class_name, max_depth)
+            
+            if not ancestors and not descendants:
+                return [TextContent(
+                    type="text",
+                    text=f"Наследование для '{class_name}' не найдено"
+                )]
+            
+            chain = " -> ".join([class_name] + ancestors)
+            result_lines = [f"Цепочка наследования: {chain}"]
+            result_lines.append(f"\nНаследники: {len(descendants)}")
+            for descendant in descendants:
+                indent = "  " * descendant['depth']
+                result_lines.append(f"{indent}{descendant['class_name']}")
+            
+            return [TextContent(
+                type="text",
+                text="\n".join(result_lines)
+            )]
+        
+        elif name == "get_table_schema":
+            table_name = arguments.get("table_name")
+            field_name = arguments.get("field_name")
+            layer = arguments.get("layer")
+            
+            schema = xpo_reader.get_table_schema(table_name, layer)
+            if not schema:
+                return [TextContent(
+                    type="text",
+                    text=f"Таблица '{table_name}' не найдена"
+                )]
+            
+            def format_index(index):
+                flags = [flag for flag, enabled in (("unique", index['is_unique']), ("clustered", index['is_clustered']),
+                                                    ("primary", index['is_primary']), ("disabled", not index['enabled']))
+                         if enabled]
+                return f"{index['index_name']} ({', '.join(index['fields'])})" + (f" [{', '.join(flags)}]" if flags else "")
+            
+            if field_name:
+                covering = [(index['fields'].index(field), index) for index in schema['indexes']
+                            for field in index['fields'] if field.lower() == field_name.lower()]
+                if not covering:
+                    return [TextContent(
+                        type="text",
+                        text=f"Поле '{field_name}' не входит ни в один индекс таблицы '{schema['name']}'"
+                    )]
+                result_lines = [f"Индексы таблицы '{schema['name']}' с полем '{field_name}': {len(covering)}"]
+                for position, index in sorted(covering, key=lambda item: item[0]):
+                    place = "ведущее поле" if position == 0 else f"позиция {position + 1}"
+                    result_lines.append(f"\n{format_index(index)} — {place}")
+                return [TextContent(
+                    type="text",
+                    text="\n".join(result_lines)
+                )]
+            
+            title = f"Таблица {schema['name']}" + (f" [{schema['layer']}]" if schema['layer'] else "")
+            result_lines = [title]
+            properties = [f"{key}: {value}" for key, value in schema['properties'].items() if key != 'Name']
+            if properties:
+                result_lines.append("\nСвойства: " + "; ".join(properties))
+            result_lines.append(f"\nПоля ({len(schema['fields'])}):")
+            for field in schema['fields']:
+                field_type = field['edt'] or field['enum_type'] or ''
+                result_lines.append(f"  {field['field_name']}: {field['field_type'] or '?'}"
+                                    + (f" ({field_type})" if field_type else ""))
+            result_lines.append(f"\nИндексы ({len(schema['indexes'])}):")
+            for index in schema['indexes']:
+                result_lines.append(f"  {format_index(index)}")
+            result_lines.append(f"\nСвязи ({len(schema['relations'])}):")
+            for relation in schema['relations']:
+                links = []
+                for link in relation['links']:
+                    if link['link_type'] == 'THISFIXED':
+                        links.append(f"{link['field_name']} == {link['value']}")
+                    elif link['link_type'] == 'EXTERNFIXED':
+                        links.append(f"{relation['related_table']}.{link['related_field']} == {link['value']}")
+                    else:
+                        links.append(f"{link['field_name']} == {relation['related_table']}.{link['related_field']}")
+                result_lines.append(f"  {relation['relation_name']} -> {relation['related_table']}: {' && '.join(links)}")
             
             return [TextContent(
                 type="text",
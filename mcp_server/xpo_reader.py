@@ -4,17 +4,42 @@
 Модуль для чтения XPO файла и извлечения кода элементов/методов
 Использует SQLite индекс для быстрого поиска позиций
 """
+import os
 import re
+import lzma
+import zlib
 import sqlite3
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from utils.xpo_utils import (
     clean_xpo_code,
+    decode_xpo_bytes,
     extract_methods,
     extract_properties,
     find_labels_in_text,
+    name_trigrams,
+    normalize_label_id,
+    parse_table_schema,
+    split_name_words,
 )
+from utils.xpo_index_meta import check_source_freshness, read_index_meta
+
+
+# Виды совпадений suggest_elements в порядке релевантности
+SUGGEST_MATCH_ORDER = {'exact': 0, 'prefix': 1, 'humps': 2, 'fuzzy': 3}
+
+# Нечёткое совпадение: доля триграмм запроса, найденных в имени
+FUZZY_MIN_SCORE = 0.5
+
+# Кандидатов из индекса имён на каждый вид поиска
+SUGGEST_CANDIDATES = 100
+
+# Распаковка element_blobs по названию сжатия
+BLOB_DECOMPRESSORS = {
+    'zlib': zlib.decompress,
+    'lzma': lzma.decompress,
+}
 
 
 class XPOReader:
@@ -22,6 +47,10 @@ class XPOReader:
         self.xpo_file_path = Path(xpo_file_path)
         self.db_file_path = Path(db_file_path)
         self.conn = None
+        self._index_meta = None
+        self._sources: Optional[Dict[int, Dict]] = None
+        self._verified_stats: Dict[int, Tuple[int, int]] = {}
+        self._blob_cache: Optional[Tuple[int, int, bytes]] = None  # (id, позиция, байты)
         self._connect_db()
     
     def _connect_db(self):
@@ -31,38 +60,291 @@ class XPOReader:
         
         self.conn = sqlite3.connect(str(self.db_file_path))
         self.conn.row_factory = sqlite3.Row
+        self._index_meta = read_index_meta(self.conn)
+        try:
+            rows = self.conn.execute("SELECT * FROM sources ORDER BY priority").fetchall()
+        except sqlite3.OperationalError:
+            # Индекс построен старой версией индексатора: один источник
+            rows = None
+        if rows is not None:
+            self._sources = {row['id']: {key: (str(row[key]) if row[key] is not None else None)
+                                         for key in row.keys()} for row in rows}
+    
+    @property
+    def _elements_from(self) -> str:
+        """Источник строк элементов для запросов: действующие версии всех слоёв"""
+        if self._sources is None:
+            return "(SELECT *, NULL AS layer FROM elements)"
+        return "effective_elements"
+    
+    def _source_path(self, source_id: Optional[int]) -> Path:
+        """Путь к XPO источника; для основного — путь, переданный читателю"""
+        source = (self._sources or {}).get(source_id)
+        if source and source['priority'] != '0':
+            return Path(source['path'])
+        return self.xpo_file_path
+    
+    def _ensure_index_fresh(self, source_id: Optional[int] = None):
+        """Проверяет, что XPO источника не изменился после построения индекса
+        
+        Пока размер и время изменения файла те же, что при последней
+        проверке, стоит один stat. Если изменилось только время, а
+        выборочный хэш совпал (XPO скопирован), первая проверка читает файл
+        целиком ради полного хэша. Индексы без метаданных проверяются
+        только на наличие файла.
+        
+        Raises:
+            RuntimeError: Если XPO файла нет или байтовые смещения индекса
+                не соответствуют файлу
+        """
+        xpo_file = self._source_path(source_id)
+        try:
+            stat = os.stat(xpo_file)
+        except FileNotFoundError:
+            raise RuntimeError(
+                f"XPO файл не найден: {xpo_file}. Код читается из него, если индекс "
+                f"{self.db_file_path.name} не хранит сжатый текст элемента (построен без --blobs)"
+            ) from None
+        
+        meta = (self._sources or {}).get(source_id, self._index_meta)
+        if meta is None:
+            return
+        
+        current = (stat.st_size, stat.st_mtime_ns)
+        if current == self._verified_stats.get(source_id):
+            return
+        
+        issues = check_source_freshness(meta, str(xpo_file))
+        if issues:
+            raise RuntimeError(
+                f"Индекс {self.db_file_path.name} устарел для {xpo_file.name}: {'; '.join(issues)}. "
+                f"Обновите его: python indexXPO_cus/xpo_indexer_sqlite.py --update"
+            )
+        self._verified_stats[source_id] = current
     
-    def find_element(self, element_name: str, element_type: Optional[str] = None) -> Optional[Dict]:
+    def find_element(self, element_name: str, element_type: Optional[str] = None,
+                     layer: Optional[str] = None) -> Optional[Dict]:
         """Находит элемент в базе данных
         
         Args:
             element_name: Имя элемента
             element_type: Тип элемента (CLS/TAB/FRM) или None для поиска по всем типам
+            layer: Слой источника или None — действующая версия (проект
+                перекрывает CUS)
         
         Returns:
-            # [removed corrupted text]
+            Словарь с id, source_id, layer, позицией и размером элемента или None
         """
         cursor = self.conn.cursor()
         
+        conditions = ["element_name = ?"]
+        params = [element_name]
         if element_type:
-            cursor.execute("""
-                SELECT id, element_type, element_name, file_position, size, method_count
-                FROM elements
-                WHERE element_name = ? AND element_type = ?
-            """, (element_name, element_type))
-        else:
-            cursor.execute("""
-                SELECT id, element_type, element_name, file_position, size, method_count
-                FROM elements
-                WHERE element_name = ?
-                LIMIT 1
-            """, (element_name,))
+            conditions.append("element_type = ?")
+            params.append(element_type)
+        
+        elements_from = self._elements_from
+        if layer and self._sources is not None:
+            elements_from = "(SELECT e.*, s.layer FROM elements e JOIN sources s ON s.id = e.source_id)"
+            conditions.append("layer = ?")
+            params.append(layer)
+        
+        cursor.execute(f"""
+            SELECT *
+            FROM {elements_from}
+            WHERE {' AND '.join(conditions)}
+            LIMIT 1
+        """, params)
         
         row = cursor.fetchone()
         if row:
             return dict(row)
         return None
     
+    def get_element_layers(self, element_name: str, element_type: Optional[str] = None) -> List[Dict]:
+        """Возвращает версии элемента во всех слоях одним запросом
+        
+        Returns:
+            Список {'element_type', 'layer', 'source_path', 'method_count',
+            'effective'} в порядке приоритета слоёв (действующая версия последней)
+        """
+        if self._sources is None:
+            element = self.find_element(element_name, element_type)
+            if not element:
+                return []
+            return [{'element_type': element['element_type'], 'layer': None,
+                     'source_path': str(self.xpo_file_path), 'method_count': element['method_count'],
+                     'effective': True}]
+        
+        conditions = ["e.element_name = ?"]
+        params = [element_name]
+        if element_type:
+            conditions.append("e.element_type = ?")
+            params.append(element_type)
+        
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            SELECT e.element_type, s.layer, s.path AS source_path, e.method_count,
+                   e.id IN (SELECT id FROM effective_elements
+                            WHERE element_name = e.element_name AND element_type = e.element_type) AS effective
+            FROM elements e
+            JOIN sources s ON s.id = e.source_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY e.element_type, s.priority
+        """, params)
+        return [dict(row, effective=bool(row['effective'])) for row in cursor.fetchall()]
+    
+    def suggest_elements(self, query: str, element_type: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """Подсказывает имена элементов по неточному запросу
+        
+        Ищет точное совпадение и префикс (RabbitIntEng), CamelCase-горбы
+        (RIEIIS или RabIntEng для RabbitIntEngineImp_Infor_Shipped) и
+        имена с опечатками (RabitIntEngine) по триграммам. Кандидатов дают
+        индексы element_names и name_trigrams, без просмотра всех элементов.
+        
+        Args:
+            query: Часть имени, аббревиатура или имя с опечаткой
+            element_type: Тип элемента для фильтрации или None
+            limit: Максимальное количество подсказок
+        
+        Returns:
+            Список {'element_name', 'element_type', 'match', 'score'} по
+            убыванию релевантности; match — exact/prefix/humps/fuzzy
+        """
+        query = query.strip()
+        if not query:
+            return []
+        
+        words = split_name_words(query)
+        if query.isalpha() and query.isupper():
+            # Аббревиатура: каждая буква — начало слова
+            words = list(query)
+        trigrams = name_trigrams(query) if len(query) >= 3 else set()
+        
+        ranked = {}
+        
+        def classify(candidates):
+            for name in candidates:
+                if name not in ranked:
+                    match = self._classify_name(query, words, trigrams, name)
+                    if match:
+                        ranked[name] = match
+        
+        try:
+            classify(self._name_candidates(query, words))
+            # Нечёткие совпадения идут последними: если подсказок уже
+            # хватает (и фильтр по типу их не сократит), триграммы не нужны
+            if trigrams and (element_type or len(ranked) < limit):
+                classify(self._fuzzy_candidates(trigrams))
+        except sqlite3.OperationalError:
+            # Индекс построен старой версией индексатора без element_names
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT DISTINCT element_name FROM elements")
+            classify(row[0] for row in cursor.fetchall())
+        if not ranked:
+            return []
+        
+        cursor = self.conn.cursor()
+        conditions = [f"element_name IN ({', '.join('?' * len(ranked))})"]
+        params = list(ranked)
+        if element_type:
+            conditions.append("element_type = ?")
+            params.append(element_type)
+        cursor.execute(f"""
+            SELECT element_name, element_type FROM {self._elements_from}
+            WHERE {' AND '.join(conditions)}
+        """, params)
+        
+        results = [{'element_name': name, 'element_type': found_type,
+                    'match': ranked[name][0], 'score': round(ranked[name][1], 3)}
+                   for name, found_type in cursor.fetchall()]
+        results.sort(key=lambda row: (SUGGEST_MATCH_ORDER[row['match']], -row['score'],
+                                      len(row['element_name']), row['element_name'].lower(),
+                                      row['element_type']))
+        return results[:limit]
+    
+    def _name_candidates(self, query: str, words: List[str]) -> set:
+        """Собирает кандидатов из element_names по префиксу и CamelCase-горбам"""
+        cursor = self.conn.cursor()
+        candidates = set()
+        
+        # Префикс: диапазон по индексу name (COLLATE NOCASE)
+        lower = query.lower()
+        cursor.execute("""
+            SELECT name FROM element_names WHERE name >= ? AND name < ? LIMIT ?
+        """, (lower, lower[:-1] + chr(ord(lower[-1]) + 1), SUGGEST_CANDIDATES))
+        candidates.update(row[0] for row in cursor.fetchall())
+        
+        if len(words) >= 2:
+            # Горбы по индексу humps, имя начинается с первого слова запроса
+            humps = ''.join(word[0] for word in words).upper()
+            first = words[0].lower()
+            cursor.execute("""
+                SELECT name FROM element_names
+                WHERE humps >= ? AND humps < ? AND name >= ? AND name < ?
+                LIMIT ?
+            """, (humps, humps[:-1] + chr(ord(humps[-1]) + 1),
+                  first, first[:-1] + chr(ord(first[-1]) + 1), SUGGEST_CANDIDATES))
+            candidates.update(row[0] for row in cursor.fetchall())
+        
+        return candidates
+    
+    def _fuzzy_candidates(self, trigrams: set) -> List[str]:
+        """Собирает кандидатов с опечатками по name_trigrams
+        
+        Имя с долей общих триграмм не меньше FUZZY_MIN_SCORE обязательно
+        содержит одну из (n - m + 1) самых редких триграмм запроса, поэтому
+        читаются только их списки, а частые ("ine", "  s") пропускаются.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            SELECT trigram, COUNT(*) FROM name_trigrams
+            WHERE trigram IN ({', '.join('?' * len(trigrams))})
+            GROUP BY trigram
+        """, list(trigrams))
+        frequency = dict(cursor.fetchall())
+        
+        min_common = int(len(trigrams) * FUZZY_MIN_SCORE + 0.999)
+        rare = sorted(trigrams, key=lambda trigram: frequency.get(trigram, 0))[:len(trigrams) - min_common + 1]
+        rare = [trigram for trigram in rare if trigram in frequency]
+        if not rare:
+            return []
+        
+        cursor.execute(f"""
+            SELECT n.name
+            FROM (
+                SELECT name_id, COUNT(*) AS common FROM name_trigrams
+                WHERE trigram IN ({', '.join('?' * len(rare))})
+                GROUP BY name_id
+                ORDER BY common DESC
+                LIMIT ?
+            ) c
+            JOIN element_names n ON n.id = c.name_id
+        """, [*rare, SUGGEST_CANDIDATES])
+        return [row[0] for row in cursor.fetchall()]
+    
+    @staticmethod
+    def _classify_name(query: str, words: List[str], trigrams: set, name: str) -> Optional[Tuple[str, float]]:
+        """Определяет вид совпадения имени с запросом и его оценку от 0 до 1"""
+        lower_name = name.lower()
+        lower_query = query.lower()
+        if lower_name == lower_query:
+            return 'exact', 1.0
+        if lower_name.startswith(lower_query):
+            return 'prefix', len(query) / len(name)
+        
+        if len(words) >= 2:
+            name_words = split_name_words(name)
+            if len(name_words) >= len(words) and all(
+                    name_word.lower().startswith(word.lower()) for word, name_word in zip(words, name_words)):
+                return 'humps', len(words) / len(name_words)
+        
+        if trigrams:
+            score = len(trigrams & name_trigrams(name)) / len(trigrams)
+            if score >= FUZZY_MIN_SCORE:
+                return 'fuzzy', score
+        return None
+    
     def get_element_methods(self, element_id: int) -> List[str]:
         """Получает список методов элемента
         
@@ -74,7 +356,7 @@ class XPOReader:
         """
         cursor = self.conn.cursor()
         cursor.execute("""
-            SELECT method_name
+            SELECT DISTINCT method_name
             FROM methods
             WHERE element_id = ?
             ORDER BY method_name
@@ -82,76 +364,220 @@ class XPOReader:
         
         return [row[0] for row in cursor.fetchall()]
     
-    def _read_xpo_segment(self, start_pos: int, size: int) -> str:
+    def has_blobs(self) -> bool:
+        """Проверяет, что индекс хранит сжатый текст элементов (построен с --blobs)"""
+        try:
+            row = self.conn.execute("SELECT 1 FROM element_blobs LIMIT 1").fetchone()
+        except sqlite3.OperationalError:
+            # Индекс построен старой версией индексатора без element_blobs
+            return False
+        return row is not None
+    
+    def _read_element_blob(self, element_id: int) -> Optional[Tuple[int, bytes]]:
+        """Распаковывает текст элемента из element_blobs
+        
+        Последний распакованный элемент кэшируется: за кодом элемента
+        обычно следуют запросы кода его методов.
+        
+        Returns:
+            (байтовая позиция элемента в XPO, байты элемента) или None,
+            если индекс построен без --blobs
+        """
+        if self._blob_cache and self._blob_cache[0] == element_id:
+            return self._blob_cache[1:]
+        
+        try:
+            row = self.conn.execute("""
+                SELECT e.file_position, b.codec, b.data
+                FROM element_blobs b
+                JOIN elements e ON e.id = b.element_id
+                WHERE b.element_id = ?
+            """, (element_id,)).fetchone()
+        except sqlite3.OperationalError:
+            # Индекс построен старой версией индексатора без element_blobs
+            return None
+        if row is None:
+            return None
+        
+        data = BLOB_DECOMPRESSORS[row['codec']](row['data'])
+        self._blob_cache = (element_id, row['file_position'], data)
+        return row['file_position'], data
+    
+    def _read_xpo_segment(self, start_pos: int, size: int, element_id: Optional[int] = None,
+                          source_id: Optional[int] = None) -> str:
         """Читает сегмент из XPO файла
         
+        Если индекс хранит сжатый текст элемента element_id, сегмент
+        берётся из него и XPO файл не нужен.
+        
         Args:
-            start_pos: Начальная позиция
-            # [removed corrupted text]
+            start_pos: Байтовое смещение начала сегмента
+            size: Длина сегмента в байтах
+            element_id: Элемент, внутри которого лежит сегмент
+            source_id: Источник (XPO файл) элемента; None — основной
         
         Returns:
-            # [removed corrupted text]
+            Декодированный текст сегмента
         """
-        with open(self.xpo_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            f.seek(start_pos)
-            return f.read(size)
+        if element_id is not None:
+            blob = self._read_element_blob(element_id)
+            if blob:
+                element_position, data = blob
+                offset = start_pos - element_position
+                return decode_xpo_bytes(data[offset:offset + size])
+        
+        self._ensure_index_fresh(source_id)
+        with open(self._source_path(source_id), 'rb') as f:
+            if hasattr(os, 'pread'):
+                data = os.pread(f.fileno(), size, start_pos)
+            else:
+                # На Windows os.pread недоступен
+                f.seek(start_pos)
+                data = f.read(size)
+        return decode_xpo_bytes(data)
     
-    def get_element_code(self, element_name: str, element_type: Optional[str] = None) -> Optional[Dict]:
+    def get_element_code(self, element_name: str, element_type: Optional[str] = None,
+                         layer: Optional[str] = None) -> Optional[Dict]:
         """Получает полный код элемента из XPO файла
         
         Args:
             element_name: Имя элемента
             element_type: Тип элемента (CLS/TAB/FRM) или None
+            layer: Слой или None — действующая версия
         
         Returns:
-            # [removed corrupted text]
+            Словарь type, name, layer, properties и methods или None
         """
-        element_info = self.find_element(element_name, element_type)
+        element_info = self.find_element(element_name, element_type, layer)
         if not element_info:
             return None
         
         # Читаем содержимое элемента из XPO
         element_content = self._read_xpo_segment(
             element_info['file_position'],
-            element_info['size']
+            element_info['size'],
+            element_info['id'],
+            element_info.get('source_id')
         )
         
         # Парсим элемент с использованием утилит
         return {
             'type': element_info['element_type'],
             'name': element_info['element_name'],
+            'layer': element_info.get('layer'),
             'properties': extract_properties(element_content),
             'methods': extract_methods(element_content)
         }
         
-    def get_method_code(self, element_name: str, method_name: str, element_type: Optional[str] = None) -> Optional[str]:
+    def _find_method_span(self, element_id: int, method_name: str) -> Optional[Dict]:
+        """Находит байтовый диапазон тела метода в индексе
+        
+        Метод самого элемента предпочитается одноимённым методам источников
+        данных и контролов формы.
+        
+        Returns:
+            Словарь с file_position и size или None (старый индекс без позиций)
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT file_position, size
+                FROM methods
+                WHERE element_id = ? AND method_name = ? AND file_position IS NOT NULL
+                ORDER BY path = method_name DESC, file_position
+                LIMIT 1
+            """, (element_id, method_name))
+        except sqlite3.OperationalError:
+            return None
+        
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    def get_method_code(self, element_name: str, method_name: str, element_type: Optional[str] = None,
+                        layer: Optional[str] = None) -> Optional[str]:
         """Получает код конкретного метода элемента
         
         Args:
             element_name: Имя элемента
             method_name: Имя метода
             element_type: Тип элемента (CLS/TAB/FRM) или None
+            layer: Слой или None — действующая версия
         
         Returns:
             Код метода или None
         """
-        element_data = self.get_element_code(element_name, element_type)
+        element_info = self.find_element(element_name, element_type, layer)
+        if not element_info:
+            return None
+        
+        method_span = self._find_method_span(element_info['id'], method_name)
+        if method_span:
+            # Читаем только тело метода по байтовому смещению из индекса
+            method_body = self._read_xpo_segment(method_span['file_position'], method_span['size'],
+                                                 element_info['id'], element_info.get('source_id'))
+            return clean_xpo_code(method_body)
+        
+        element_data = self.get_element_code(element_name, element_type, layer)
         if not element_data:
             return None
         
         return element_data['methods'].get(method_name)
     
+    def _search_method_bodies(self, query: str, element_type: Optional[str], limit: int) -> Optional[List[Dict]]:
+        """Ищет подстроку в телах методов через methods_fts
+        
+        Returns:
+            Список совпадений (элемент + метод) или None, если в индексе нет
+            methods_fts или запрос короче триграммы
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='methods_fts'")
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        if 'trigram' in row[0] and len(query) < 3:
+            return None
+        
+        # Запрос целиком — одна фраза, чтобы искать подстроку, а не синтаксис FTS5
+        phrase = '"' + query.replace('"', '""') + '"'
+        sql = f"""
+            SELECT e.id, e.element_type, e.element_name, e.file_position, e.size,
+                   m.method_name, m.path
+            FROM methods_fts fts
+            JOIN methods m ON m.id = fts.rowid
+            JOIN {self._elements_from} e ON e.id = m.element_id
+            WHERE methods_fts MATCH ?
+        """
+        params = [phrase]
+        if element_type:
+            sql += " AND e.element_type = ?"
+            params.append(element_type)
+        sql += " ORDER BY e.element_type, e.element_name, m.file_position LIMIT ?"
+        params.append(limit)
+        
+        cursor.execute(sql, params)
+        return [dict(row) for row in cursor.fetchall()]
+    
     def fulltext_search(self, query: str, element_type: Optional[str] = None, limit: int = 50) -> List[Dict]:
         """Выполняет полнотекстовый поиск по коду
         
+        Сначала ищет подстроку в телах методов (methods_fts); если там
+        ничего не найдено, а также для старых индексов и коротких запросов —
+        по именам элементов и методов.
+        
         Args:
             query: Текст для поиска
             element_type: Тип элемента для фильтрации или None
             limit: Максимальное количество результатов
         
         Returns:
-            # [removed corrupted text]
+            Список найденных элементов; при поиске по телам у каждого
+            совпадения есть method_name и path метода
         """
+        method_results = self._search_method_bodies(query, element_type, limit)
+        if method_results:
+            return method_results
+        
         cursor = self.conn.cursor()
         
         # Проверяем наличие FTS5
@@ -161,18 +587,18 @@ class XPOReader:
         if has_fts5:
             # Используем FTS5 для поиска
             if element_type:
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT e.id, e.element_type, e.element_name, e.file_position, e.size
                     FROM elements_fts fts
-                    JOIN elements e ON e.id = fts.rowid
+                    JOIN {self._elements_from} e ON e.id = fts.rowid
                     WHERE elements_fts MATCH ? AND e.element_type = ?
                     LIMIT ?
                 """, (query, element_type, limit))
             else:
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT e.id, e.element_type, e.element_name, e.file_position, e.size
                     FROM elements_fts fts
-                    JOIN elements e ON e.id = fts.rowid
+                    JOIN {self._elements_from} e ON e.id = fts.rowid
                     WHERE elements_fts MATCH ?
                     LIMIT ?
                 """, (query, limit))
@@ -200,26 +626,466 @@ class XPOReader:
         
         return results
     
+    def find_references(self, target_element: Optional[str], target_method: Optional[str] = None,
+                        kind: Optional[str] = None, limit: int = 200) -> List[Dict]:
+        """Ищет ссылки на элемент (и его метод) по таблице xrefs
+        
+        Args:
+            target_element: Имя целевого элемента (без учета регистра) или None,
+                чтобы искать вызовы метода target_method у любых объектов
+            target_method: Имя целевого метода или None
+            kind: Вид ссылки (new/static/call/tablenum/classnum/extends) или None
+            limit: Максимальное количество результатов
+        
+        Returns:
+            Список ссылок: элемент и метод-источник, вид, цель и байтовое смещение
+        """
+        conditions = []
+        params = []
+        if target_element:
+            conditions.append("x.target_element = ?")
+            params.append(target_element)
+        if target_method:
+            conditions.append("x.target_method = ?")
+            params.append(target_method)
+        if kind:
+            conditions.append("x.kind = ?")
+            params.append(kind)
+        if not conditions:
+            return []
+        params.append(limit)
+        
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT e.element_type, e.element_name, e.layer, m.method_name, m.path,
+                       x.kind, x.target_element, x.target_method, x.file_position
+                FROM xrefs x
+                JOIN {self._elements_from} e ON e.id = x.element_id
+                LEFT JOIN methods m ON m.id = x.method_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY e.element_type, e.element_name, x.file_position
+                LIMIT ?
+            """, params)
+        except sqlite3.OperationalError:
+            # Индекс построен старой версией индексатора без xrefs
+            return []
+        
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def find_field_usage(self, table_name: Optional[str], field_name: str, kind: Optional[str] = None,
+                         include_unresolved: bool = False, limit: int = 500) -> List[Dict]:
+        """Ищет чтение, запись и fieldNum/fieldStr поля таблицы по таблице field_refs
+        
+        Args:
+            table_name: Имя таблицы (без учета регистра) или None — поле любой таблицы
+            field_name: Имя поля (без учета регистра)
+            kind: Вид обращения (read/write/fieldnum/fieldstr) или None
+            include_unresolved: Добавить обращения buffer.Field, у которых тип
+                buffer не удалось определить (table_name = None)
+            limit: Максимальное количество результатов
+        
+        Returns:
+            Список обращений: элемент, слой, метод, таблица, поле, вид и байтовое смещение
+        """
+        conditions = ["f.field_name = ?"]
+        params = [field_name]
+        if table_name:
+            conditions.append("(f.table_name = ? OR f.table_name IS NULL)" if include_unresolved
+                              else "f.table_name = ?")
+            params.append(table_name)
+        if kind:
+            conditions.append("f.kind = ?")
+            params.append(kind)
+        params.append(limit)
+        
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT e.element_type, e.element_name, e.layer, m.method_name, m.path,
+                       f.table_name, f.field_name, f.kind, f.file_position
+                FROM field_refs f
+                JOIN {self._elements_from} e ON e.id = f.element_id
+                LEFT JOIN methods m ON m.id = f.method_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY e.element_type, e.element_name, f.file_position
+                LIMIT ?
+            """, params)
+        except sqlite3.OperationalError:
+            # Индекс построен старой версией индексатора без field_refs
+            return []
+        
+        return [dict(row) for row in cursor.fetchall()]
+    
+    # Области видимости определений макроса в порядке приоритета (scope_rank)
+    MACRO_SCOPES = ('method', 'element', 'ancestor', 'included_library', 'library', 'other')
+    
+    def resolve_macro(self, macro_name: str, element_name: Optional[str] = None,
+                      element_type: Optional[str] = None, method_name: Optional[str] = None,
+                      limit: int = 50) -> List[Dict]:
+        """Раскрывает ссылку #Имя в определения одним запросом к macro_defs
+        
+        Определения упорядочены по области видимости относительно места
+        использования (element_name/method_name): сам метод, classDeclaration
+        элемента, classDeclaration предков (class_hierarchy), MCR-библиотеки,
+        подключенные в элементе (#Библиотека), — и сама библиотека, и
+        определения в ней, — прочие библиотеки с этим именем и остальные
+        определения. Первое — то, что применит компилятор.
+        
+        Args:
+            macro_name: Имя макроса без '#' (без учета регистра)
+            element_name: Элемент, где встречена ссылка, или None
+            element_type: Тип этого элемента или None
+            method_name: Метод, где встречена ссылка, или None
+            limit: Максимальное количество результатов
+        
+        Returns:
+            Список определений: macro_name, kind (define/localmacro/library),
+            value, элемент, слой, метод, байтовое смещение и scope
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"""
+                WITH ctx AS (
+                    SELECT id, element_name FROM {self._elements_from}
+                    WHERE element_name = :element_name
+                      AND (:element_type IS NULL OR element_type = :element_type)
+                    LIMIT 1
+                ), ctx_methods AS (
+                    SELECT m.id FROM methods m JOIN ctx ON m.element_id = ctx.id
+                    WHERE m.method_name = :method_name
+                )
+                SELECT d.macro_name, d.kind, d.value, d.file_position,
+                       e.element_type, e.element_name, e.layer, m.method_name, m.path,
+                       CASE
+                           WHEN d.method_id IN (SELECT id FROM ctx_methods) THEN 0
+                           WHEN d.element_id IN (SELECT id FROM ctx)
+                                AND m.method_name = 'classDeclaration' THEN 1
+                           WHEN e.element_type = 'CLS' AND m.method_name = 'classDeclaration'
+                                AND e.element_name COLLATE NOCASE IN (
+                                    SELECT h.ancestor FROM class_hierarchy h
+                                    JOIN ctx ON h.descendant = ctx.element_name) THEN 2
+                           WHEN e.element_type = 'MCR'
+                                AND e.element_name COLLATE NOCASE IN (
+                                    SELECT r.macro_name FROM macro_refs r
+                                    JOIN ctx ON r.element_id = ctx.id) THEN 3
+                           WHEN d.kind = 'library' THEN 4
+                           ELSE 5
+                       END AS scope_rank
+                FROM macro_defs d
+                JOIN {self._elements_from} e ON e.id = d.element_id
+                LEFT JOIN methods m ON m.id = d.method_id
+                WHERE d.macro_name = :macro_name
+                ORDER BY scope_rank, e.element_type, e.element_name, d.file_position
+                LIMIT :limit
+            """, {'macro_name': macro_name, 'element_name': element_name, 'element_type': element_type,
+                  'method_name': method_name, 'limit': limit})
+        except sqlite3.OperationalError:
+            # Индекс построен старой версией индексатора без macro_defs
+            return []
+        
+        results = []
+        for row in cursor.fetchall():
+            result = dict(row)
+            result['scope'] = self.MACRO_SCOPES[result.pop('scope_rank')]
+            results.append(result)
+        return results
+    
+    def find_macro_usage(self, macro_name: str, limit: int = 500) -> List[Dict]:
+        """Ищет использования макроса (#Имя, в том числе подключения MCR) по таблице macro_refs
+        
+        Returns:
+            Список использований: элемент, слой, метод и байтовое смещение
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT e.element_type, e.element_name, e.layer, m.method_name, m.path,
+                       r.macro_name, r.file_position
+                FROM macro_refs r
+                JOIN {self._elements_from} e ON e.id = r.element_id
+                LEFT JOIN methods m ON m.id = r.method_id
+                WHERE r.macro_name = ?
+                ORDER BY e.element_type, e.element_name, r.file_position
+                LIMIT ?
+            """, (macro_name, limit))
+        except sqlite3.OperationalError:
+            # Индекс построен старой версией индексатора без macro_refs
+            return []
+        
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def find_methods_by_signature(self, method_name: Optional[str] = None, return_type: Optional[str] = None,
+                                  param_type: Optional[str] = None, modifier: Optional[str] = None,
+                                  element_type: Optional[str] = None, limit: int = 200) -> List[Dict]:
+        """Ищет методы по объявлению (таблицы methods и method_params)
+        
+        Условия объединяются через AND; нужно хотя бы одно кроме element_type.
+        С одним method_name это список всех реализаций метода с их
+        сигнатурами — для сверки переопределений.
+        
+        Args:
+            method_name: Имя метода
+            return_type: Тип результата (без учета регистра), например 'container'
+            param_type: Тип любого из параметров, например 'SalesTable'
+            modifier: Модификатор (static, server, display...)
+            element_type: Тип элемента (CLS/TAB/FRM...)
+            limit: Максимальное количество результатов
+        
+        Returns:
+            Список методов: элемент, слой, путь, modifiers, return_type и
+            parameters (param_name, param_type, default_value по порядку)
+        """
+        conditions = []
+        params = []
+        if method_name:
+            conditions.append("m.method_name = ?")
+            params.append(method_name)
+        if return_type:
+            conditions.append("m.return_type = ?")
+            params.append(return_type)
+        if param_type:
+            conditions.append("m.id IN (SELECT method_id FROM method_params WHERE param_type = ?)")
+            params.append(param_type)
+        if modifier:
+            conditions.append("' ' || m.modifiers || ' ' LIKE ?")
+            params.append(f"% {modifier.lower()} %")
+        if not conditions:
+            return []
+        if element_type:
+            conditions.append("e.element_type = ?")
+            params.append(element_type)
+        params.append(limit)
+        
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT m.id, e.element_type, e.element_name, e.layer, m.method_name, m.path,
+                       m.modifiers, m.return_type, m.param_count
+                FROM methods m
+                JOIN {self._elements_from} e ON e.id = m.element_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY e.element_type, e.element_name, m.file_position
+                LIMIT ?
+            """, params)
+            results = [dict(row) for row in cursor.fetchall()]
+            
+            by_id = {result['id']: result for result in results}
+            for result in results:
+                result['parameters'] = []
+            cursor.execute(f"""
+                SELECT method_id, param_name, param_type, default_value FROM method_params
+                WHERE method_id IN ({','.join('?' * len(by_id))})
+                ORDER BY method_id, position
+            """, list(by_id))
+            for row in cursor.fetchall():
+                by_id[row['method_id']]['parameters'].append(
+                    {'param_name': row['param_name'], 'param_type': row['param_type'],
+                     'default_value': row['default_value']})
+        except sqlite3.OperationalError:
+            # Индекс построен старой версией индексатора без сигнатур
+            return []
+        
+        return results
+    
+    def get_table_schema(self, table_name: str, layer: Optional[str] = None) -> Optional[Dict]:
+        """Возвращает структуру таблицы: свойства, поля, индексы и связи
+        
+        Args:
+            table_name: Имя таблицы
+            layer: Слой или None — действующая версия
+        
+        Returns:
+            Словарь name, layer, properties ({свойство: значение}), fields
+            (field_name, field_type, edt, enum_type, label), indexes
+            (index_name, is_unique, is_clustered, is_primary, enabled, fields
+            в порядке индекса) и relations (relation_name, related_table,
+            links: link_type, field_name, related_field, value) или None
+        """
+        element = self.find_element(table_name, 'TAB', layer)
+        if not element:
+            return None
+        element_id = element['id']
+        
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("SELECT name, value FROM table_properties WHERE element_id = ?", (element_id,))
+        except sqlite3.OperationalError:
+            # Индекс построен старой версией индексатора: разбираем элемент из XPO
+            content = self._read_xpo_segment(element['file_position'], element['size'], element_id,
+                                             element.get('source_id'))
+            return self._table_schema_from_xpo(element, parse_table_schema(content))
+        properties = {row['name']: row['value'] for row in cursor.fetchall()}
+        
+        cursor.execute("""
+            SELECT field_name, field_type, edt, enum_type, label FROM table_fields
+            WHERE element_id = ? ORDER BY position
+        """, (element_id,))
+        fields = [dict(row) for row in cursor.fetchall()]
+        
+        cursor.execute("""
+            SELECT i.id, i.index_name, i.is_unique, i.is_clustered, i.is_primary, i.enabled, f.field_name
+            FROM table_indexes i
+            LEFT JOIN table_index_fields f ON f.index_id = i.id
+            WHERE i.element_id = ?
+            ORDER BY i.id, f.position
+        """, (element_id,))
+        indexes = {}
+        for row in cursor.fetchall():
+            index = indexes.setdefault(row['id'], {
+                'index_name': row['index_name'], 'is_unique': bool(row['is_unique']),
+                'is_clustered': bool(row['is_clustered']), 'is_primary': bool(row['is_primary']),
+                'enabled': bool(row['enabled']), 'fields': []})
+            if row['field_name']:
+                index['fields'].append(row['field_name'])
+        
+        cursor.execute("""
+            SELECT r.id, r.relation_name, r.related_table, f.link_type, f.field_name, f.related_field, f.value
+            FROM table_relations r
+            LEFT JOIN table_relation_fields f ON f.relation_id = r.id
+            WHERE r.element_id = ?
+            ORDER BY r.id, f.position
+        """, (element_id,))
+        relations = {}
+        for row in cursor.fetchall():
+            relation = relations.setdefault(row['id'], {
+                'relation_name': row['relation_name'], 'related_table': row['related_table'], 'links': []})
+            if row['link_type']:
+                relation['links'].append({'link_type': row['link_type'], 'field_name': row['field_name'],
+                                          'related_field': row['related_field'], 'value': row['value']})
+        
+        return {'name': element['element_name'], 'layer': element.get('layer'), 'properties': properties,
+                'fields': fields, 'indexes': list(indexes.values()), 'relations': list(relations.values())}
+    
+    @staticmethod
+    def _table_schema_from_xpo(element: Dict, schema: Dict) -> Dict:
+        """Приводит результат parse_table_schema к виду get_table_schema"""
+        properties = schema['properties']
+        cluster_index = properties.get('ClusterIndex', '').lower()
+        primary_index = properties.get('PrimaryIndex', '').lower()
+        return {
+            'name': element['element_name'],
+            'layer': element.get('layer'),
+            'properties': properties,
+            'fields': [{'field_name': field['name'], 'field_type': field['field_type'],
+                        'edt': field['properties'].get('ExtendedDataType') or None,
+                        'enum_type': field['properties'].get('EnumType') or None,
+                        'label': field['properties'].get('Label') or None}
+                       for field in schema['fields']],
+            'indexes': [{'index_name': index['name'],
+                         'is_unique': index['properties'].get('AllowDuplicates', 'Yes') == 'No',
+                         'is_clustered': index['name'].lower() == cluster_index,
+                         'is_primary': index['name'].lower() == primary_index,
+                         'enabled': index['properties'].get('Enabled', 'Yes') != 'No',
+                         'fields': index['fields']}
+                        for index in schema['indexes']],
+            'relations': [{'relation_name': relation['name'],
+                           'related_table': relation['properties'].get('Table') or None,
+                           'links': [{'link_type': link['type'],
+                                      'field_name': link['properties'].get('Field') or None,
+                                      'related_field': link['properties'].get('RelatedField') or None,
+                                      'value': link['properties'].get('Value') or None}
+                                     for link in relation['links']]}
+                          for relation in schema['relations']],
+        }
+    
+    def get_ancestors(self, class_name: str) -> List[str]:
+        """Возвращает цепочку предков класса по таблице class_hierarchy
+        
+        Args:
+            class_name: Имя класса (без учета регистра)
+        
+        Returns:
+            Имена предков от прямого родителя к корню
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT ancestor FROM class_hierarchy
+                WHERE descendant = ?
+                ORDER BY depth
+            """, (class_name,))
+        except sqlite3.OperationalError:
+            # Индекс построен старой версией индексатора без class_hierarchy
+            return []
+        
+        return [row['ancestor'] for row in cursor.fetchall()]
+    
+    def get_descendants(self, class_name: str, max_depth: Optional[int] = None) -> List[Dict]:
+        """Возвращает всех наследников класса по таблице class_hierarchy
+        
+        Args:
+            class_name: Имя класса (без учета регистра), может быть системным
+            max_depth: Максимальная глубина (1 — только прямые наследники)
+        
+        Returns:
+            Список {'class_name', 'depth'}, отсортированный по глубине и имени
+        """
+        condition = "ancestor = ?"
+        params = [class_name]
+        if max_depth is not None:
+            condition += " AND depth <= ?"
+            params.append(max_depth)
+        
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT descendant, depth FROM class_hierarchy
+                WHERE {condition}
+                ORDER BY depth, descendant
+            """, params)
+        except sqlite3.OperationalError:
+            return []
+        
+        return [{'class_name': row['descendant'], 'depth': row['depth']} for row in cursor.fetchall()]
+    
     def find_label_usage(self, label_id: str) -> List[Dict]:
         """Ищет все места использования метки в коде
         
+        Использует таблицу labels индекса; для индексов, построенных
+        старой версией индексатора, просматривает XPO файл.
+        
         Args:
-            label_id: ID метки (например, "MIK4140" или "4140")
+            label_id: ID метки (например, "MIK4140", "@SYS12345" или "4140")
         
         Returns:
-            # [removed corrupted text]
+            Список элементов: element_type, element_name и методы, где встречается метка
         """
-        # Нормализуем ID метки
-        if not label_id.startswith('MIK'):
-            label_id = f"MIK{label_id}"
+        label_id = normalize_label_id(label_id)
+        
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT e.element_type, e.element_name, m.method_name
+                FROM labels l
+                JOIN {self._elements_from} e ON e.id = l.element_id
+                LEFT JOIN methods m ON m.id = l.method_id
+                WHERE l.label_id = ?
+                ORDER BY e.element_type, e.element_name, l.file_position
+            """, (label_id,))
+        except sqlite3.OperationalError:
+            # Индекс построен старой версией индексатора без labels
+            return self._scan_label_usage(label_id)
         
-        label_pattern = f"@MIK{label_id[3:]}"  # Убираем MIK из начала
-        label_pattern2 = f"Label #@MIK{label_id[3:]}"
+        results = {}
+        for row in cursor.fetchall():
+            key = (row['element_type'], row['element_name'])
+            result = results.setdefault(key, {
+                'element_type': row['element_type'],
+                'element_name': row['element_name'],
+                'methods': []
+            })
+            if row['method_name'] and row['method_name'] not in result['methods']:
+                result['methods'].append(row['method_name'])
+        
+        return list(results.values())
+    
+    def _scan_label_usage(self, label_id: str) -> List[Dict]:
+        """Ищет метку полным просмотром XPO файла (для индексов без labels)"""
+        label_pattern = f"@{label_id}"
         
         results = []
         
-        # Читаем весь XPO файл для поиска (это может быть медленно для больших файлов)
-        # В реальности лучше было бы создать индекс меток, но для MVP используем простой поиск
         with open(self.xpo_file_path, 'r', encoding='utf-8', errors='ignore') as f:
             content = f.read()
         
@@ -234,7 +1100,7 @@ class XPOReader:
             element_content = content[start_pos:end_pos]
             
             # Ищем метку в содержимом элемента
-            if label_pattern in element_content or label_pattern2 in element_content:
+            if label_pattern in element_content:
                 # Извлекаем имя элемента
                 element_name = None
                 if element_type == 'CLS':
@@ -257,7 +1123,7 @@ class XPOReader:
                     for method_match in re.finditer(source_pattern, element_content, re.DOTALL):
                         method_name = method_match.group(1)
                         method_code = method_match.group(2)
-                        if label_pattern in method_code or label_pattern2 in method_code:
+                        if label_pattern in method_code:
                             methods_with_label.append(method_name)
                     
                     results.append({
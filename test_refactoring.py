@@ -9,6 +9,124 @@ from pathlib import Path
 # Добавляем корень проекта в путь
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "indexXPO_cus"))
+
+# Общие заготовки XPO для тестов: переводы строк CRLF, как в экспорте AX
+XPO_HEADER = "Exportfile for AOT version 1.0 or later\r\n"
+XPO_FOOTER = "***Element: END\r\n"
+
+
+def make_class(name, body, method="run"):
+    """Возвращает текст элемента CLS с одним методом"""
+    return ("***Element: CLS\r\n"
+            f"  CLASS #{name}\r\n"
+            "    METHODS\r\n"
+            f"      SOURCE #{method}\r\n"
+            f"        #void {method}() {{ {body} }}\r\n"
+            "      ENDSOURCE\r\n"
+            "    ENDMETHODS\r\n"
+            "  ENDCLASS\r\n")
+
+
+def make_writer_project(xpo_file, parser_dir, classes):
+    """
+    Создает проектный XPO с классами {имя: тело run} и их каталоги в parserXPO
+    
+    XPP‑файлы и сам XPO датируются прошлым, чтобы writer считал изменёнными
+    только методы, переписанные тестом через edit_method.
+    """
+    import os
+    import time
+    
+    xpo_file = Path(xpo_file)
+    xpo_file.parent.mkdir(parents=True, exist_ok=True)
+    xpo_file.write_text(XPO_HEADER + "".join(make_class(name, body) for name, body in classes.items())
+                        + XPO_FOOTER, encoding='utf-8', newline='')
+    past = time.time() - 60
+    for name, body in classes.items():
+        element_dir = Path(parser_dir) / name
+        element_dir.mkdir(parents=True, exist_ok=True)
+        (element_dir / "properties.txt").write_text("Type: CLS\n", encoding='utf-8')
+        xpp_file = element_dir / "run.xpp"
+        xpp_file.write_text(f"void run() {{ {body} }}", encoding='utf-8')
+        os.utime(xpp_file, (past - 60, past - 60))
+    os.utime(xpo_file, (past, past))
+
+
+def edit_method(parser_dir, class_name, code):
+    """Сохраняет новый код метода run, как после правки в редакторе"""
+    (Path(parser_dir) / class_name / "run.xpp").write_text(code, encoding='utf-8')
+
+
+def write_xpo(xpo_file, elements):
+    """Записывает XPO: заголовок экспорта, текст элементов и ***Element: END"""
+    Path(xpo_file).write_text(XPO_HEADER + elements + XPO_FOOTER, encoding='utf-8', newline='')
+
+
+def index_xpo(xpo_file, db_file, update=False, **options):
+    """
+    Строит индекс XPO (update — обновляет инкрементально) и закрывает индексатор
+    
+    Returns:
+        Статистика update_index или None при полном построении
+    """
+    from xpo_indexer_sqlite import XPOSQLiteIndexer
+    
+    indexer = XPOSQLiteIndexer(str(xpo_file), str(db_file), **options)
+    try:
+        if update:
+            return indexer.update_index()
+        indexer.build_index()
+        return None
+    finally:
+        indexer.close()
+
+
+def make_subclass(name, parent):
+    """Возвращает текст элемента CLS, наследующего parent"""
+    return make_class(name, "").replace(
+        "    METHODS\r\n",
+        f"    PROPERTIES\r\n      Name #{name}\r\n      Extends #{parent}\r\n    ENDPROPERTIES\r\n    \r\n    METHODS\r\n")
+
+
+def make_table(name, index_fields, cache_lookup="Found"):
+    """
+    Возвращает текст элемента TAB: поля AccountNum/Name/Status, группа,
+    индексы [(имя, уникальный, [поля])], связь с CustGroup и метод find
+    """
+    fields = "".join(f"      FIELD #{field}\r\n        STRING\r\n        PROPERTIES\r\n"
+                     f"          Name                #{field}\r\n          ExtendedDataType    #{field}Edt\r\n"
+                     "        ENDPROPERTIES\r\n        \r\n" for field in ("AccountNum", "Name", "Status"))
+    indexes = "".join(f"      #{index_name}\r\n      PROPERTIES\r\n        Name                #{index_name}\r\n"
+                      f"        AllowDuplicates     #{'No' if unique else 'Yes'}\r\n      ENDPROPERTIES\r\n"
+                      "      \r\n      INDEXFIELDS\r\n"
+                      + "".join(f"        #{field}\r\n" for field in index_fields_list)
+                      + "      ENDINDEXFIELDS\r\n      \r\n"
+                      for index_name, unique, index_fields_list in index_fields)
+    return ("***Element: TAB\r\n"
+            f"  TABLE #{name}\r\n"
+            "    PROPERTIES\r\n"
+            f"      Name                #{name}\r\n"
+            f"      CacheLookup         #{cache_lookup}\r\n"
+            "      TableGroup          #Main\r\n"
+            f"      ClusterIndex        #{index_fields[0][0]}\r\n"
+            "    ENDPROPERTIES\r\n"
+            "    \r\n    FIELDS\r\n" + fields + "    ENDFIELDS\r\n"
+            "    \r\n    GROUPS\r\n      GROUP #AutoReport\r\n        GROUPFIELDS\r\n          #Name\r\n"
+            "        ENDGROUPFIELDS\r\n      ENDGROUP\r\n    ENDGROUPS\r\n"
+            "    \r\n    INDICES\r\n" + indexes + "    ENDINDICES\r\n"
+            "    REFERENCES\r\n      REFERENCE #CustGroup\r\n        PROPERTIES\r\n"
+            "          Name                #CustGroup\r\n          Table               #CustGroup\r\n"
+            "        ENDPROPERTIES\r\n        \r\n        FIELDREFERENCES\r\n          REFERENCETYPE NORMAL\r\n"
+            "          PROPERTIES\r\n            Field               #Name\r\n"
+            "            RelatedField        #CustGroup\r\n          ENDPROPERTIES\r\n"
+            "          \r\n          REFERENCETYPE THISFIXED\r\n          PROPERTIES\r\n"
+            "            Field               #Status\r\n            Value               #1\r\n"
+            "          ENDPROPERTIES\r\n          \r\n        ENDFIELDREFERENCES\r\n      ENDREFERENCE\r\n"
+            "    ENDREFERENCES\r\n"
+            "    \r\n    METHODS\r\n      SOURCE #find\r\n        #static void find() { }\r\n"
+            "      ENDSOURCE\r\n    ENDMETHODS\r\n  ENDTABLE\r\n")
+
 
 def test_utils():
     """Тестирует модуль utils"""
@@ -23,6 +141,15 @@ def test_utils():
         extract_methods,
         extract_properties,
         find_labels_in_text,
+        extract_label_references,
+        normalize_label_id,
+        extract_code_references,
+        extract_field_references,
+        extract_macros,
+        split_name_words,
+        name_humps,
+        parse_method_signature,
+        name_trigrams,
         ELEMENT_PATTERNS,
     )
     
@@ -50,6 +177,98 @@ def test_utils():
     assert '123' in labels and '456' in labels, "Метки не найдены"
     print(f"[find_labels_in_text] Найдено меток: {len(labels)}")
     
+    # Тест extract_label_references / normalize_label_id
+    references = extract_label_references('info("@MIK123"); error("@sys45"); // @KOR7')
+    assert references == [('MIK123', 6), ('SYS45', 24), ('KOR7', 37)], f"Неверные метки: {references}"
+    assert normalize_label_id("4140") == "MIK4140" and normalize_label_id("@gms12") == "GMS12"
+    print("[extract_label_references] Метки @MIK/@SYS/@GMS/@KOR найдены со смещениями")
+    
+    # Тест split_name_words / name_humps / name_trigrams
+    assert split_name_words("CustVendPDSManager_Tax1099") == ["Cust", "Vend", "PDS", "Manager", "Tax", "1099"]
+    assert name_humps("RabbitIntEngineImp_Infor_Shipped") == "RIEIIS"
+    assert name_trigrams("Abc") == {"  a", " ab", "abc", "bc "}
+    print("[name_humps] Слова CamelCase, горбы и триграммы имен")
+    
+    # Тест extract_code_references
+    method_code = """    #void run(CustTable _custTable)
+    #{
+    #    ClassB b = new ClassB();
+    #    b.process(); // c.ignored()
+    #    ClassB::construct();
+    #    info("x.ignored()");
+    #    _custTable.update();
+    #    print tableNum(CustTable), classNum(ClassB);
+    #}"""
+    references = [reference[:3] for reference in extract_code_references(method_code, 'ClassA')]
+    assert references == [
+        ('new', 'ClassB', 'new'),
+        ('call', 'ClassB', 'process'),
+        ('static', 'ClassB', 'construct'),
+        ('call', 'CustTable', 'update'),
+        ('tablenum', 'CustTable', None),
+        ('classnum', 'ClassB', None),
+    ], f"Неверные ссылки: {references}"
+    print("[extract_code_references] Ссылки найдены, комментарии и строки пропущены")
+    
+    # Тест extract_field_references
+    method_code = """    #void run(CustTable _custTable)
+    #{
+    #    salesTable.CustAccount = _custTable.AccountNum; // _custTable.Name = x
+    #    if (salesTable.Qty == 1) this.Qty++;
+    #    print fieldNum(SalesTable, SalesId), 1.5, a.b.c;
+    #    salesTable.update();
+    #}"""
+    references = [reference[:3] for reference in extract_field_references(
+        method_code, 'SalesLine', {'salestable': 'SalesTable'})]
+    assert references == [
+        ('SalesTable', 'CustAccount', 'write'),
+        ('CustTable', 'AccountNum', 'read'),
+        ('SalesTable', 'Qty', 'read'),
+        ('SalesLine', 'Qty', 'write'),
+        ('SalesTable', 'SalesId', 'fieldnum'),
+        (None, 'b', 'read'),
+    ], f"Неверные обращения к полям: {references}"
+    print("[extract_field_references] Чтение, запись и fieldNum полей с типом buffer")
+    
+    # Тест extract_macros
+    definitions, usages = extract_macros("""    #class ClassA
+    #{
+    #    #define.Version(2) // #define.Commented(1)
+    #    #localmacro.Fields
+    #        a,
+    #        b
+    #    #endmacro
+    #    #InventDimJoin
+    #    str s = "#NotMacro";
+    #}""")
+    assert [definition[:3] for definition in definitions] == [
+        ('Version', 'define', '2'),
+        ('Fields', 'localmacro', 'a,\nb'),
+    ], f"Неверные определения макросов: {definitions}"
+    assert [name for name, offset in usages] == ['InventDimJoin'], f"Неверные использования: {usages}"
+    assert extract_macros("    #x = #MaxLines;")[1] == [('MaxLines', 9)]
+    print("[extract_macros] Определения #define/#localmacro и использования макросов")
+    
+    # Тест parse_method_signature
+    signature = parse_method_signature("""    #/// <summary>{ не тело }</summary>
+    #[SysEntryPointAttribute(true)]
+    #public static server container pack(SalesTable _salesTable,
+    #    str _name = "a,b", container _c = [1, conNull()])
+    #{
+    #}""")
+    assert signature == {
+        'name': 'pack',
+        'modifiers': ['public', 'static', 'server'],
+        'return_type': 'container',
+        'parameters': [
+            {'name': '_salesTable', 'type': 'SalesTable', 'default': None},
+            {'name': '_name', 'type': 'str', 'default': '"a,b"'},
+            {'name': '_c', 'type': 'container', 'default': '[1, conNull()]'},
+        ],
+    }, f"Неверная сигнатура: {signature}"
+    assert parse_method_signature("    #class ClassA extends RunBase\n    #{\n    #}") is None
+    print("[parse_method_signature] Модификаторы, тип результата и параметры объявления")
+    
     print("\n✓ Все тесты utils пройдены успешно!")
     return True
 
@@ -153,12 +372,1002 @@ ENDMETHODS
         assert '    #' in formatted, "Форматирование не добавило префиксы"
         print("[XPOWriter] Форматирование методов работает")
         
+        # Одноимённый метод источника данных формы не должен затрагиваться
+        form_content = """***Element: FRM
+  FORM #TestForm
+    METHODS
+      SOURCE #init
+        #public void init() { super(); }
+      ENDSOURCE
+    ENDMETHODS
+    OBJECTBANK
+      DATASOURCE
+        OBJECTPOOL
+          PROPERTIES
+            Name                #SalesTable
+          ENDPROPERTIES
+        ENDOBJECTPOOL
+        METHODS
+          SOURCE #init
+            #public void init() { super(); }
+          ENDSOURCE
+        ENDMETHODS
+      ENDDATASOURCE
+    ENDOBJECTBANK
+  ENDFORM
+"""
+        new_content, replaced = writer._replace_sources(form_content, {'init': 'public void init() { changed(); }'})
+        assert replaced == ['init'], "Метод формы не заменён"
+        assert new_content.count('changed();') == 1, "Заменено больше одного блока SOURCE"
+        assert new_content.index('changed();') < new_content.index('OBJECTBANK'), "Заменён метод источника данных"
+        print("[XPOWriter] Замена SOURCE по таблице блоков работает")
+        
+        # Символ вне cp1251 не выбрасывается молча: запись останавливается с указанием элемента
+        output_file = Path(temp_path).with_name(Path(temp_path).stem + "_WR.xpo")
+        writer.xpo_encoding = 'cp1251'
+        try:
+            writer._save_output(output_file, XPO_HEADER + make_class("TestClass", "info('Привет → мир');") + XPO_FOOTER)
+            raise AssertionError("Символ вне кодировки XPO потерян без ошибки")
+        except ValueError as e:
+            assert "CLS:TestClass" in str(e) and "строка 6" in str(e), f"Неверное описание ошибки: {e}"
+        assert not output_file.exists(), "Записан XPO с потерянными символами"
+        print("[XPOWriter] Непредставимый в кодировке XPO символ останавливает запись")
+        
         print("\n✓ Все тесты xpo_writer пройдены успешно!")
         return True
     finally:
         os.unlink(temp_path)
 
 
+def test_xpo_writer_batch():
+    """Тестирует пакетную запись всех проектов (xpo_writer.py --all)"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_writer.py --all")
+    print("=" * 60)
+    
+    import tempfile
+    
+    from xpo_writer import build_project_index, write_back_all
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        xpo_dir = Path(tmp) / "XPO"
+        parser_dir = Path(tmp) / "parserXPO"
+        make_writer_project(xpo_dir / "ProjectA.xpo", parser_dir, {"ClassA": "a();"})
+        make_writer_project(xpo_dir / "ProjectB.xpo", parser_dir, {"ClassB": "b();"})
+        make_writer_project(xpo_dir / "ProjectC.xpo", parser_dir, {"ClassC": "c();"})
+        edit_method(parser_dir, "ClassA", "void run() { changedA(); }")
+        edit_method(parser_dir, "ClassB", "void run() { changedB(); }")
+        
+        index = {xpo_file.name: elements for xpo_file, elements in build_project_index(str(xpo_dir), str(parser_dir)).items()}
+        assert index == {"ProjectA.xpo": [("CLS", "ClassA")], "ProjectB.xpo": [("CLS", "ClassB")]}, \
+            f"Неверный индекс элементов проектов: {index}"
+        
+        results = write_back_all(str(xpo_dir), str(parser_dir), max_workers=2)
+        summary = [(Path(result['xpo_file']).name, result['updated_methods'], result['error'])
+                   for result in results]
+        assert summary == [
+            ("ProjectA.xpo", ["CLS:ClassA.run"], None),
+            ("ProjectB.xpo", ["CLS:ClassB.run"], None),
+        ], f"Неверный отчёт пакетной записи: {summary}"
+        assert not any("не найден" in result['log'] for result in results), "Worker обходил чужие элементы"
+        
+        output_a = (xpo_dir / "ProjectA_WR.xpo").read_text(encoding='utf-8')
+        output_b = (xpo_dir / "ProjectB_WR.xpo").read_text(encoding='utf-8')
+        assert "changedA();" in output_a and "changedB();" not in output_a, "ProjectA не обновлён"
+        assert "changedB();" in output_b and "changedA();" not in output_b, "ProjectB не обновлён"
+        assert not (xpo_dir / "ProjectC_WR.xpo").exists(), "Записан проект без изменений"
+    print("[build_project_index] Изменённые элементы сопоставлены своим проектам")
+    print("[write_back_all] Оба затронутых проекта обновлены, нетронутый пропущен")
+    
+    print("\n✓ Все тесты xpo_writer --all пройдены успешно!")
+    return True
+
+
+def test_xpo_writer_delta():
+    """Тестирует запись только изменённых элементов (write_back(delta=True))"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_writer.py --delta")
+    print("=" * 60)
+    
+    import tempfile
+    
+    from xpo_writer import XPOWriter
+    from utils.xpo_validator import validate_xpo_file
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        xpo_file = Path(tmp) / "Project.xpo"
+        parser_dir = Path(tmp) / "parserXPO"
+        make_writer_project(xpo_file, parser_dir, {"ClassA": "a();", "ClassB": "b();", "ClassC": "c();"})
+        edit_method(parser_dir, "ClassB", "void run() { changedB(); }")
+        
+        writer = XPOWriter(str(xpo_file), str(parser_dir))
+        output_file = writer.write_back(delta=True)
+        assert output_file == Path(tmp) / "Project_WR_delta.xpo", f"Неверный delta‑файл: {output_file}"
+        
+        delta_content = output_file.read_bytes().decode("utf-8")
+        assert delta_content.startswith(XPO_HEADER + "***Element: CLS\r\n  CLASS #ClassB\r\n"), \
+            f"delta‑файл должен начинаться с заголовка и ClassB:\n{delta_content}"
+        assert delta_content.endswith("  ENDCLASS\r\n" + XPO_FOOTER), "delta‑файл без ***Element: END"
+        assert delta_content.count("***Element:") == 2, f"Лишние элементы в delta:\n{delta_content}"
+        assert "changedB();" in delta_content, "Изменённый метод не записан"
+        assert "ClassA" not in delta_content and "ClassC" not in delta_content, "Неизменённые элементы в delta"
+        assert validate_xpo_file(str(output_file)) == [], "delta‑файл не проходит проверку структуры"
+    print("[XPOWriter] delta: заголовок, изменённый элемент и ***Element: END")
+    
+    print("\n✓ Все тесты xpo_writer --delta пройдены успешно!")
+    return True
+
+
+def test_xpo_writer_watch():
+    """Тестирует режим наблюдения (XPOWriter.watch) с опросом parserXPO"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_writer.py --watch")
+    print("=" * 60)
+    
+    import tempfile
+    import threading
+    import time
+    
+    from xpo_writer import XPOWriter, _PollingWatcher
+    
+    class StoppableWatcher(_PollingWatcher):
+        """Опрос с короткими интервалами, который останавливает watch по событию"""
+        def __init__(self, root, stop):
+            super().__init__(root, interval=0.02)
+            self.stop = stop
+        
+        def wait(self, timeout):
+            while True:
+                if self.stop.is_set():
+                    raise KeyboardInterrupt
+                changed = super().wait(0.05 if timeout is None else timeout)
+                if changed or timeout is not None:
+                    return changed
+    
+    def wait_for(condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return condition()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        xpo_file = Path(tmp) / "Project.xpo"
+        parser_dir = Path(tmp) / "parserXPO"
+        output_file = Path(tmp) / "Project_WR.xpo"
+        make_writer_project(xpo_file, parser_dir, {"ClassA": "a();", "ClassB": "b();"})
+        
+        writer = XPOWriter(str(xpo_file), str(parser_dir))
+        saves = []
+        save_output = writer._save_output
+        writer._save_output = lambda path, content: saves.append(content) or save_output(path, content)
+        
+        stop = threading.Event()
+        watcher = StoppableWatcher(parser_dir, stop)
+        thread = threading.Thread(target=writer.watch, kwargs={'debounce': 0.3, 'watcher': watcher})
+        thread.start()
+        try:
+            assert wait_for(lambda: len(saves) == 1), "Начальная сборка _WR.xpo не выполнена"
+            
+            # Два сохранения подряд укладываются в debounce и дают одну пересборку
+            edit_method(parser_dir, "ClassA", "void run() { first(); }")
+            time.sleep(0.05)
+            edit_method(parser_dir, "ClassA", "void run() { second(); }")
+            assert wait_for(lambda: len(saves) == 2), "_WR.xpo не пересобран после сохранения"
+            time.sleep(0.5)
+        finally:
+            stop.set()
+            thread.join(5)
+        
+        assert not thread.is_alive(), "Наблюдение не остановлено"
+        assert len(saves) == 2, f"Ожидалась одна пересборка, выполнено: {len(saves) - 1}"
+        output = output_file.read_bytes().decode('utf-8')
+        assert "second();" in output and "first();" not in output, "В _WR.xpo не последняя версия метода"
+        assert writer.updated_methods == ["CLS:ClassA.run"], f"Неверные методы: {writer.updated_methods}"
+    print("[XPOWriter] watch: пачка сохранений пересобирает _WR.xpo один раз")
+    
+    print("\n✓ Все тесты xpo_writer --watch пройдены успешно!")
+    return True
+
+
+def test_xpo_writer_verify():
+    """Тестирует проверку эквивалентности исходного XPO и _WR.xpo (verify_roundtrip)"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_writer.py --verify")
+    print("=" * 60)
+    
+    import tempfile
+    
+    from xpo_writer import XPOWriter, verify_roundtrip
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        xpo_file = Path(tmp) / "Project.xpo"
+        parser_dir = Path(tmp) / "parserXPO"
+        make_writer_project(xpo_file, parser_dir, {"ClassA": "a();", "ClassB": "b();", "ClassC": "c();"})
+        edit_method(parser_dir, "ClassB", "void run() { changedB(); }")
+        
+        writer = XPOWriter(str(xpo_file), str(parser_dir))
+        output_file = writer.write_back()
+        expected = set(writer.updated_methods)
+        report = verify_roundtrip(str(xpo_file), str(output_file), expected)
+        assert report['ok'], f"Корректная запись не прошла проверку: {report['problems']}"
+        assert (report['untouched'], report['touched']) == (4, [{'element': 'CLS:ClassB', 'methods': ['run']}])
+        output = output_file.read_bytes()
+        
+        # Посторонняя правка метода нетронутого элемента
+        output_file.write_bytes(output.replace(b"{ a(); }", b"{ broken(); }"))
+        report = verify_roundtrip(str(xpo_file), str(output_file), expected)
+        assert not report['ok'], "Изменение нетронутого метода не обнаружено"
+        assert [problem['element'] for problem in report['problems']] == ['CLS:ClassA'], report['problems']
+        
+        # Правка вне блоков SOURCE: указывается смещение в выходном файле
+        damaged = output.replace(b"  CLASS #ClassC\r\n    METHODS", b"  CLASS #ClassC\r\n    METHODZ")
+        output_file.write_bytes(damaged)
+        report = verify_roundtrip(str(xpo_file), str(output_file), expected)
+        assert [(problem['element'], problem['offset']) for problem in report['problems']] == [
+            ('CLS:ClassC', damaged.index(b"METHODZ") + len(b"METHOD"))], report['problems']
+    print("[verify_roundtrip] Посторонние правки нетронутых элементов и методов обнаруживаются")
+    
+    print("\n✓ Все тесты xpo_writer --verify пройдены успешно!")
+    return True
+
+
+def test_xpo_validator():
+    """Тестирует utils/xpo_validator.py"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ utils/xpo_validator.py")
+    print("=" * 60)
+    
+    from utils.xpo_validator import XPOStructureValidator
+    
+    valid_xpo = (b"Exportfile for AOT version 1.0 or later\r\n"
+                 b"***Element: CLS\r\n"
+                 b"  CLASS #TestClass\r\n"
+                 b"    PROPERTIES\r\n"
+                 b"    ENDPROPERTIES\r\n"
+                 b"    METHODS\r\n"
+                 b"      SOURCE #new\r\n"
+                 b"        #public void new()\r\n"
+                 b"      ENDSOURCE\r\n"
+                 b"    ENDMETHODS\r\n"
+                 b"  ENDCLASS\r\n"
+                 b"***Element: END\r\n")
+    
+    # Данные подаются мелкими кусками, как при потоковой записи
+    validator = XPOStructureValidator()
+    for pos in range(0, len(valid_xpo), 5):
+        validator.feed(valid_xpo[pos:pos + 5])
+    assert validator.finish() == [], "Корректный XPO признан некорректным"
+    print("[XPOStructureValidator] Корректный XPO проходит проверку")
+    
+    broken_xpo = valid_xpo.replace(b"      ENDSOURCE\r\n", b"")
+    validator = XPOStructureValidator()
+    validator.feed(broken_xpo)
+    issues = validator.finish()
+    assert len(issues) == 1, f"Ожидалась одна проблема, получено {issues}"
+    assert issues[0]['line'] == 7, "Неверная строка проблемы"
+    assert issues[0]['offset'] == broken_xpo.index(b"      SOURCE #new"), "Неверное смещение проблемы"
+    print("[XPOStructureValidator] Незакрытый SOURCE найден с точной позицией")
+    
+    print("\n✓ Все тесты xpo_validator пройдены успешно!")
+    return True
+
+
+def test_xpo_indexer_update():
+    """Тестирует инкрементальное обновление индекса (xpo_indexer_sqlite.py --update)"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_indexer_sqlite.py --update")
+    print("=" * 60)
+    
+    import sqlite3
+    import tempfile
+    
+    from xpo_indexer_sqlite import XPOSQLiteIndexer
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        xpo_file = Path(tmp) / "test.xpo"
+        db_file = Path(tmp) / "test.db"
+        
+        write_xpo(xpo_file, make_class("ClassA", "a();") + make_class("ClassB", "b();"))
+        index_xpo(xpo_file, db_file)
+        assert not Path(str(db_file) + ".tmp").exists(), "Временная база не подменила индекс"
+        
+        # ClassA меняется и сдвигает ClassB, ClassC добавляется, ClassB удаляется из конца
+        write_xpo(xpo_file, make_class("ClassA", "a(); // Кириллица до ClassC") + make_class("ClassC", "c();"))
+        indexer = XPOSQLiteIndexer(str(xpo_file), str(db_file))
+        assert indexer.can_update(), "Индекс с хэшами должен обновляться инкрементально"
+        stats = indexer.update_index()
+        indexer.close()
+        assert (stats['added'], stats['updated'], stats['deleted']) == (1, 1, 1), f"Неверная статистика: {stats}"
+        
+        conn = sqlite3.connect(db_file)
+        content = xpo_file.read_bytes()
+        rows = conn.execute("SELECT element_name, file_position FROM elements ORDER BY element_name").fetchall()
+        assert [row[0] for row in rows] == ["ClassA", "ClassC"], f"Неверный набор элементов: {rows}"
+        assert rows[1][1] == content.index(b"***Element: CLS\r\n  CLASS #ClassC"), "Позиция ClassC не в байтах"
+        fts_rows = conn.execute("SELECT rowid FROM elements_fts WHERE elements_fts MATCH 'ClassB'").fetchall()
+        conn.close()
+        assert fts_rows == [], "Удалённый элемент остался в FTS"
+    print("[XPOSQLiteIndexer] Инкрементальное обновление по хэшам элементов")
+    print("[XPOSQLiteIndexer] Позиции элементов хранятся в байтах")
+    
+    print("\n✓ Все тесты xpo_indexer_sqlite.py --update пройдены успешно!")
+    return True
+
+
+def test_xpo_indexer_methods():
+    """Тестирует индекс методов с байтовыми диапазонами"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_indexer_sqlite.py: методы")
+    print("=" * 60)
+    
+    import sqlite3
+    import tempfile
+    
+    from xpo_indexer_sqlite import XPOSQLiteIndexer
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        xpo_file = Path(tmp) / "big.xpo"
+        db_file = Path(tmp) / "big.db"
+        
+        # Второй метод начинается далеко за первыми 10000 байтами элемента
+        padding = "        #    i++;\r\n" * 2000
+        big_class = make_class("BigClass", "").replace(
+            "      ENDSOURCE\r\n",
+            padding + "      ENDSOURCE\r\n"
+            "      SOURCE #tail\r\n"
+            "        #void tail() { info(\"tail\"); }\r\n"
+            "      ENDSOURCE\r\n")
+        write_xpo(xpo_file, big_class)
+        indexer = XPOSQLiteIndexer(str(xpo_file), str(db_file))
+        indexer.create_database()
+        indexer.index_file()
+        indexer.close()
+        
+        conn = sqlite3.connect(db_file)
+        rows = conn.execute("""
+            SELECT method_name, file_position, size, line_count FROM methods ORDER BY file_position
+        """).fetchall()
+        conn.close()
+        assert [row[0] for row in rows] == ["run", "tail"], f"Неверный список методов: {rows}"
+        assert rows[0][3] == 2001, "Неверное число строк метода run"
+        content = xpo_file.read_bytes()
+        tail_body = content[rows[1][1]:rows[1][1] + rows[1][2]]
+        assert tail_body == b'        #void tail() { info("tail"); }\r\n', f"Неверный диапазон метода: {tail_body!r}"
+    print("[XPOSQLiteIndexer] Все методы большого класса с байтовыми диапазонами")
+    
+    print("\n✓ Все тесты xpo_indexer_sqlite.py: методы пройдены успешно!")
+    return True
+
+
+def test_xpo_indexer_method_bodies():
+    """Тестирует поиск подстроки в телах методов (methods_fts)"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_indexer_sqlite.py: methods_fts")
+    print("=" * 60)
+    
+    import sqlite3
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        from mcp_server.xpo_reader import XPOReader
+        
+        xpo_file = Path(tmp) / "bodies.xpo"
+        db_file = Path(tmp) / "bodies.db"
+        write_xpo(xpo_file, make_class("ClassA", "a();") + make_class("ClassB", "b();"))
+        index_xpo(xpo_file, db_file)
+        write_xpo(xpo_file, make_class("ClassA", "a(); // Кириллица до ClassC") + make_class("ClassC", "c();"))
+        index_xpo(xpo_file, db_file, update=True)
+        
+        conn = sqlite3.connect(db_file)
+        body_rows = conn.execute("""
+            SELECT m.element_id FROM methods_fts JOIN methods m ON m.id = methods_fts.rowid
+            WHERE methods_fts MATCH '"рилл"'
+        """).fetchall()
+        removed_rows = conn.execute("SELECT rowid FROM methods_fts WHERE methods_fts MATCH '\"b();\"'").fetchall()
+        conn.close()
+        assert len(body_rows) == 1, "Подстрока тела метода не найдена в methods_fts"
+        assert removed_rows == [], "Тело удалённого метода осталось в methods_fts"
+        
+        # Имени элемента нет в телах методов: поиск откатывается на имена
+        reader = XPOReader(str(xpo_file), str(db_file))
+        by_name = reader.fulltext_search("ClassA")
+        by_body = reader.fulltext_search("Кириллица")
+        reader.close()
+        assert [row['element_name'] for row in by_name] == ["ClassA"], f"Поиск по имени: {by_name}"
+        assert [row.get('method_name') for row in by_body] == ["run"], f"Поиск по телу: {by_body}"
+    print("[XPOSQLiteIndexer] Поиск подстроки в телах методов (methods_fts)")
+    
+    print("\n✓ Все тесты xpo_indexer_sqlite.py: methods_fts пройдены успешно!")
+    return True
+
+
+def test_xpo_indexer_workers():
+    """Тестирует индексацию пулом процессов"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_indexer_sqlite.py --workers")
+    print("=" * 60)
+    
+    import sqlite3
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        xpo_file = Path(tmp) / "pool.xpo"
+        write_xpo(xpo_file, "".join(make_class(f"Class{i}", f"call{i}();") for i in range(50)))
+        
+        dumps = []
+        for workers in (1, 2):
+            db_file = Path(tmp) / f"pool{workers}.db"
+            index_xpo(xpo_file, db_file, workers=workers)
+            conn = sqlite3.connect(db_file)
+            dumps.append((conn.execute("SELECT * FROM elements ORDER BY id").fetchall(),
+                          conn.execute("SELECT * FROM methods ORDER BY id").fetchall()))
+            conn.close()
+        assert dumps[0] == dumps[1], "Индекс зависит от числа процессов"
+        assert len(dumps[0][0]) == 50, "Потеряны элементы при параллельном разборе"
+    print("[XPOSQLiteIndexer] Пул процессов дает тот же индекс, что и один процесс")
+    
+    print("\n✓ Все тесты xpo_indexer_sqlite.py --workers пройдены успешно!")
+    return True
+
+
+def test_xpo_indexer_labels():
+    """Тестирует индекс использований меток (labels)"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_indexer_sqlite.py: метки")
+    print("=" * 60)
+    
+    import sqlite3
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        from mcp_server.xpo_reader import XPOReader
+        
+        xpo_file = Path(tmp) / "labels.xpo"
+        db_file = Path(tmp) / "labels.db"
+        labeled_class = make_class("LabelClass", 'info("@MIK4140"); error("@SYS123");').replace(
+            "    METHODS\r\n", "    PROPERTIES\r\n      Label #@MIK4140\r\n    ENDPROPERTIES\r\n    \r\n    METHODS\r\n")
+        write_xpo(xpo_file, labeled_class + make_class("OtherClass", 'info("@MIK41400");'))
+        index_xpo(xpo_file, db_file)
+        
+        reader = XPOReader(str(xpo_file), str(db_file))
+        usage = reader.find_label_usage("4140")
+        sys_usage = reader.find_label_usage("@sys123")
+        reader.close()
+        assert usage == [{'element_type': 'CLS', 'element_name': 'LabelClass', 'methods': ['run']}], \
+            f"Неверные использования метки: {usage}"
+        assert [row['element_name'] for row in sys_usage] == ['LabelClass'], f"Метка @SYS не найдена: {sys_usage}"
+        
+        conn = sqlite3.connect(db_file)
+        positions = [row[0] for row in conn.execute(
+            "SELECT file_position FROM labels WHERE label_id = 'MIK4140' ORDER BY file_position")]
+        conn.close()
+        content = xpo_file.read_bytes()
+        assert [content[position:position + 8] for position in positions] == [b"@MIK4140"] * 2, \
+            "Позиции меток не в байтах"
+    print("[XPOSQLiteIndexer] Использования меток @MIK/@SYS из таблицы labels")
+    
+    print("\n✓ Все тесты xpo_indexer_sqlite.py: метки пройдены успешно!")
+    return True
+
+
+def test_xpo_indexer_class_hierarchy():
+    """Тестирует замыкание наследования классов (class_hierarchy)"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_indexer_sqlite.py: class_hierarchy")
+    print("=" * 60)
+    
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        from mcp_server.xpo_reader import XPOReader
+        
+        xpo_file = Path(tmp) / "hierarchy.xpo"
+        db_file = Path(tmp) / "hierarchy.db"
+        write_xpo(xpo_file, make_subclass("ClassA", "RunBaseBatch") + make_subclass("ClassB", "ClassA")
+                  + make_subclass("ClassC", "ClassB"))
+        index_xpo(xpo_file, db_file)
+        
+        reader = XPOReader(str(xpo_file), str(db_file))
+        ancestors = reader.get_ancestors("classc")
+        descendants = reader.get_descendants("RunBaseBatch")
+        direct = reader.get_descendants("RunBaseBatch", max_depth=1)
+        reader.close()
+        assert ancestors == ["ClassB", "ClassA", "RunBaseBatch"], f"Неверная цепочка предков: {ancestors}"
+        assert [(row['class_name'], row['depth']) for row in descendants] == [
+            ("ClassA", 1), ("ClassB", 2), ("ClassC", 3)], f"Неверные наследники: {descendants}"
+        assert [row['class_name'] for row in direct] == ["ClassA"], f"Неверные прямые наследники: {direct}"
+        
+        # ClassC переносится под ClassA: замыкание пересчитывается при обновлении
+        write_xpo(xpo_file, make_subclass("ClassA", "RunBaseBatch") + make_subclass("ClassB", "ClassA")
+                  + make_subclass("ClassC", "ClassA"))
+        index_xpo(xpo_file, db_file, update=True)
+        reader = XPOReader(str(xpo_file), str(db_file))
+        ancestors = reader.get_ancestors("ClassC")
+        reader.close()
+        assert ancestors == ["ClassA", "RunBaseBatch"], f"Замыкание не обновилось: {ancestors}"
+    print("[XPOSQLiteIndexer] Предки и наследники классов из class_hierarchy")
+    
+    print("\n✓ Все тесты xpo_indexer_sqlite.py: class_hierarchy пройдены успешно!")
+    return True
+
+
+def test_xpo_index_health():
+    """Тестирует метаданные индекса и check_xpo_index_health.py"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ check_xpo_index_health.py")
+    print("=" * 60)
+    
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        import os
+        from check_xpo_index_health import check_index_health
+        from mcp_server.xpo_reader import XPOReader
+        from utils.xpo_index_meta import SAMPLE_BLOCK_SIZE
+        
+        xpo_file = Path(tmp) / "meta.xpo"
+        db_file = Path(tmp) / "meta.db"
+        write_xpo(xpo_file, make_class("ClassA", "a();"))
+        index_xpo(xpo_file, db_file)
+        
+        health = check_index_health(str(xpo_file), str(db_file), deep=True)
+        assert health['issues'] == [], f"Свежий индекс признан устаревшим: {health['issues']}"
+        assert health['meta']['elements_count'] == '1' and health['meta']['source_size'] == str(xpo_file.stat().st_size)
+        assert check_index_health(str(xpo_file), str(db_file))['full_hash_bytes'] == 0, "Прежний XPO прочитан целиком"
+        
+        # Копирование (новое время, то же содержимое) индекс не портит, но стоит полного чтения
+        stat = xpo_file.stat()
+        os.utime(xpo_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        health = check_index_health(str(xpo_file), str(db_file))
+        assert health['issues'] == [], "Смена времени без изменений"
+        assert health['full_hash_bytes'] == stat.st_size, f"Не указана цена полного хэша: {health['full_hash_bytes']}"
+        reader = XPOReader(str(xpo_file), str(db_file))
+        assert reader.get_element_code("ClassA") is not None, "Актуальный индекс не читается"
+        
+        # Правка того же размера: смещения больше не верны
+        write_xpo(xpo_file, make_class("ClassA", "b();"))
+        os.utime(xpo_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+        health = check_index_health(str(xpo_file), str(db_file))
+        assert health['issues'], "Изменённый XPO не обнаружен"
+        assert health['full_hash_bytes'] == 0, "Несовпавший выборочный хэш не остановил полное чтение"
+        try:
+            reader.get_element_code("ClassA")
+            raise AssertionError("XPOReader отдал код по устаревшему индексу")
+        except RuntimeError:
+            pass
+        finally:
+            reader.close()
+        
+        # Правка того же размера между блоками выборочного хэша ловится полным хэшем
+        write_xpo(xpo_file, make_class("ClassA", "").replace(
+            "      ENDSOURCE\r\n", "        #    i++;\r\n" * 20000 + "      ENDSOURCE\r\n"))
+        index_xpo(xpo_file, db_file)
+        content = xpo_file.read_bytes()
+        stat = xpo_file.stat()
+        unsampled = content.index(b"i++;", SAMPLE_BLOCK_SIZE)
+        xpo_file.write_bytes(content[:unsampled] + b"j" + content[unsampled + 1:])
+        os.utime(xpo_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        issues = check_index_health(str(xpo_file), str(db_file))['issues']
+        assert issues == ["XPO изменён после построения индекса (полный хэш не совпадает)"], \
+            f"Правка вне выборки не обнаружена: {issues}"
+    print("[check_xpo_index_health] Устаревший индекс обнаруживается, XPOReader отказывается читать")
+    print("[check_xpo_index_health] Полный хэш читается только после совпавшего выборочного")
+    
+    print("\n✓ Все тесты check_xpo_index_health.py пройдены успешно!")
+    return True
+
+
+def test_xpo_indexer_blobs():
+    """Тестирует чтение кода из сжатых блобов индекса (--blobs)"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_indexer_sqlite.py --blobs")
+    print("=" * 60)
+    
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        from mcp_server.xpo_reader import XPOReader
+        
+        xpo_file = Path(tmp) / "blobs.xpo"
+        db_file = Path(tmp) / "blobs.db"
+        plain_db_file = Path(tmp) / "plain.db"
+        write_xpo(xpo_file, make_class("ClassA", "a();") + make_class("ClassB", "b();"))
+        index_xpo(xpo_file, db_file, blob_codec='lzma')
+        index_xpo(xpo_file, plain_db_file)
+        
+        # Обновление без --blobs сохраняет сжатый текст и для изменённых элементов
+        write_xpo(xpo_file, make_class("ClassA", "changed();") + make_class("ClassB", "b();"))
+        index_xpo(xpo_file, db_file, update=True)
+        
+        xpo_file.unlink()
+        reader = XPOReader(str(xpo_file), str(db_file))
+        assert reader.has_blobs(), "Индекс с --blobs не распознан"
+        method_code = reader.get_method_code("ClassA", "run")
+        element_code = reader.get_element_code("ClassB")
+        reader.close()
+        assert method_code.strip() == "void run() { changed(); }", f"Неверный код из блоба: {method_code!r}"
+        assert element_code and 'run' in element_code['methods'], "Элемент не прочитан из блоба"
+        
+        # Без блобов и без XPO файла — понятная ошибка, а не FileNotFoundError из os.stat
+        reader = XPOReader(str(xpo_file), str(plain_db_file))
+        assert not reader.has_blobs(), "Индекс без --blobs принят за индекс с блобами"
+        try:
+            reader.get_method_code("ClassA", "run")
+            raise AssertionError("Код прочитан без XPO файла и блобов")
+        except RuntimeError as e:
+            assert "XPO файл не найден" in str(e), f"Неверное сообщение: {e}"
+        finally:
+            reader.close()
+    print("[XPOSQLiteIndexer] Код читается из сжатых блобов без XPO файла")
+    print("[XPOReader] Без блобов отсутствующий XPO дает понятную ошибку")
+    
+    print("\n✓ Все тесты xpo_indexer_sqlite.py --blobs пройдены успешно!")
+    return True
+
+
+def test_xpo_indexer_sources():
+    """Тестирует индекс нескольких источников со слоями (--source)"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_indexer_sqlite.py --source")
+    print("=" * 60)
+    
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        from mcp_server.xpo_reader import XPOReader
+        
+        xpo_file = Path(tmp) / "cus.xpo"
+        proj_file = Path(tmp) / "proj.xpo"
+        db_file = Path(tmp) / "layers.db"
+        write_xpo(xpo_file, make_class("ClassA", "cus();") + make_class("ClassB", "b();"))
+        write_xpo(proj_file, make_class("ClassA", "project();"))
+        index_xpo(xpo_file, db_file, sources=[(str(proj_file), 'proj')])
+        
+        # Проект перекрывает CUS, версия слоя доступна явно
+        reader = XPOReader(str(xpo_file), str(db_file))
+        effective_code = reader.get_method_code("ClassA", "run")
+        cus_code = reader.get_method_code("ClassA", "run", layer='cus')
+        layers = reader.get_element_layers("ClassA")
+        only_cus = reader.get_element_layers("ClassB")
+        reader.close()
+        assert effective_code.strip() == "void run() { project(); }", f"Не действующая версия: {effective_code!r}"
+        assert cus_code.strip() == "void run() { cus(); }", f"Неверная версия слоя cus: {cus_code!r}"
+        assert [(row['layer'], row['effective']) for row in layers] == [('cus', False), ('proj', True)], \
+            f"Неверные слои: {layers}"
+        assert [(row['layer'], row['effective']) for row in only_cus] == [('cus', True)]
+        
+        # Обновление без --source сохраняет слои, явный пустой список убирает проект
+        index_xpo(xpo_file, db_file, update=True)
+        reader = XPOReader(str(xpo_file), str(db_file))
+        assert len(reader.get_element_layers("ClassA")) == 2, "Слой проекта потерян при обновлении"
+        reader.close()
+        
+        index_xpo(xpo_file, db_file, update=True, sources=[])
+        reader = XPOReader(str(xpo_file), str(db_file))
+        code = reader.get_method_code("ClassA", "run")
+        reader.close()
+        assert code.strip() == "void run() { cus(); }", f"Слой проекта не удален: {code!r}"
+    print("[XPOSQLiteIndexer] Несколько источников: проект перекрывает CUS, слои доступны явно")
+    
+    print("\n✓ Все тесты xpo_indexer_sqlite.py --source пройдены успешно!")
+    return True
+
+
+def test_xpo_reader_suggest_elements():
+    """Тестирует подсказки имен элементов (suggest_elements)"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ XPOReader.suggest_elements")
+    print("=" * 60)
+    
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        from mcp_server.xpo_reader import XPOReader
+        
+        xpo_file = Path(tmp) / "names.xpo"
+        db_file = Path(tmp) / "names.db"
+        names = ["RabbitIntEngine", "RabbitIntEngineImp_Infor_Shipped", "RabbitIntEngineImp_Vend", "SalesTable"]
+        write_xpo(xpo_file, "".join(make_class(name, "x();") for name in names))
+        index_xpo(xpo_file, db_file)
+        
+        reader = XPOReader(str(xpo_file), str(db_file))
+        typo = reader.suggest_elements("RabitIntEngine")
+        humps = reader.suggest_elements("RIEIIS")
+        camel = reader.suggest_elements("RabIntEngImp_V")
+        prefix = reader.suggest_elements("rabbitinteng", limit=2)
+        reader.close()
+        assert typo[0]['element_name'] == "RabbitIntEngine" and typo[0]['match'] == 'fuzzy', f"Опечатка: {typo}"
+        assert [row['element_name'] for row in humps] == ["RabbitIntEngineImp_Infor_Shipped"], f"Горбы: {humps}"
+        assert camel[0]['element_name'] == "RabbitIntEngineImp_Vend" and camel[0]['match'] == 'humps', f"CamelCase: {camel}"
+        assert [(row['element_name'], row['match']) for row in prefix] == [
+            ("RabbitIntEngine", 'prefix'), ("RabbitIntEngineImp_Vend", 'prefix')], f"Префикс: {prefix}"
+        
+        # Обновление добавляет и удаляет имена в element_names и name_trigrams
+        write_xpo(xpo_file, make_class("SalesTable", "x();") + make_class("SalesLine", "y();"))
+        index_xpo(xpo_file, db_file, update=True)
+        reader = XPOReader(str(xpo_file), str(db_file))
+        assert reader.suggest_elements("RabitIntEngine") == [], "Удаленное имя осталось в подсказках"
+        assert reader.suggest_elements("SalesLn")[0]['element_name'] == "SalesLine"
+        orphans = reader.conn.execute("""
+            SELECT COUNT(*) FROM name_trigrams WHERE name_id NOT IN (SELECT id FROM element_names)
+        """).fetchone()[0]
+        reader.close()
+        assert orphans == 0, "Триграммы удаленных имен не удалены"
+    print("[XPOReader] Подсказки имен: префикс, CamelCase-горбы и опечатки")
+    
+    print("\n✓ Все тесты XPOReader.suggest_elements пройдены успешно!")
+    return True
+
+
+def test_xpo_indexer_table_schema():
+    """Тестирует индекс структуры таблиц"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_indexer_sqlite.py: структура таблиц")
+    print("=" * 60)
+    
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        from mcp_server.xpo_reader import XPOReader
+        
+        xpo_file = Path(tmp) / "tables.xpo"
+        db_file = Path(tmp) / "tables.db"
+        write_xpo(xpo_file, make_table("CustTable", [("AccountIdx", True, ["AccountNum"]),
+                                                     ("NameIdx", False, ["Name", "AccountNum"])]))
+        index_xpo(xpo_file, db_file)
+        
+        reader = XPOReader(str(xpo_file), str(db_file))
+        schema = reader.get_table_schema("CustTable")
+        covering = reader.conn.execute("""
+            SELECT i.index_name, f.position FROM table_indexes i
+            JOIN table_index_fields f ON f.index_id = i.id
+            WHERE f.field_name = 'accountnum' ORDER BY i.index_name
+        """).fetchall()
+        reader.close()
+        assert schema['properties']['CacheLookup'] == "Found" and schema['properties']['TableGroup'] == "Main"
+        assert [(field['field_name'], field['field_type'], field['edt']) for field in schema['fields']] == [
+            ("AccountNum", "STRING", "AccountNumEdt"), ("Name", "STRING", "NameEdt"), ("Status", "STRING", "StatusEdt")]
+        assert [(index['index_name'], index['fields'], index['is_unique'], index['is_clustered'])
+                for index in schema['indexes']] == [("AccountIdx", ["AccountNum"], True, True),
+                                                    ("NameIdx", ["Name", "AccountNum"], False, False)], schema['indexes']
+        assert [tuple(row) for row in covering] == [("AccountIdx", 1), ("NameIdx", 2)], "Поле не найдено в индексах"
+        relation = schema['relations'][0]
+        assert relation['related_table'] == "CustGroup" and [
+            (link['link_type'], link['field_name'], link['related_field'], link['value']) for link in relation['links']
+        ] == [("NORMAL", "Name", "CustGroup", None), ("THISFIXED", "Status", None, "1")], relation
+        
+        # Изменённая таблица перезаписывает структуру при обновлении
+        write_xpo(xpo_file, make_table("CustTable", [("NameIdx", True, ["Name"])], cache_lookup="EntireTable"))
+        index_xpo(xpo_file, db_file, update=True)
+        reader = XPOReader(str(xpo_file), str(db_file))
+        schema = reader.get_table_schema("CustTable")
+        index_field_rows = reader.conn.execute("SELECT COUNT(*) FROM table_index_fields").fetchone()[0]
+        reader.close()
+        assert schema['properties']['CacheLookup'] == "EntireTable"
+        assert [(index['index_name'], index['is_unique'], index['is_clustered']) for index in schema['indexes']] == [
+            ("NameIdx", True, True)] and index_field_rows == 1, "Старые индексы таблицы не удалены"
+    print("[XPOSQLiteIndexer] Структура таблиц: свойства, поля, индексы и связи")
+    
+    print("\n✓ Все тесты xpo_indexer_sqlite.py: структура таблиц пройдены успешно!")
+    return True
+
+
+def test_iter_element_boundaries():
+    """Тестирует потоковый сканер границ элементов"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ iter_element_boundaries")
+    print("=" * 60)
+    
+    import tempfile
+    
+    from xpo_indexer_sqlite import iter_element_boundaries
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        xpo_file = Path(tmp) / "boundaries.xpo"
+        write_xpo(xpo_file, "".join(make_class(f"Class{i}", f"call{i}();") for i in range(50)))
+        
+        # Сканер границ читает файл буферами: граница буфера не должна рвать строки
+        boundaries = list(iter_element_boundaries(str(xpo_file)))
+        assert len(boundaries) == 51 and boundaries[0][2] == "CLS" and boundaries[-1][2] == "END"
+        assert list(iter_element_boundaries(str(xpo_file), buffer_size=7)) == boundaries, \
+            "Границы элементов зависят от размера буфера"
+    print("[iter_element_boundaries] Границы элементов не зависят от размера буфера")
+    
+    print("\n✓ Все тесты iter_element_boundaries пройдены успешно!")
+    return True
+
+
+def test_xpo_export_diff():
+    """Тестирует indexXPO_cus/xpo_export_diff.py"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_export_diff.py")
+    print("=" * 60)
+    
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        from xpo_export_diff import compare_exports
+        
+        old_file = Path(tmp) / "old.xpo"
+        new_file = Path(tmp) / "new.xpo"
+        db_file = Path(tmp) / "old.db"
+        write_xpo(old_file, make_class("ClassA", "a();") + make_class("ClassB", "b();") + make_class("ClassC", "c();"))
+        write_xpo(new_file, make_class("ClassA", "a();") + make_class("ClassB", "b2();") + make_class("ClassD", "d();"))
+        index_xpo(old_file, db_file)
+        
+        # Старая сторона из XPO и из базы индекса дает один и тот же результат
+        results = [compare_exports(str(old_side), str(new_file), workers=1)[2] for old_side in (old_file, db_file)]
+        assert results[0] == results[1], "Сравнение с базой и с XPO расходится"
+        diff = results[0]
+        assert [e['element_name'] for e in diff['elements']['added']] == ["ClassD"]
+        assert [e['element_name'] for e in diff['elements']['removed']] == ["ClassC"]
+        assert [e['element_name'] for e in diff['elements']['modified']] == ["ClassB"]
+        assert diff['methods']['modified'] == [{'element_type': "CLS", 'element_name': "ClassB", 'path': "run"}]
+        assert not diff['methods']['added'] and not diff['methods']['removed']
+        moved = diff['elements']['modified'][0]
+        assert new_file.read_bytes()[moved['file_position']:].startswith(b"***Element: CLS\r\n  CLASS #ClassB")
+    print("[xpo_export_diff] Изменения между выгрузками по хэшам элементов и методов")
+    
+    print("\n✓ Все тесты xpo_export_diff.py пройдены успешно!")
+    return True
+
+
+def test_xpo_indexer_signatures():
+    """Тестирует индекс сигнатур методов (methods, method_params)"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_indexer_sqlite.py: сигнатуры методов")
+    print("=" * 60)
+    
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        from mcp_server.xpo_reader import XPOReader
+        
+        xpo_file = Path(tmp) / "signatures.xpo"
+        db_file = Path(tmp) / "signatures.db"
+        
+        def make_methods_class(name, declarations):
+            methods = "".join(f"      SOURCE #m{i}\r\n        #{declaration}\r\n        #{{\r\n        #}}\r\n"
+                              "      ENDSOURCE\r\n" for i, declaration in enumerate(declarations))
+            return (f"***Element: CLS\r\n  CLASS #{name}\r\n    METHODS\r\n{methods}"
+                    "    ENDMETHODS\r\n  ENDCLASS\r\n")
+        
+        write_xpo(xpo_file, make_methods_class("ClassA", [
+            "public static container m0(SalesTable _salesTable, boolean _flag = false)",
+            "void m1(CustTable _custTable)",
+        ]))
+        index_xpo(xpo_file, db_file)
+        
+        reader = XPOReader(str(xpo_file), str(db_file))
+        static_container = reader.find_methods_by_signature(return_type="CONTAINER", modifier="static")
+        with_sales_table = reader.find_methods_by_signature(param_type="salestable")
+        assert [(row['method_name'], row['modifiers'], row['param_count']) for row in static_container] == [
+            ("m0", "public static", 2)], f"Поиск по сигнатуре: {static_container}"
+        assert with_sales_table[0]['parameters'][1] == {
+            'param_name': '_flag', 'param_type': 'boolean', 'default_value': 'false'}
+        reader.close()
+        
+        # Изменённый метод перезаписывает параметры при обновлении
+        write_xpo(xpo_file, make_methods_class("ClassA", [
+            "public static container m0(CustTable _custTable)",
+            "void m1(CustTable _custTable)",
+        ]))
+        index_xpo(xpo_file, db_file, update=True)
+        reader = XPOReader(str(xpo_file), str(db_file))
+        assert reader.find_methods_by_signature(param_type="SalesTable") == [], "Старые параметры не удалены"
+        assert len(reader.find_methods_by_signature(param_type="CustTable")) == 2
+        param_rows = reader.conn.execute("SELECT COUNT(*) FROM method_params").fetchone()[0]
+        reader.close()
+        assert param_rows == 2, f"Лишние строки method_params: {param_rows}"
+    print("[XPOSQLiteIndexer] Сигнатуры методов: модификаторы, тип результата, параметры")
+    
+    print("\n✓ Все тесты xpo_indexer_sqlite.py: сигнатуры методов пройдены успешно!")
+    return True
+
+
+def test_xpo_indexer_field_refs():
+    """Тестирует индекс обращений к полям таблиц (field_refs)"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_indexer_sqlite.py: field_refs")
+    print("=" * 60)
+    
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        from mcp_server.xpo_reader import XPOReader
+        
+        xpo_file = Path(tmp) / "fields.xpo"
+        db_file = Path(tmp) / "fields.db"
+        
+        def make_buffer_class(body):
+            return ("***Element: CLS\r\n  CLASS #ClassA\r\n    METHODS\r\n"
+                    "      SOURCE #classDeclaration\r\n        #class ClassA\r\n        #{\r\n"
+                    "        #    SalesTable salesTable;\r\n        #}\r\n      ENDSOURCE\r\n"
+                    f"      SOURCE #run\r\n        #void run()\r\n        #{{\r\n        #    {body}\r\n"
+                    "        #}\r\n      ENDSOURCE\r\n    ENDMETHODS\r\n  ENDCLASS\r\n")
+        
+        write_xpo(xpo_file, make_buffer_class("salesTable.CustAccount = '1'; x = salesTable.SalesId;"))
+        index_xpo(xpo_file, db_file)
+        
+        reader = XPOReader(str(xpo_file), str(db_file))
+        writes = reader.find_field_usage("salestable", "custaccount", kind="write")
+        assert [(row['element_name'], row['path'], row['table_name']) for row in writes] == [
+            ("ClassA", "run", "SalesTable")], f"Запись поля: {writes}"
+        position = writes[0]['file_position']
+        assert xpo_file.read_bytes()[position:position + 22] == b"salesTable.CustAccount"
+        assert reader.find_field_usage("CustTable", "CustAccount") == []
+        reader.close()
+        
+        # Изменённый метод перезаписывает обращения при обновлении
+        write_xpo(xpo_file, make_buffer_class("info(fieldStr(SalesTable, SalesId)); y.CustAccount = 2;"))
+        index_xpo(xpo_file, db_file, update=True)
+        reader = XPOReader(str(xpo_file), str(db_file))
+        assert reader.find_field_usage("SalesTable", "CustAccount") == [], "Старые обращения не удалены"
+        unresolved = reader.find_field_usage("SalesTable", "CustAccount", include_unresolved=True)
+        by_kind = [row['kind'] for row in reader.find_field_usage("SalesTable", "SalesId")]
+        reader.close()
+        assert [(row['table_name'], row['kind']) for row in unresolved] == [(None, 'write')]
+        assert by_kind == ['fieldstr'], f"fieldStr: {by_kind}"
+    print("[XPOSQLiteIndexer] Обращения к полям таблиц из field_refs")
+    
+    print("\n✓ Все тесты xpo_indexer_sqlite.py: field_refs пройдены успешно!")
+    return True
+
+
+def test_xpo_indexer_macros():
+    """Тестирует индекс макросов (macro_defs, macro_refs)"""
+    print("\n" + "=" * 60)
+    print("ТЕСТИРОВАНИЕ xpo_indexer_sqlite.py: макросы")
+    print("=" * 60)
+    
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        from mcp_server.xpo_reader import XPOReader
+        
+        xpo_file = Path(tmp) / "macros.xpo"
+        db_file = Path(tmp) / "macros.db"
+        
+        def make_macro_elements(max_lines):
+            return ("***Element: MCR\r\n  JOBVERSION 1\r\n  SOURCE #MyMacros\r\n"
+                    f"    ##define.MaxLines({max_lines})\r\n  ENDSOURCE\r\n"
+                    "***Element: CLS\r\n  CLASS #ClassA\r\n    METHODS\r\n"
+                    "      SOURCE #classDeclaration\r\n        #class ClassA\r\n        #{\r\n"
+                    "        #    #define.MaxLines(5)\r\n        #}\r\n      ENDSOURCE\r\n"
+                    "      SOURCE #run\r\n        #void run()\r\n        #{\r\n        #    #MyMacros\r\n"
+                    "        #    x = #MaxLines;\r\n        #}\r\n      ENDSOURCE\r\n"
+                    "    ENDMETHODS\r\n  ENDCLASS\r\n")
+        
+        write_xpo(xpo_file, make_macro_elements(100))
+        index_xpo(xpo_file, db_file)
+        
+        reader = XPOReader(str(xpo_file), str(db_file))
+        resolved = reader.resolve_macro("maxlines", "ClassA", "CLS", "run")
+        assert [(row['scope'], row['element_name'], row['value']) for row in resolved] == [
+            ('element', 'ClassA', '5'), ('included_library', 'MyMacros', '100')], f"Разрешение макроса: {resolved}"
+        library = reader.resolve_macro("MyMacros")
+        assert [(row['kind'], row['value']) for row in library] == [('library', '#define.MaxLines(100)')]
+        usages = reader.find_macro_usage("MaxLines")
+        assert [(row['element_name'], row['path']) for row in usages] == [("ClassA", "run")]
+        position = usages[0]['file_position']
+        assert xpo_file.read_bytes()[position:position + 9] == b"#MaxLines"
+        reader.close()
+        
+        # Изменённая библиотека перезаписывает определения при обновлении
+        write_xpo(xpo_file, make_macro_elements(250))
+        index_xpo(xpo_file, db_file, update=True)
+        reader = XPOReader(str(xpo_file), str(db_file))
+        values = [row['value'] for row in reader.resolve_macro("MaxLines")]
+        usages = reader.find_macro_usage("MaxLines")
+        reader.close()
+        assert sorted(values) == ['250', '5'], f"Старые определения не удалены: {values}"
+        assert xpo_file.read_bytes()[usages[0]['file_position']:][:9] == b"#MaxLines", "Смещение не сдвинуто"
+    print("[XPOSQLiteIndexer] Макросы: определения, библиотеки MCR и разрешение ссылок")
+    
+    print("\n✓ Все тесты xpo_indexer_sqlite.py: макросы пройдены успешно!")
+    return True
+
+
 def main():
     """Запускает все тесты"""
     print("\n" + "=" * 60)
@@ -191,6 +1400,174 @@ def main():
         traceback.print_exc()
         all_passed = False
     
+    try:
+        all_passed &= test_xpo_writer_batch()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_writer_batch: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_writer_delta()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_writer_delta: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_writer_watch()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_writer_watch: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_writer_verify()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_writer_verify: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_validator()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_validator: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_indexer_update()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_indexer_update: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_indexer_methods()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_indexer_methods: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_indexer_method_bodies()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_indexer_method_bodies: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_indexer_workers()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_indexer_workers: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_indexer_labels()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_indexer_labels: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_indexer_class_hierarchy()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_indexer_class_hierarchy: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_index_health()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_index_health: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_indexer_blobs()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_indexer_blobs: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_indexer_sources()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_indexer_sources: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_reader_suggest_elements()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_reader_suggest_elements: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_indexer_table_schema()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_indexer_table_schema: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_iter_element_boundaries()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_iter_element_boundaries: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_export_diff()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_export_diff: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_indexer_signatures()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_indexer_signatures: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_indexer_field_refs()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_indexer_field_refs: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
+    try:
+        all_passed &= test_xpo_indexer_macros()
+    except Exception as e:
+        print(f"\n✗ Ошибка в test_xpo_indexer_macros: {e}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+    
     print("\n" + "=" * 60)
     if all_passed:
         print("✓ ВСЕ ТЕСТЫ ПРОЙДЕНЫ!")
@@ -7,35 +7,87 @@ Utils модуль для Dynamics AX X++ Development Assistant
 from .xpo_utils import (
     clean_xpo_code,
     format_code_for_xpo,
+    decode_xpo_bytes,
     extract_element_name,
     extract_methods,
     extract_properties,
     find_labels_in_text,
+    normalize_label_id,
+    extract_label_references,
     parse_xpo_element,
     find_xpo_elements,
     get_element_content,
+    index_source_spans,
+    mask_code_literals,
+    extract_variable_types,
+    extract_code_references,
+    extract_field_references,
+    extract_macros,
+    split_name_words,
+    name_humps,
+    name_trigrams,
+    parse_table_schema,
+    parse_method_signature,
     ELEMENT_PATTERNS,
     XPO_ELEMENT_PATTERN,
     SOURCE_PATTERN,
     PROPERTIES_PATTERN,
     LABEL_PATTERN,
     LABEL_PATTERN2,
+    LABEL_REFERENCE_PATTERN,
+)
+from .xpo_index_meta import (
+    sample_file_hash,
+    full_file_hash,
+    source_fingerprint,
+    write_index_meta,
+    read_index_meta,
+    check_source_freshness,
+)
+from .xpo_validator import (
+    XPOStructureValidator,
+    format_issue,
+    validate_xpo_file,
 )
 
 __all__ = [
     'clean_xpo_code',
     'format_code_for_xpo',
+    'decode_xpo_bytes',
     'extract_element_name',
     'extract_methods',
     'extract_properties',
     'find_labels_in_text',
+    'normalize_label_id',
+    'extract_label_references',
     'parse_xpo_element',
     'find_xpo_elements',
     'get_element_content',
+    'index_source_spans',
+    'mask_code_literals',
+    'extract_variable_types',
+    'extract_code_references',
+    'extract_field_references',
+    'extract_macros',
+    'split_name_words',
+    'name_humps',
+    'name_trigrams',
+    'parse_table_schema',
+    'parse_method_signature',
     'ELEMENT_PATTERNS',
     'XPO_ELEMENT_PATTERN',
     'SOURCE_PATTERN',
     'PROPERTIES_PATTERN',
     'LABEL_PATTERN',
     'LABEL_PATTERN2',
+    'LABEL_REFERENCE_PATTERN',
+    'sample_file_hash',
+    'full_file_hash',
+    'source_fingerprint',
+    'write_index_meta',
+    'read_index_meta',
+    'check_source_freshness',
+    'XPOStructureValidator',
+    'format_issue',
+    'validate_xpo_file',
 ]
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Метаданные SQLite индекса XPO: отпечаток исходного файла и проверка актуальности
+
+Индексатор записывает в таблицу index_meta размер, время изменения,
+выборочный и полный хэш XPO, из которого построен индекс. По ним можно
+за миллисекунды понять, что байтовые смещения индекса больше не
+соответствуют файлу, не читая файл целиком. Целиком файл читается только
+тогда, когда время изменения другое, а выборочный хэш совпал (например,
+XPO скопирован), — source_freshness_report сообщает, сколько байт ушло
+на полный хэш.
+"""
+import hashlib
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# Выборочный хэш: столько блоков, равномерно по файлу, включая начало и конец
+SAMPLE_BLOCKS = 16
+SAMPLE_BLOCK_SIZE = 4096
+
+# Кусок чтения для полного хэша
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sample_file_hash(file_path: str) -> str:
+    """
+    Считает sha1 размера файла и SAMPLE_BLOCKS блоков, разнесённых по файлу.
+
+    Читает не больше SAMPLE_BLOCKS * SAMPLE_BLOCK_SIZE байт, поэтому дёшев
+    даже для многогигабайтного экспорта.
+    """
+    size = os.path.getsize(file_path)
+    digest = hashlib.sha1(str(size).encode('ascii'))
+    with open(file_path, 'rb') as f:
+        last_block = max(size - SAMPLE_BLOCK_SIZE, 0)
+        for i in range(SAMPLE_BLOCKS):
+            f.seek(last_block * i // (SAMPLE_BLOCKS - 1))
+            digest.update(f.read(SAMPLE_BLOCK_SIZE))
+    return digest.hexdigest()
+
+
+def full_file_hash(file_path: str) -> str:
+    """Считает sha1 всего файла, читая его кусками"""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprint(file_path: str, with_full_hash: bool = True) -> Dict[str, str]:
+    """
+    Снимает отпечаток исходного XPO для index_meta
+
+    Args:
+        file_path: Путь к XPO файлу
+        with_full_hash: Считать ли sha1 всего файла
+
+    Returns:
+        Словарь source_path, source_size, source_mtime_ns, sample_hash
+        и (при with_full_hash) full_hash; значения — строки
+    """
+    stat = os.stat(file_path)
+    fingerprint = {
+        'source_path': str(Path(file_path).resolve()),
+        'source_size': str(stat.st_size),
+        'source_mtime_ns': str(stat.st_mtime_ns),
+        'sample_hash': sample_file_hash(file_path),
+    }
+    if with_full_hash:
+        fingerprint['full_hash'] = full_file_hash(file_path)
+    return fingerprint
+
+
+def write_index_meta(cursor: sqlite3.Cursor, meta: Dict[str, object]):
+    """Перезаписывает таблицу index_meta (ключ — значение)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS index_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+    cursor.execute("DELETE FROM index_meta")
+    cursor.executemany("INSERT INTO index_meta (key, value) VALUES (?, ?)",
+                       [(key, str(value)) for key, value in meta.items()])
+
+
+def read_index_meta(conn: sqlite3.Connection) -> Optional[Dict[str, str]]:
+    """Читает index_meta; None для индекса, построенного без метаданных"""
+    try:
+        rows = conn.execute("SELECT key, value FROM index_meta").fetchall()
+    except sqlite3.OperationalError:
+        return None
+    return {row[0]: row[1] for row in rows}
+
+
+def check_source_freshness(meta: Dict[str, str], xpo_file: str, deep: bool = False) -> List[str]:
+    """
+    Сравнивает метаданные индекса с текущим XPO файлом
+
+    Args:
+        meta: Метаданные из read_index_meta
+        xpo_file: Путь к текущему XPO файлу
+        deep: Всегда сверять полный хэш файла
+
+    Returns:
+        Список расхождений (пустой, если индекс соответствует файлу)
+    """
+    return source_freshness_report(meta, xpo_file, deep=deep)[0]
+
+
+def source_freshness_report(meta: Dict[str, str], xpo_file: str, deep: bool = False) -> Tuple[List[str], int]:
+    """
+    Сравнивает метаданные индекса с текущим XPO файлом и сообщает цену проверки
+
+    Если размер и время изменения совпадают, файл не читается. Если
+    изменилось только время, сначала сверяется выборочный хэш
+    (SAMPLE_BLOCKS блоков): его несовпадение сразу означает устаревший
+    индекс. Совпадение ещё ничего не доказывает (правка того же размера вне
+    выборки), поэтому только тогда файл читается целиком и признаётся
+    прежним по полному хэшу — так копирование файла не делает индекс
+    устаревшим. deep — всегда сверять полный хэш.
+
+    Args:
+        meta: Метаданные из read_index_meta
+        xpo_file: Путь к текущему XPO файлу
+        deep: Всегда сверять полный хэш файла
+
+    Returns:
+        (список расхождений, сколько байт XPO прочитано ради полного хэша)
+    """
+    try:
+        stat = os.stat(xpo_file)
+    except OSError:
+        return [f"XPO файл не найден: {xpo_file}"], 0
+
+    issues = []
+    if str(stat.st_size) != meta.get('source_size'):
+        issues.append(f"размер XPO изменился: {meta.get('source_size')} -> {stat.st_size} байт")
+        return issues, 0
+
+    full_hash_bytes = 0
+    if deep:
+        if 'full_hash' in meta:
+            full_hash_bytes = stat.st_size
+            if full_file_hash(xpo_file) != meta['full_hash']:
+                issues.append("полный хэш XPO не совпадает")
+    elif str(stat.st_mtime_ns) != meta.get('source_mtime_ns'):
+        if sample_file_hash(xpo_file) != meta.get('sample_hash'):
+            issues.append("XPO изменён после построения индекса (выборочный хэш не совпадает)")
+        elif 'full_hash' not in meta:
+            issues.append("время изменения XPO другое, а полного хэша в индексе нет")
+        else:
+            full_hash_bytes = stat.st_size
+            if full_file_hash(xpo_file) != meta['full_hash']:
+                issues.append("XPO изменён после построения индекса (полный хэш не совпадает)")
+    return issues, full_hash_bytes
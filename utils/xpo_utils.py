@@ -4,8 +4,9 @@
 Общие утилиты для работы с XPO файлами Dynamics AX
 """
 import re
+import textwrap
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 
 # Регулярные выражения для типов элементов
@@ -34,24 +35,106 @@ PROPERTIES_PATTERN = re.compile(r'PROPERTIES(.*?)ENDPROPERTIES', re.DOTALL)
 # Паттерн для извлечения Extends
 EXTENDS_PATTERN = re.compile(r'Extends\s+#(\w+)')
 
+# Строка-ключевое слово структуры XPO: "METHODS", "CONTROL BUTTON", "CLASS #Name"
+BLOCK_LINE_PATTERN = re.compile(r'^([A-Z][A-Z_]*)(?:\s+[A-Z][A-Z_]*)?(?:\s+#(\S+))?\s*$')
+
+# Строка SOURCE #<имя метода>
+SOURCE_LINE_PATTERN = re.compile(r'^SOURCE\s+#(\w+)')
+
+# Строка ENDSOURCE (поиск конца тела метода без разбора строк кода)
+ENDSOURCE_LINE_PATTERN = re.compile(r'^[^\S\n]*ENDSOURCE[^\S\n]*$', re.MULTILINE)
+
+# Свойство Name внутри PROPERTIES
+NAME_PROPERTY_PATTERN = re.compile(r'^Name\s+#(\S+)')
+
+# Блоки, имя которых (из PROPERTIES) переходит к родителю при закрытии:
+# имя источника данных формы задаётся в OBJECTPOOL, а методы лежат в DATASOURCE
+NAME_INHERITING_BLOCKS = {'OBJECTPOOL'}
+
+# Свойство внутри PROPERTIES: "CacheLookup         #Found" (значение может быть пустым)
+PROPERTY_LINE_PATTERN = re.compile(r'^(\w+)\s+#(.*)$')
+
+# Префикс строки кода XPO: пробельные символы (кроме перевода строки) и '#'
+CODE_LINE_PREFIX_PATTERN = re.compile(r'^[^\S\n]*#', re.MULTILINE)
+
+# Комментарии и строковые литералы X++ (маскируются перед поиском ссылок)
+CODE_LITERAL_PATTERN = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL)
+
+# Ссылки в коде X++ за один проход: new X(), tableNum(X), classNum(X), X::m(), obj.m()
+CODE_REFERENCE_PATTERN = re.compile(
+    r'\b(?:new\s+(?P<new>\w+)\s*\('
+    r'|(?P<num>(?i:tableNum|classNum))\s*\(\s*(?P<num_target>\w+)\s*\)'
+    r'|(?P<receiver>\w+)\s*(?P<op>::|\.)\s*(?P<method>\w+)\s*\()'
+)
+
+# Обращение к полю после buffer: ".Field" (не вызов метода); присваивание
+# после поля — запись. Шаблон начинается с '.', поэтому поиск быстрый,
+# а buffer перед точкой читается вручную
+FIELD_ACCESS_PATTERN = re.compile(r'\.(?P<field>[A-Za-z_]\w*)\b(?!\s*\()(?P<write>\s*(?:[-+*/]?=(?!=)|\+\+|--))?')
+
+# fieldNum(T, F) и fieldStr(T, F)
+FIELD_FUNCTION_PATTERN = re.compile(r'(?i:field(?P<kind>num|str))\s*\(\s*(?P<table>\w+)\s*,\s*(?P<field>\w+)\s*\)')
+
+# Объявление переменной или параметра: "<Тип> <имя>" перед '=', ';', ',' или ')'
+DECLARATION_PATTERN = re.compile(r'\b([A-Za-z_]\w*)\s+([A-Za-z_]\w*)\s*(?=[=;,)])')
+
+# Директивы макросов (#define.Имя(...)) — не вызовы методов
+MACRO_DIRECTIVES = frozenset({
+    'define', 'globaldefine', 'localmacro', 'globalmacro', 'undef', 'if', 'ifnot',
+    'macrolib', 'defdec', 'definc',
+})
+
+# Макрос в коде: #Имя или #директива.Имя (префикс строки XPO '#' заранее убран)
+MACRO_PATTERN = re.compile(r'#(?P<name>[A-Za-z_]\w*)(?:\.(?P<target>[A-Za-z_]\w*))?')
+
+# Конец многострочного макроса #localmacro/#globalmacro
+MACRO_END_PATTERN = re.compile(r'#endmacro\b', re.IGNORECASE)
+
+# Строка кода, где кроме префикса XPO есть ещё '#', — возможен макрос
+MACRO_LINE_PATTERN = re.compile(r'#[^\n]*#')
+
+# Слова, которые стоят на месте типа, но типом не являются
+NON_TYPE_KEYWORDS = frozenset({
+    'return', 'new', 'print', 'throw', 'case', 'else', 'select', 'firstonly', 'firstfast',
+    'forupdate', 'nofetch', 'where', 'join', 'exists', 'notexists', 'outer', 'in', 'is', 'as',
+    'next', 'delete_from', 'update_recordset', 'insert_recordset', 'setting', 'order', 'group',
+    'by', 'asc', 'desc', 'index', 'hint', 'crosscompany', 'pause', 'window', 'breakpoint',
+})
+
+# Модификаторы в объявлении метода X++ (всё остальное перед именем — тип результата)
+METHOD_MODIFIERS = frozenset({
+    'public', 'private', 'protected', 'static', 'final', 'abstract', 'server', 'client',
+    'display', 'edit', 'delegate',
+})
+
+# Объявление метода: "<модификаторы> <тип> <имя>(<параметры>)" до открывающей '{'
+METHOD_DECLARATION_PATTERN = re.compile(r'\s*(?P<head>[\w\s]*?)\b(?P<name>\w+)\s*\((?P<params>.*)\)\s*$', re.DOTALL)
+
+# Атрибуты X++ 2012 перед объявлением: [SysEntryPointAttribute(true)]
+METHOD_ATTRIBUTES_PATTERN = re.compile(r'\s*(?:\[[^\]]*\]\s*)+')
+
+# Параметр: "<тип> <имя>" и необязательное "= <значение по умолчанию>"
+METHOD_PARAMETER_PATTERN = re.compile(r'\s*(?P<type>\w[\w\s]*?)\s+(?P<name>\w+)\s*(?:=(?P<default>.*))?$', re.DOTALL)
+
 # Паттерн для поиска меток @MIK
 LABEL_PATTERN = re.compile(r'@MIK(\d+)')
 
 # Паттерн для поиска Label #@MIK
 LABEL_PATTERN2 = re.compile(r'Label\s+#@MIK(\d+)')
 
+# Ссылка на метку любого из используемых файлов меток: @MIK123, @SYS123...
+LABEL_REFERENCE_PATTERN = re.compile(r'@(MIK|SYS|GMS|KOR)(\d+)', re.IGNORECASE)
+
+# Слово CamelCase имени: аббревиатура (PDS в CustVendPDSManager), слово или число
+NAME_WORD_PATTERN = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+
 
 def clean_xpo_code(code: str) -> str:
     """
     Очищает код XPO: удаляет префикс "пробелы/табы + #" в начале каждой строки.
     Отступы после # (пробелы или табы) сохраняются — структура вложенности не меняется.
     """
-    lines = code.split('\n')
-    cleaned_lines = []
-    for line in lines:
-        cleaned = re.sub(r'^\s*#', '', line)
-        cleaned_lines.append(cleaned)
-    return '\n'.join(cleaned_lines).strip()
+    return CODE_LINE_PREFIX_PATTERN.sub('', code).strip()
 
 
 def format_code_for_xpo(code: str, indent: str = '    ') -> str:
@@ -77,6 +160,18 @@ def format_code_for_xpo(code: str, indent: str = '    ') -> str:
     return '\n'.join(formatted_lines)
 
 
+def decode_xpo_bytes(data: bytes) -> str:
+    """
+    Декодирует байты XPO: сначала UTF-8 (с BOM или без), затем cp1251.
+    Переводы строк приводятся к '\n', как при чтении в текстовом режиме.
+    """
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        text = data.decode('cp1251', errors='replace')
+    return text.replace('\r\n', '\n')
+
+
 def extract_element_name(element_type: str, content: str) -> Optional[str]:
     """
     Извлекает имя элемента из его содержимого
@@ -176,6 +271,327 @@ def find_labels_in_text(text: str) -> List[str]:
     return sorted(labels)
 
 
+def normalize_label_id(label_id: str) -> str:
+    """
+    Приводит ID метки к виду MIK4140
+    
+    Принимает "@MIK4140", "mik4140" или просто "4140" (тогда считается @MIK).
+    """
+    label_id = label_id.strip().lstrip('@').upper()
+    if label_id.isdigit():
+        label_id = f"MIK{label_id}"
+    return label_id
+
+
+def extract_label_references(text: str) -> List[Tuple[str, int]]:
+    """
+    Находит все ссылки на метки @MIK/@SYS/@GMS/@KOR
+    
+    Args:
+        text: Текст элемента или метода
+        
+    Returns:
+        Список (ID метки вида MIK4140, смещение '@' в text)
+    """
+    return [(match.group(1).upper() + match.group(2), match.start())
+            for match in LABEL_REFERENCE_PATTERN.finditer(text)]
+
+
+def split_name_words(name: str) -> List[str]:
+    """
+    Разбивает имя элемента на слова по CamelCase и подчёркиваниям
+    
+    RabbitIntEngineImp_Infor_Shipped -> Rabbit, Int, Engine, Imp, Infor, Shipped
+    """
+    return NAME_WORD_PATTERN.findall(name)
+
+
+def name_humps(name: str) -> str:
+    """Первые буквы слов имени в верхнем регистре (RabbitIntEngineImp_Infor_Shipped -> RIEIIS)"""
+    return ''.join(word[0] for word in split_name_words(name)).upper()
+
+
+def name_trigrams(name: str) -> Set[str]:
+    """
+    Триграммы имени без учёта регистра для нечёткого поиска
+    
+    Имя дополняется пробелами (два в начале, один в конце), как в
+    pg_trgm, поэтому совпадение начала имени весит больше.
+    """
+    padded = f"  {name.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def mask_code_literals(code: str) -> str:
+    """
+    Заменяет комментарии и строковые литералы X++ пробелами.
+    Длина текста и переводы строк сохраняются, поэтому смещения не меняются.
+    """
+    if '/' not in code and '"' not in code and "'" not in code:
+        return code
+    return CODE_LITERAL_PATTERN.sub(_blank_literal, code)
+
+
+def _blank_literal(match) -> str:
+    literal = match.group(0)
+    if '\n' not in literal:
+        return ' ' * len(literal)
+    return re.sub(r'[^\n]', ' ', literal)
+
+
+def extract_variable_types(code: str) -> Dict[str, str]:
+    """
+    Находит объявленные типы переменных и параметров метода
+    
+    Args:
+        code: Код метода (комментарии и строки лучше замаскировать)
+        
+    Returns:
+        Словарь {имя переменной в нижнем регистре: тип}
+    """
+    types = {}
+    for match in DECLARATION_PATTERN.finditer(code):
+        type_name, variable = match.group(1), match.group(2)
+        if type_name.lower() in NON_TYPE_KEYWORDS or variable.lower() in NON_TYPE_KEYWORDS:
+            continue
+        types.setdefault(variable.lower(), type_name)
+    return types
+
+
+def extract_code_references(code: str, own_element: Optional[str] = None,
+                            declared_types: Optional[Dict[str, str]] = None) -> List[Tuple[str, Optional[str], Optional[str], int]]:
+    """
+    Находит ссылки на другие элементы в коде метода
+    
+    Виды ссылок: 'new' (new X()), 'static' (X::m()), 'call' (obj.m()),
+    'tablenum' (tableNum(X)), 'classnum' (classNum(X)). Для вызова obj.m()
+    тип obj берётся из объявлений метода, затем из declared_types
+    (переменные classDeclaration); this — сам элемент; иначе цель неизвестна.
+    
+    Args:
+        code: Код метода (можно с префиксами '#')
+        own_element: Имя элемента, которому принадлежит метод
+        declared_types: Дополнительные типы переменных {имя в нижнем регистре: тип}
+        
+    Returns:
+        Список (вид, целевой элемент или None, целевой метод или None, смещение в code)
+    """
+    masked = mask_code_literals(code)
+    types = dict(declared_types or {})
+    types.update(extract_variable_types(masked))
+    if own_element:
+        types['this'] = own_element
+    
+    references = []
+    for match in CODE_REFERENCE_PATTERN.finditer(masked):
+        target = match.group('new')
+        if target:
+            references.append(('new', target, 'new', match.start()))
+            continue
+        kind = match.group('num')
+        if kind:
+            references.append((kind.lower(), match.group('num_target'), None, match.start()))
+            continue
+        receiver = match.group('receiver')
+        if match.group('op') == '::':
+            references.append(('static', receiver, match.group('method'), match.start()))
+            continue
+        receiver = receiver.lower()
+        if receiver in MACRO_DIRECTIVES and masked[match.start() - 1:match.start()] == '#':
+            continue
+        references.append(('call', types.get(receiver), match.group('method'), match.start()))
+    
+    return references
+
+
+def extract_field_references(code: str, own_element: Optional[str] = None,
+                             declared_types: Optional[Dict[str, str]] = None) -> List[Tuple[Optional[str], str, str, int]]:
+    """
+    Находит обращения к полям таблиц в коде метода
+    
+    Виды: 'read' и 'write' (buffer.Field; запись — присваивание, +=, ++),
+    'fieldnum' и 'fieldstr' (fieldNum(T, F), fieldStr(T, F)). Таблица
+    buffer берётся из объявлений метода, затем из declared_types; this —
+    сам элемент; иначе таблица неизвестна.
+    
+    Args:
+        code: Код метода (можно с префиксами '#')
+        own_element: Имя элемента, которому принадлежит метод
+        declared_types: Дополнительные типы переменных {имя в нижнем регистре: тип}
+        
+    Returns:
+        Список (таблица или None, поле, вид, смещение в code)
+    """
+    masked = mask_code_literals(code)
+    references = []
+    
+    accesses = []
+    for match in FIELD_ACCESS_PATTERN.finditer(masked):
+        end = match.start()
+        start = end
+        while start and (masked[start - 1].isalnum() or masked[start - 1] == '_'):
+            start -= 1
+        # Пропускаем числа (1.5), цепочки (a.b.c) и макросы (#define.X)
+        if start == end or masked[start].isdigit() or (start and masked[start - 1] in '.#'):
+            continue
+        accesses.append((masked[start:end].lower(), match.group('field'),
+                         'write' if match.group('write') else 'read', start))
+    
+    if accesses:
+        types = dict(declared_types or {})
+        types.update(extract_variable_types(masked))
+        if own_element:
+            types['this'] = own_element
+        references.extend((types.get(buffer), field, kind, offset) for buffer, field, kind, offset in accesses)
+    
+    if 'field' in masked.lower():
+        for match in FIELD_FUNCTION_PATTERN.finditer(masked):
+            if match.start() and (masked[match.start() - 1].isalnum() or masked[match.start() - 1] == '_'):
+                continue
+            references.append((match.group('table'), match.group('field'), 'field' + match.group('kind').lower(),
+                               match.start()))
+        references.sort(key=lambda reference: reference[3])
+    
+    return references
+
+
+def extract_macros(code: str) -> Tuple[List[Tuple[str, str, Optional[str], int]], List[Tuple[str, int]]]:
+    """
+    Находит определения и использования макросов в коде метода
+    
+    Определения: #define.Имя(значение) и #globaldefine (вид 'define'),
+    #localmacro.Имя ... #endmacro и #globalmacro (вид 'localmacro').
+    Использования: #Имя (в том числе библиотеки MCR и макросы с
+    параметрами #Имя(...)) и цели директив #if/#ifnot/#undef/#macrolib.
+    Комментарии и строки пропускаются, значения берутся из исходного текста.
+    
+    Args:
+        code: Код метода (можно с префиксами '#')
+        
+    Returns:
+        (определения [(имя, вид, значение или None, смещение)],
+         использования [(имя, смещение)]); смещение — позиция '#' в code
+    """
+    # В коде с префиксами XPO макрос возможен только в строке со вторым '#'
+    if '#' not in code or (CODE_LINE_PREFIX_PATTERN.match(code) and not MACRO_LINE_PATTERN.search(code)):
+        return [], []
+    # Префиксы строк XPO заменяются пробелами — смещения не меняются
+    text = CODE_LINE_PREFIX_PATTERN.sub(_blank_literal, code)
+    masked = mask_code_literals(text)
+    
+    definitions = []
+    usages = []
+    for match in MACRO_PATTERN.finditer(masked):
+        name = match.group('name')
+        target = match.group('target')
+        directive = name.lower()
+        if directive in ('define', 'globaldefine') and target:
+            value = None
+            rest = match.end()
+            if masked[rest:rest + 1] == '(':
+                depth = 0
+                for pos in range(rest, len(masked)):
+                    if masked[pos] == '(':
+                        depth += 1
+                    elif masked[pos] == ')':
+                        depth -= 1
+                        if depth == 0:
+                            value = text[rest + 1:pos]
+                            break
+            definitions.append((target, 'define', value, match.start()))
+        elif directive in ('localmacro', 'globalmacro') and target:
+            body_start = masked.find('\n', match.end())
+            end_match = MACRO_END_PATTERN.search(masked, match.end())
+            body_end = end_match.start() if end_match else len(masked)
+            value = text[body_start + 1:body_end] if 0 <= body_start < body_end else ''
+            definitions.append((target, 'localmacro', textwrap.dedent(value).strip(), match.start()))
+        elif directive in MACRO_DIRECTIVES or directive in ('endmacro', 'endif'):
+            if target:
+                usages.append((target, match.start()))
+        else:
+            usages.append((name, match.start()))
+    
+    return definitions, usages
+
+
+def parse_method_signature(code: str) -> Optional[Dict]:
+    """
+    Разбирает объявление метода X++ (текст до первой '{')
+    
+    Комментарии и строки перед объявлением маскируются, атрибуты
+    [Attr(...)] пропускаются; значения по умолчанию берутся из исходного
+    текста, поэтому строковые литералы в них сохраняются.
+    
+    Args:
+        code: Код метода (можно с префиксами '#')
+        
+    Returns:
+        Словарь name, modifiers (в нижнем регистре, в порядке объявления),
+        return_type (None, если тип не указан) и parameters — список
+        {name, type, default}; None, если объявления нет (classDeclaration,
+        макросы)
+    """
+    # Первая '{' вне комментариев и строк; префиксы '#' заменяются пробелами,
+    # чтобы смещения в исходном и замаскированном тексте совпадали
+    pos = code.find('{')
+    while pos >= 0:
+        line_end = code.find('\n', pos)
+        text = CODE_LINE_PREFIX_PATTERN.sub(_blank_literal, code[:line_end if line_end >= 0 else len(code)])
+        masked = mask_code_literals(text)
+        if masked[pos] == '{':
+            break
+        pos = code.find('{', pos + 1)
+    else:
+        return None
+    text, masked = text[:pos], masked[:pos]
+    
+    attributes = METHOD_ATTRIBUTES_PATTERN.match(masked)
+    offset = attributes.end() if attributes else 0
+    match = METHOD_DECLARATION_PATTERN.match(masked, offset)
+    if not match:
+        return None
+    
+    modifiers = []
+    type_words = []
+    for word in match.group('head').split():
+        if word.lower() in METHOD_MODIFIERS and not type_words:
+            modifiers.append(word.lower())
+        else:
+            type_words.append(word)
+    
+    # Параметры делим по запятым верхнего уровня: в значениях по умолчанию
+    # бывают вызовы и контейнеры
+    parameters = []
+    depth = 0
+    start = match.start('params')
+    end = match.end('params')
+    for pos in range(start, end + 1):
+        char = masked[pos] if pos < end else ','
+        if char in '([{':
+            depth += 1
+        elif char in ')]}':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parameter = METHOD_PARAMETER_PATTERN.match(masked[start:pos])
+            if parameter:
+                default = None
+                if parameter.group('default') is not None:
+                    default = text[start + parameter.start('default'):pos].strip()
+                parameters.append({
+                    'name': parameter.group('name'),
+                    'type': ' '.join(parameter.group('type').split()),
+                    'default': default,
+                })
+            start = pos + 1
+    
+    return {
+        'name': match.group('name'),
+        'modifiers': modifiers,
+        'return_type': ' '.join(type_words) or None,
+        'parameters': parameters,
+    }
+
+
 def parse_xpo_element(content: str, element_type: str) -> Optional[Dict]:
     """
     Парсит элемент XPO и возвращает его структурированное представление
@@ -232,4 +648,189 @@ def get_element_content(content: str, element_match) -> str:
     Returns:
         Содержимое элемента
     """
-    return content[element_match.start():element_match.end()]
\ No newline at end of file
+    return content[element_match.start():element_match.end()]
+
+
+def parse_table_schema(content: str) -> Dict:
+    """
+    Разбирает структуру таблицы (TAB) из XPO: свойства, поля, индексы и связи
+    
+    Читаются блоки до METHODS: PROPERTIES таблицы, FIELDS, INDICES и
+    REFERENCES; группы полей, полнотекстовые индексы и DeleteActions
+    пропускаются.
+    
+    Args:
+        content: Содержимое элемента TAB
+        
+    Returns:
+        Словарь properties ({свойство: значение}), fields (name, field_type,
+        properties), indexes (name, properties, fields в порядке индекса) и
+        relations (name, properties, links: type, properties)
+    """
+    schema = {'properties': {}, 'fields': [], 'indexes': [], 'relations': []}
+    section = None      # FIELDS / INDICES / REFERENCES / прочий блок таблицы
+    properties = None   # словарь, в который пишутся строки текущего PROPERTIES
+    field = index = relation = link = None
+    in_index_fields = False
+    
+    for line in content.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        
+        if properties is not None:
+            if stripped == 'ENDPROPERTIES':
+                properties = None
+            else:
+                property_match = PROPERTY_LINE_PATTERN.match(stripped)
+                if property_match:
+                    properties[property_match.group(1)] = property_match.group(2).strip()
+            continue
+        
+        if stripped == 'PROPERTIES':
+            if section is None:
+                properties = schema['properties']
+            elif section == 'FIELDS' and field:
+                properties = field['properties']
+            elif section == 'INDICES' and index:
+                properties = index['properties']
+            elif section == 'REFERENCES' and link:
+                properties = link['properties']
+            elif section == 'REFERENCES' and relation:
+                properties = relation['properties']
+            else:
+                properties = {}
+            continue
+        
+        keyword, _, name = stripped.partition(' ')
+        name = name.strip().lstrip('#')
+        if section is None:
+            if keyword == 'METHODS':
+                break
+            if keyword in ('FIELDS', 'INDICES', 'REFERENCES', 'GROUPS', 'FULLTEXTINDICES', 'DELETEACTIONS'):
+                section = keyword
+        elif keyword == 'END' + section:
+            section = None
+            field = index = relation = link = None
+        elif section == 'FIELDS':
+            if keyword == 'FIELD':
+                field = {'name': name, 'field_type': None, 'properties': {}}
+                schema['fields'].append(field)
+            elif field and field['field_type'] is None and stripped.isupper():
+                # Строка после FIELD #Имя — базовый тип: STRING, ENUM, INT, REAL...
+                field['field_type'] = stripped
+        elif section == 'INDICES':
+            if stripped == 'INDEXFIELDS':
+                in_index_fields = True
+            elif stripped == 'ENDINDEXFIELDS':
+                in_index_fields = False
+            elif stripped.startswith('#'):
+                if in_index_fields:
+                    if index:
+                        index['fields'].append(stripped[1:].strip())
+                else:
+                    index = {'name': stripped[1:].strip(), 'properties': {}, 'fields': []}
+                    schema['indexes'].append(index)
+        elif section == 'REFERENCES':
+            if keyword == 'REFERENCE':
+                relation = {'name': name, 'properties': {}, 'links': []}
+                link = None
+                schema['relations'].append(relation)
+            elif keyword == 'REFERENCETYPE' and relation:
+                link = {'type': name, 'properties': {}}
+                relation['links'].append(link)
+            elif keyword == 'ENDREFERENCE':
+                relation = link = None
+    
+    return schema
+
+
+def index_source_spans(content: str) -> Dict[str, Dict]:
+    """
+    Строит за один проход таблицу всех блоков SOURCE...ENDSOURCE элемента.
+    
+    Ключ — путь блока внутри элемента: имена вложенных именованных блоков
+    (источник данных, контрол и т.п.) и имя метода через '/'. Методы самого
+    элемента (класса, таблицы, формы, job) имеют путь, равный имени метода,
+    например 'run', метод источника данных формы — 'SalesTable/init'.
+    Повторяющиеся пути получают суффикс '[2]', '[3]', ...
+    
+    Args:
+        content: Содержимое элемента
+        
+    Returns:
+        Словарь {путь: span} в порядке следования блоков, где span содержит
+        name, start (позиция слова SOURCE), end (позиция после ENDSOURCE),
+        body_start/body_end (строки кода) и endsource_indent
+    """
+    spans = {}
+    scopes = []  # [ключевое слово, имя]
+    source = None
+    in_properties = False
+    
+    line_start = 0
+    content_len = len(content)
+    while line_start < content_len:
+        line_end = content.find('\n', line_start)
+        next_line = content_len if line_end < 0 else line_end + 1
+        line = content[line_start:next_line]
+        stripped = line.strip()
+        indent_len = len(line) - len(line.lstrip())
+        
+        if source is not None:
+            # Внутри SOURCE интересует только ENDSOURCE
+            if stripped == 'ENDSOURCE':
+                source['body_end'] = line_start
+                source['end'] = line_start + indent_len + len('ENDSOURCE')
+                source['endsource_indent'] = line[:indent_len]
+                path = source['path']
+                if path in spans:
+                    suffix = 2
+                    while f"{path}[{suffix}]" in spans:
+                        suffix += 1
+                    path = f"{path}[{suffix}]"
+                    source['path'] = path
+                spans[path] = source
+                source = None
+        elif in_properties:
+            if stripped == 'ENDPROPERTIES':
+                in_properties = False
+            else:
+                name_match = NAME_PROPERTY_PATTERN.match(stripped)
+                if name_match and scopes and scopes[-1][1] is None:
+                    scopes[-1][1] = name_match.group(1)
+        else:
+            source_match = SOURCE_LINE_PATTERN.match(stripped)
+            block_match = BLOCK_LINE_PATTERN.match(stripped)
+            if source_match:
+                method_name = source_match.group(1)
+                # Корневой блок (CLASS/FORM/TABLE...) в путь не входит
+                segments = [name for _, name in scopes[1:] if name]
+                source = {
+                    'path': '/'.join(segments + [method_name]),
+                    'name': method_name,
+                    'start': line_start + indent_len,
+                    'body_start': next_line,
+                }
+                # Строки кода не разбираем: сразу переходим к строке ENDSOURCE
+                end_match = ENDSOURCE_LINE_PATTERN.search(content, next_line)
+                next_line = end_match.start() if end_match else content_len
+            elif stripped == 'PROPERTIES':
+                in_properties = True
+            elif block_match:
+                keyword = block_match.group(1)
+                if keyword.startswith('END') and any(k == keyword[3:] for k, _ in scopes):
+                    # Закрываем блок (и незакрытые вложенные блоки)
+                    while scopes:
+                        closed_keyword, closed_name = scopes.pop()
+                        if closed_keyword == keyword[3:]:
+                            break
+                    if (closed_keyword in NAME_INHERITING_BLOCKS and closed_name
+                            and scopes and scopes[-1][1] is None):
+                        scopes[-1][1] = closed_name
+                elif not keyword.startswith('END'):
+                    scopes.append([keyword, block_match.group(2)])
+        
+        line_start = next_line
+    
+    return spans
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Однопроходная проверка структуры XPO файлов Dynamics AX
+
+Валидатор работает как конечный автомат по байтам: данные подаются
+кусками через feed() (например, по мере записи файла), а каждая
+найденная проблема содержит точный номер строки и байтовое смещение.
+"""
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# Заголовок, с которого начинается любой экспорт AOT
+XPO_HEADER = b'Exportfile for AOT'
+
+# Маркер начала элемента и завершающий элемент файла
+ELEMENT_MARKER = b'***Element:'
+END_ELEMENT_TYPE = b'END'
+
+# Блоки, вложенность которых проверяется
+BLOCK_KEYWORDS = {
+    b'PROPERTIES': b'ENDPROPERTIES',
+    b'METHODS': b'ENDMETHODS',
+    b'SOURCE': b'ENDSOURCE',
+}
+CLOSING_KEYWORDS = {end: start for start, end in BLOCK_KEYWORDS.items()}
+
+# Строка SOURCE #<имя метода>
+SOURCE_LINE_PATTERN = re.compile(rb'SOURCE\s+#\w+')
+
+UTF8_BOM = b'\xef\xbb\xbf'
+
+# Размер куска при чтении файла с диска
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class XPOStructureValidator:
+    """
+    Потоковый валидатор структуры XPO.
+
+    Проверяет заголовок файла, заголовки элементов, вложенность
+    PROPERTIES/METHODS/SOURCE и наличие завершающего `***Element: END`.
+    """
+
+    def __init__(self):
+        self.issues: List[Dict] = []
+        self._pending = b''
+        self._offset = 0          # байтовое смещение начала _pending
+        self._line_no = 0
+        self._stack: List[Tuple[bytes, int, int]] = []  # (блок, строка, смещение)
+        self._in_element = False
+        self._end_seen = False
+        self._trailing_reported = False
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.issues
+
+    def feed(self, data: bytes):
+        """Передаёт очередной кусок байтов XPO в валидатор."""
+        self._pending += data
+        line_start = 0
+        while True:
+            line_end = self._pending.find(b'\n', line_start)
+            if line_end < 0:
+                break
+            self._process_line(self._pending[line_start:line_end + 1], self._offset + line_start)
+            line_start = line_end + 1
+        self._pending = self._pending[line_start:]
+        self._offset += line_start
+
+    def finish(self) -> List[Dict]:
+        """Завершает проверку и возвращает список найденных проблем."""
+        if self._pending:
+            self._process_line(self._pending, self._offset)
+            self._offset += len(self._pending)
+            self._pending = b''
+
+        if self._line_no == 0:
+            self._add_issue(1, 0, "пустой файл")
+            return self.issues
+
+        self._report_unclosed("конец файла")
+
+        if not self._end_seen:
+            self._add_issue(self._line_no, self._offset, "нет завершающего '***Element: END'")
+
+        return self.issues
+
+    def _add_issue(self, line: int, offset: int, message: str):
+        self.issues.append({'line': line, 'offset': offset, 'message': message})
+
+    def _report_unclosed(self, where: str):
+        """Сообщает обо всех незакрытых блоках и очищает стек."""
+        for keyword, line, offset in reversed(self._stack):
+            self._add_issue(line, offset, f"блок {keyword.decode()} не закрыт до: {where}")
+        self._stack.clear()
+
+    def _process_line(self, raw_line: bytes, offset: int):
+        self._line_no += 1
+        line = raw_line.rstrip(b'\r\n')
+
+        if self._line_no == 1:
+            if line.startswith(UTF8_BOM):
+                line = line[len(UTF8_BOM):]
+            if not line.startswith(XPO_HEADER):
+                self._add_issue(1, offset, "нет заголовка 'Exportfile for AOT'")
+
+        stripped = line.strip()
+        if not stripped:
+            return
+
+        if self._end_seen:
+            if not self._trailing_reported:
+                self._add_issue(self._line_no, offset, "данные после '***Element: END'")
+                self._trailing_reported = True
+            return
+
+        if stripped.startswith(ELEMENT_MARKER):
+            self._process_element_header(stripped, offset)
+            return
+
+        # Внутри SOURCE строки кода начинаются с '#'; кроме ENDSOURCE
+        # структурные ключевые слова там появиться не должны.
+        if self._stack and self._stack[-1][0] == b'SOURCE':
+            if stripped == b'ENDSOURCE':
+                self._stack.pop()
+                return
+            if stripped.startswith(b'#') or not self._keyword_of(stripped):
+                return
+            _, line_no, source_offset = self._stack.pop()
+            self._add_issue(line_no, source_offset, "блок SOURCE не закрыт ENDSOURCE")
+
+        keyword = self._keyword_of(stripped)
+        if not keyword:
+            return
+
+        if not self._in_element:
+            self._add_issue(self._line_no, offset, f"{keyword.decode()} вне элемента")
+            return
+
+        if keyword in BLOCK_KEYWORDS:
+            self._stack.append((keyword, self._line_no, offset))
+            return
+
+        self._process_closing(keyword, offset)
+
+    def _process_element_header(self, stripped: bytes, offset: int):
+        element_type = stripped[len(ELEMENT_MARKER):].strip()
+        if not re.fullmatch(rb'\w+', element_type):
+            self._add_issue(self._line_no, offset, "некорректный заголовок элемента")
+
+        self._report_unclosed(f"заголовка элемента в строке {self._line_no}")
+
+        if element_type == END_ELEMENT_TYPE:
+            self._end_seen = True
+            self._in_element = False
+        else:
+            self._in_element = True
+
+    def _process_closing(self, keyword: bytes, offset: int):
+        opening = CLOSING_KEYWORDS[keyword]
+        if self._stack and self._stack[-1][0] == opening:
+            self._stack.pop()
+            return
+
+        if any(block == opening for block, _, _ in self._stack):
+            # Закрываем вложенные блоки, которые забыли закрыть
+            while self._stack[-1][0] != opening:
+                block, line_no, block_offset = self._stack.pop()
+                self._add_issue(line_no, block_offset,
+                                f"блок {block.decode()} не закрыт до {keyword.decode()}")
+            self._stack.pop()
+            return
+
+        self._add_issue(self._line_no, offset, f"{keyword.decode()} без открывающего {opening.decode()}")
+
+    @staticmethod
+    def _keyword_of(stripped: bytes) -> Optional[bytes]:
+        """Возвращает структурное ключевое слово строки или None."""
+        if stripped in BLOCK_KEYWORDS or stripped in CLOSING_KEYWORDS:
+            return stripped if stripped != b'SOURCE' else None
+        if SOURCE_LINE_PATTERN.match(stripped):
+            return b'SOURCE'
+        return None
+
+
+def format_issue(issue: Dict) -> str:
+    """Форматирует проблему для вывода в консоль."""
+    return f"строка {issue['line']}, байт {issue['offset']}: {issue['message']}"
+
+
+def validate_xpo_file(xpo_file: str) -> List[Dict]:
+    """
+    Проверяет структуру XPO файла, читая его кусками.
+
+    Args:
+        xpo_file: Путь к XPO файлу
+
+    Returns:
+        Список проблем (пустой, если структура корректна)
+    """
+    validator = XPOStructureValidator()
+    with open(xpo_file, 'rb') as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            validator.feed(chunk)
+    return validator.finish()
+
+
+def main():
+    """Проверка структуры XPO из консоли (проектные XPO, экспорты AOT_cus)"""
+    if len(sys.argv) < 2:
+        print("Использование: python utils/xpo_validator.py <файл.xpo> [<файл.xpo> ...]")
+        sys.exit(1)
+
+    has_issues = False
+    for xpo_file in sys.argv[1:]:
+        issues = validate_xpo_file(xpo_file)
+        if issues:
+            has_issues = True
+            print(f"{Path(xpo_file).name}: найдено проблем: {len(issues)}")
+            for issue in issues:
+                print(f"  {format_issue(issue)}")
+        else:
+            print(f"{Path(xpo_file).name}: OK")
+
+    sys.exit(1 if has_issues else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,10 +10,39 @@
 
 import re
 import os
+import io
+import sys
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import hashlib
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 from datetime import datetime
 
+from utils.xpo_utils import extract_element_name, find_xpo_elements, index_source_spans
+from utils.xpo_validator import XPOStructureValidator, format_issue
+
+
+# Размер куска при записи выходного XPO (валидация идёт по тем же кускам)
+WRITE_CHUNK_SIZE = 1024 * 1024
+
+# Пауза после последнего сохранения перед пересборкой в режиме --watch (сек)
+WATCH_DEBOUNCE = 0.3
+
+# Интервал опроса каталога, если inotify недоступен (сек)
+WATCH_POLL_INTERVAL = 0.5
+
+# Начало элемента в байтах XPO (для проверки roundtrip и индекса проектов)
+ELEMENT_BYTES_PATTERN = re.compile(rb'^\*\*\*Element:[ \t]*(\w+)', re.MULTILINE)
+
+# Сколько значимых строк после `***Element:` просматривать в поисках имени элемента
+ELEMENT_HEAD_LINES = 5
+
 
 class XPOWriter:
     """Записывает изменения из XPP‑файлов обратно в XPO."""
@@ -28,6 +57,10 @@ class XPOWriter:
         self.xpo_file_path = Path(xpo_file_path)
         self.parser_dir = Path(parser_dir)
         self.xpo_encoding = xpo_encoding
+        # Перевод строки исходного XPO (экспорт AX — CRLF), сохраняется в выходном файле
+        self.xpo_newline = os.linesep
+        # Методы, обновлённые последним вызовом write_back (для сводных отчётов)
+        self.updated_methods: List[str] = []
         
         if not self.xpo_file_path.exists():
             raise FileNotFoundError(f"XPO file not found: {xpo_file_path}")
@@ -35,35 +68,37 @@ class XPOWriter:
         if not self.parser_dir.exists():
             raise FileNotFoundError(f"Parser directory not found: {parser_dir}")
     
-    def write_back(self) -> Optional[Path]:
+    def write_back(self, delta: bool = False,
+                   elements: Optional[List[Tuple[str, str]]] = None) -> Optional[Path]:
         """
         Обновляет XPO‑файл по изменённым XPP‑методам из каталога parserXPO.
         
+        Args:
+            delta: записать только изменённые элементы (заголовок XPO,
+                изменённые элементы и `***Element: END`) в `<имя>_WR_delta.xpo`.
+            elements: пары (тип, имя) элементов parserXPO, которые нужно
+                записать (см. build_project_index); по умолчанию — все каталоги.
+        
         Returns:
-            Путь к созданному файлу `<имя>_WR.xpo` или None, если изменений нет.
+            Путь к созданному файлу `<имя>_WR.xpo` (`<имя>_WR_delta.xpo`)
+            или None, если изменений нет.
         """
         # Время модификации исходного XPO
         xpo_mtime = self.xpo_file_path.stat().st_mtime
         
-        # Определяем фактическую кодировку XPO:
-        # сначала пробуем UTF‑8, при ошибке откатываемся на CP1251.
-        try:
-            try:
-                with open(self.xpo_file_path, 'r', encoding='utf-8') as f:
-                    xpo_content = f.read()
-                self.xpo_encoding = 'utf-8'
-            except UnicodeDecodeError:
-                with open(self.xpo_file_path, 'r', encoding='cp1251') as f:
-                    xpo_content = f.read()
-                self.xpo_encoding = 'cp1251'
-        except FileNotFoundError:
-            raise
+        xpo_content = self._read_xpo()
+        self.updated_methods = []
         
         # Здесь будем накапливать новые версии элементов XPO
         element_replacements = {}  # element_key -> (element_info, updated_content)
         
         # Обходим подкаталоги в parserXPO (по одному на элемент)
-        for element_dir in self.parser_dir.iterdir():
+        if elements is not None:
+            element_dirs = [self.parser_dir / element_name for _, element_name in elements]
+        else:
+            element_dirs = self.parser_dir.iterdir()
+        
+        for element_dir in element_dirs:
             if not element_dir.is_dir():
                 continue
             
@@ -95,39 +130,14 @@ class XPOWriter:
                     'methods': []
                 }
             
-            # [removed corrupted comment]
-            for xpp_file in element_dir.glob("*.xpp"):
-                method_name = xpp_file.stem
-                
-                # Пропускаем методы, которые не новее исходного XPO
-                if not self._is_method_modified(xpp_file, xpo_mtime):
-                    continue
-                
-                # Читаем XPP‑код метода: сначала пробуем UTF‑8, затем CP1251
-                try:
-                    try:
-                        with open(xpp_file, 'r', encoding='utf-8') as f:
-                            method_code = f.read()
-                    except UnicodeDecodeError:
-                        with open(xpp_file, 'r', encoding='cp1251') as f:
-                            method_code = f.read()
-                except Exception as e:
-                    print(f"Ошибка чтения XPP‑файла {xpp_file}: {e}")
-                    continue
-                
-                # Пытаемся заменить блок SOURCE/ENDSOURCE на новый код
-                new_content = self._replace_source_in_content(
-                    element_replacements[element_key]['content'],
-                    method_name,
-                    method_code
-                )
-                
-                if new_content:
-                    element_replacements[element_key]['content'] = new_content
-                    element_replacements[element_key]['methods'].append(method_name)
-                else:
-                    # SOURCE для этого метода не найден в XPO
-                    print(f"Не удалось обновить метод {method_name} в элементе {element_type}:{element_name}.")
+            new_content, methods = self._apply_element_updates(
+                element_replacements[element_key]['content'],
+                element_dir,
+                element_type,
+                xpo_mtime
+            )
+            element_replacements[element_key]['content'] = new_content
+            element_replacements[element_key]['methods'].extend(methods)
         
         # Оставляем только элементы, для которых есть изменённые методы
         elements_with_updates = {
@@ -144,6 +154,7 @@ class XPOWriter:
                                      key=lambda x: x[0][0], reverse=True)
         
         updated_count = 0
+        original_content = xpo_content
         
         for element_key, replacement_data in sorted_replacements:
             element_info = replacement_data['info']
@@ -158,32 +169,299 @@ class XPOWriter:
             
             updated_count += len(methods)
             for method_name in methods:
+                self.updated_methods.append(f"{element_info['type']}:{element_info['name']}.{method_name}")
                 print(f"Обновлён метод {method_name} в элементе {element_info['type']}:{element_info['name']}.")
         
-        # Имя выходного файла: <оригинал>_WR.xpo в том же каталоге
-        output_file = self.xpo_file_path.parent / f"{self.xpo_file_path.stem}_WR.xpo"
+        if delta:
+            # Во delta‑файл попадают только изменённые элементы
+            xpo_content = self._build_delta_content(original_content, elements_with_updates)
         
-        # Сохраняем XPO в той же кодировке, что и исходный
-        with open(output_file, 'w', encoding=self.xpo_encoding, errors='ignore') as f:
-            f.write(xpo_content)
+        # Имя выходного файла: <оригинал>_WR.xpo (<оригинал>_WR_delta.xpo) в том же каталоге
+        suffix = "_WR_delta" if delta else "_WR"
+        output_file = self.xpo_file_path.parent / f"{self.xpo_file_path.stem}{suffix}.xpo"
         
-        # Быстрая валидация структуры XPO
-        if self._validate_xpo(output_file):
+        # Сохраняем XPO в той же кодировке, что и исходный, проверяя структуру на лету
+        issues = self._save_output(output_file, xpo_content)
+        
+        if not issues:
             print("\n" + "=" * 60)
             print("OK: файл сохранён: {}".format(output_file.name))
             print("  Полный путь: {}".format(output_file))
             print("  Обновлено методов: {}".format(updated_count))
+            if delta:
+                print("  Элементов в delta‑файле: {}".format(len(elements_with_updates)))
             print("=" * 60)
             return output_file
         else:
             print("\n" + "=" * 60)
             print("ПРЕДУПРЕЖДЕНИЕ: структура XPO может быть некорректной.")
+            for issue in issues:
+                print("  {}".format(format_issue(issue)))
             print("  Файл сохранён: {}".format(output_file.name))
             print("  Полный путь: {}".format(output_file))
             print("=" * 60)
             return output_file
     
-    def _get_element_type(self, props_file: Path) -> Optional[str]:
+    def watch(self, delta: bool = False, debounce: float = WATCH_DEBOUNCE, watcher=None):
+        """
+        Долгоживущий режим: следит за parserXPO и пересобирает `_WR.xpo`
+        после каждого сохранения XPP‑файлов.
+        
+        Исходный XPO читается один раз и хранится в памяти поэлементно;
+        при изменении пересобираются только элементы затронутых каталогов.
+        Пачки сохранений объединяются: пересборка начинается, когда
+        изменений не было `debounce` секунд. Остановка — Ctrl+C.
+        
+        Args:
+            delta: писать только изменённые элементы (см. write_back).
+            debounce: пауза после последнего события перед пересборкой.
+            watcher: наблюдатель за parserXPO (по умолчанию — create_parser_watcher).
+        """
+        xpo_mtime = self.xpo_file_path.stat().st_mtime
+        xpo_content = self._read_xpo()
+        
+        # Разбиваем XPO на сегменты: заголовок + по одному на элемент
+        elements = find_xpo_elements(xpo_content)
+        original_segments = [xpo_content[:elements[0][0]] if elements else xpo_content]
+        element_index = {}  # (тип, имя) -> номер сегмента
+        end_index = None
+        for start, end, element_type in elements:
+            element_content = xpo_content[start:end]
+            if element_type == 'END':
+                end_index = len(original_segments)
+            else:
+                element_name = extract_element_name(element_type, element_content)
+                if element_name:
+                    element_index[(element_type, element_name)] = len(original_segments)
+            original_segments.append(element_content)
+        
+        segments = list(original_segments)
+        updated = {}  # номер сегмента -> (тип, имя, обновлённые методы)
+        
+        suffix = "_WR_delta" if delta else "_WR"
+        output_file = self.xpo_file_path.parent / f"{self.xpo_file_path.stem}{suffix}.xpo"
+        
+        def refresh(element_names: Set[str]):
+            """Пересобирает сегменты указанных элементов из исходного текста."""
+            for element_name in element_names:
+                element_dir = self.parser_dir / element_name
+                props_file = element_dir / "properties.txt"
+                element_type = self._get_element_type(props_file) if props_file.exists() else None
+                if not element_type:
+                    continue
+                
+                index = element_index.get((element_type, element_name))
+                if index is None:
+                    print(f"ВНИМАНИЕ: элемент {element_type}:{element_name} не найден в XPO.")
+                    continue
+                
+                content, methods = self._apply_element_updates(
+                    original_segments[index], element_dir, element_type, xpo_mtime
+                )
+                segments[index] = content
+                if methods:
+                    updated[index] = (element_type, element_name, methods)
+                else:
+                    updated.pop(index, None)
+        
+        def flush() -> List[Dict]:
+            """Записывает текущую версию выходного XPO из сегментов в памяти."""
+            if delta:
+                parts = [segments[0]] + [segments[index] for index in sorted(updated)]
+                parts.append(segments[end_index] if end_index is not None else '***Element: END\n')
+                content = ''.join(parts)
+            else:
+                content = ''.join(segments)
+            
+            self.updated_methods = [
+                f"{element_type}:{element_name}.{method_name}"
+                for element_type, element_name, methods in (updated[index] for index in sorted(updated))
+                for method_name in methods
+            ]
+            return self._save_output(output_file, content)
+        
+        initial_names = {d.name for d in self.parser_dir.iterdir() if d.is_dir()}
+        refresh(initial_names)
+        issues = flush()
+        
+        if watcher is None:
+            watcher = create_parser_watcher(self.parser_dir)
+        print(f"Наблюдение за {self.parser_dir} ({watcher.kind}), выходной файл: {output_file.name}")
+        print(f"Обновлено методов: {len(self.updated_methods)}" + (", есть проблемы структуры" if issues else ""))
+        print("Остановка — Ctrl+C.")
+        
+        try:
+            while True:
+                changed = watcher.wait(None)
+                # Ждём окончания пачки сохранений
+                while True:
+                    more = watcher.wait(debounce)
+                    if not more:
+                        break
+                    changed |= more
+                
+                started = time.perf_counter()
+                element_names = set()
+                for path in changed:
+                    try:
+                        relative = path.relative_to(self.parser_dir)
+                    except ValueError:
+                        continue
+                    if relative.parts:
+                        element_names.add(relative.parts[0])
+                if not element_names:
+                    continue
+                
+                refresh(element_names)
+                try:
+                    issues = flush()
+                except ValueError as e:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] ОШИБКА: {e}")
+                    continue
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                
+                timestamp = datetime.now().strftime('%H:%M:%S')
+                print(f"[{timestamp}] {', '.join(sorted(element_names))}: "
+                      f"{output_file.name} пересобран за {elapsed_ms:.1f} мс "
+                      f"(обновлено методов: {len(self.updated_methods)})")
+                for issue in issues:
+                    print("  ПРЕДУПРЕЖДЕНИЕ: {}".format(format_issue(issue)))
+        except KeyboardInterrupt:
+            print("\nНаблюдение остановлено.")
+        finally:
+            watcher.close()
+    
+    def _apply_element_updates(self, element_content: str, element_dir: Path,
+                               element_type: str, xpo_mtime: float) -> Tuple[str, List[str]]:
+        """
+        Подставляет в текст элемента все XPP‑методы его каталога, изменённые
+        позже исходного XPO.
+        
+        Args:
+            element_content: исходный текст элемента XPO.
+            element_dir: каталог элемента в parserXPO.
+            element_type: тип элемента (CLS/TAB/JOB/FRM).
+            xpo_mtime: время модификации исходного XPO.
+            
+        Returns:
+            Кортеж (обновлённый текст элемента, список обновлённых методов).
+        """
+        method_codes = {}
+        
+        for xpp_file in sorted(element_dir.glob("*.xpp")):
+            method_name = xpp_file.stem
+            
+            # Пропускаем методы, которые не новее исходного XPO
+            if not self._is_method_modified(xpp_file, xpo_mtime):
+                continue
+            
+            # Читаем XPP‑код метода: сначала пробуем UTF‑8, затем CP1251
+            try:
+                try:
+                    with open(xpp_file, 'r', encoding='utf-8') as f:
+                        method_codes[method_name] = f.read()
+                except UnicodeDecodeError:
+                    with open(xpp_file, 'r', encoding='cp1251') as f:
+                        method_codes[method_name] = f.read()
+            except Exception as e:
+                print(f"Ошибка чтения XPP‑файла {xpp_file}: {e}")
+                continue
+        
+        if not method_codes:
+            return element_content, []
+        
+        # Все блоки SOURCE/ENDSOURCE заменяются за одну пересборку элемента
+        element_content, methods = self._replace_sources(element_content, method_codes)
+        
+        for method_name in method_codes:
+            if method_name not in methods:
+                # SOURCE для этого метода не найден в XPO
+                print(f"Не удалось обновить метод {method_name} в элементе {element_type}:{element_dir.name}.")
+        
+        return element_content, methods
+    
+    def _build_delta_content(self, xpo_content: str, elements_with_updates: Dict) -> str:
+        """
+        Собирает минимальный XPO: заголовок исходного файла, обновлённые
+        элементы в исходном порядке и завершающий `***Element: END`.
+        
+        Args:
+            xpo_content: исходный текст XPO.
+            elements_with_updates: обновлённые элементы {(start, end): данные}.
+            
+        Returns:
+            Текст delta‑XPO.
+        """
+        elements = find_xpo_elements(xpo_content)
+        header = xpo_content[:elements[0][0]] if elements else ''
+        trailer = next(
+            (xpo_content[start:end] for start, end, element_type in elements if element_type == 'END'),
+            '***Element: END\n'
+        )
+        
+        parts = [header]
+        for element_key in sorted(elements_with_updates):
+            parts.append(elements_with_updates[element_key]['content'])
+        parts.append(trailer)
+        return ''.join(parts)
+    
+    def _read_xpo(self) -> str:
+        """
+        Читает исходный XPO и определяет его фактическую кодировку:
+        сначала пробуем UTF‑8, при ошибке откатываемся на CP1251.
+        """
+        try:
+            with open(self.xpo_file_path, 'r', encoding='utf-8') as f:
+                xpo_content = f.read()
+                newlines = f.newlines
+            self.xpo_encoding = 'utf-8'
+        except UnicodeDecodeError:
+            with open(self.xpo_file_path, 'r', encoding='cp1251') as f:
+                xpo_content = f.read()
+                newlines = f.newlines
+            self.xpo_encoding = 'cp1251'
+        
+        if newlines:
+            # При смешанных переводах строк предпочитаем CRLF, как в экспорте AX
+            self.xpo_newline = '\r\n' if '\r\n' in newlines else '\n'
+        return xpo_content
+    
+    def list_elements(self) -> Set[Tuple[str, str]]:
+        """
+        Возвращает множество пар (тип, имя) всех элементов исходного XPO.
+        
+        Файл читается построчно один раз, разбираются только строки
+        `***Element:` и несколько следующих за ними строк с именем элемента;
+        текст методов не декодируется и в памяти не держится.
+        """
+        elements = set()
+        element_type = None
+        head_lines = []
+        with open(self.xpo_file_path, 'rb') as f:
+            for line in f:
+                match = ELEMENT_BYTES_PATTERN.match(line)
+                if match:
+                    element_type = match.group(1).decode('ascii')
+                    head_lines = []
+                    continue
+                if element_type is None:
+                    continue
+                
+                # Пустые строки и комментарии экспорта (`; Microsoft Dynamics AX ...`) пропускаем
+                stripped = line.strip()
+                if not stripped or stripped.startswith(b';'):
+                    continue
+                head_lines.append(line.decode(self.xpo_encoding, errors='replace'))
+                element_name = extract_element_name(element_type, ''.join(head_lines))
+                if element_name:
+                    elements.add((element_type, element_name))
+                    element_type = None
+                elif len(head_lines) >= ELEMENT_HEAD_LINES:
+                    element_type = None
+        return elements
+    
+    @staticmethod
+    def _get_element_type(props_file: Path) -> Optional[str]:
         """Возвращает тип элемента (CLS/TAB/JOB/FRM) из properties.txt."""
         try:
             with open(props_file, 'r', encoding='utf-8') as f:
@@ -210,7 +488,7 @@ class XPOWriter:
             # Берём содержимое элемента до следующего ***Element: или конца файла
             end_match = re.search(r'\*\*\*Element:', content[start_pos + 1:])
             if end_match:
-                end_pos = start_pos + end_match.start()
+                end_pos = start_pos + 1 + end_match.start()
             else:
                 end_pos = len(content)
             
@@ -295,99 +573,580 @@ class XPOWriter:
         
         return '\n'.join(formatted_lines)
     
-    def _replace_source_in_content(self, element_content: str, 
-                                   method_name: str, method_code: str) -> Optional[str]:
+    def _replace_sources(self, element_content: str,
+                         method_codes: Dict[str, str]) -> Tuple[str, List[str]]:
         """
-        Заменяет содержимое блока SOURCE/ENDSOURCE для указанного метода.
+        Заменяет блоки SOURCE/ENDSOURCE нескольких методов за один проход.
+        
+        Таблица блоков SOURCE строится один раз (см. index_source_spans);
+        метод из XPP‑файла сопоставляется с блоком, путь которого равен
+        имени метода, т.е. с методом самого элемента. Одноимённые методы
+        источников данных и контролов формы при этом не затрагиваются.
         
         Args:
             element_content: текст элемента XPO.
-            method_name: имя метода (имя XPP‑файла без расширения).
-            method_code: исходный код метода из XPP.
+            method_codes: {имя метода: исходный код метода из XPP}.
             
         Returns:
-            Обновлённый текст элемента или None, если блок SOURCE не найден.
+            Кортеж (обновлённый текст элемента, список заменённых методов).
         """
-        # Ищем блок SOURCE нужного метода
-        source_pattern = rf'SOURCE\s+#{re.escape(method_name)}(.*?)ENDSOURCE'
-        
-        match = re.search(source_pattern, element_content, re.DOTALL)
-        if not match:
-            return None
-        
-        # Форматируем код под структуру XPO
-        formatted_code = self._format_code_for_xpo(method_code)
-        
-        # Сохраняем исходные отступы перед SOURCE/ENDSOURCE
-        old_source_content = match.group(0)
-        source_indent = self._get_indent_before(old_source_content, 'SOURCE')
-        endsource_indent = self._get_indent_before(old_source_content, 'ENDSOURCE')
-        
-        new_source_content = f'{source_indent}SOURCE #{method_name}\n{formatted_code}\n{endsource_indent}ENDSOURCE'
+        spans = index_source_spans(element_content)
+        targets = sorted(
+            (spans[method_name] for method_name in method_codes if method_name in spans),
+            key=lambda span: span['start']
+        )
         
-        # Подменяем старый блок SOURCE на новый
-        new_element_content = element_content.replace(old_source_content, new_source_content)
+        parts = []
+        pos = 0
+        replaced = []
+        for span in targets:
+            method_name = span['name']
+            formatted_code = self._format_code_for_xpo(method_codes[method_name])
+            parts.append(element_content[pos:span['start']])
+            # Отступ перед SOURCE остаётся в тексте, отступ ENDSOURCE сохраняем
+            parts.append(f"SOURCE #{method_name}\n{formatted_code}\n{span['endsource_indent']}ENDSOURCE")
+            pos = span['end']
+            replaced.append(method_name)
+        parts.append(element_content[pos:])
         
-        return new_element_content
+        return ''.join(parts), replaced
     
-    def _get_indent_before(self, text: str, marker: str) -> str:
+    def _save_output(self, output_file: Path, xpo_content: str) -> List[Dict]:
         """
-        Находит отступ (пробелы) перед строкой, содержащей marker.
+        Записывает XPO на диск и за тот же проход проверяет его структуру.
         
         Args:
-            text: исходный многострочный текст.
-            marker: строка‑маркер (например, 'SOURCE').
+            output_file: путь к выходному XPO‑файлу.
+            xpo_content: итоговый текст XPO.
             
         Returns:
-            Строку с пробельным отступом (может быть пустой).
-        """
-        match = re.search(rf'^(\s*){re.escape(marker)}', text, re.MULTILINE)
-        if match:
-            return match.group(1)
-        return '  '  # запасной отступ по умолчанию
-    
-    def _validate_xpo(self, xpo_file: Path) -> bool:
-        """
-        Простая проверка целостности получившегося XPO‑файла.
-        
-        Args:
-            xpo_file: путь к XPO‑файлу.
+            Список проблем структуры (пустой, если всё корректно).
             
-        Returns:
-            True, если структура выглядит корректной.
+        Raises:
+            ValueError: в тексте есть символ, не представимый в кодировке XPO;
+                файл в этом случае не записывается.
         """
+        text = xpo_content.replace('\n', self.xpo_newline)
         try:
-            with open(xpo_file, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+            data = text.encode(self.xpo_encoding)
+        except UnicodeEncodeError as e:
+            raise ValueError(f"{self._describe_unencodable(text, e.start)}; "
+                             f"файл {output_file.name} не записан") from e
+        validator = XPOStructureValidator()
+        
+        with open(output_file, 'wb') as f:
+            for pos in range(0, len(data), WRITE_CHUNK_SIZE):
+                chunk = data[pos:pos + WRITE_CHUNK_SIZE]
+                validator.feed(chunk)
+                f.write(chunk)
+        
+        return validator.finish()
+    
+    def _describe_unencodable(self, text: str, pos: int) -> str:
+        """Описывает символ text[pos], который нельзя записать в кодировке XPO: элемент и строка."""
+        char = text[pos]
+        line = text.count('\n', 0, pos) + 1
+        element = "заголовок файла"
+        element_start = text.rfind('***Element:', 0, pos)
+        if element_start >= 0:
+            element_end = text.find('***Element:', pos)
+            element_text = text[element_start:element_end if element_end >= 0 else len(text)]
+            element_type = element_text[len('***Element:'):].split(None, 1)[0]
+            element_name = extract_element_name(element_type, element_text)
+            element = f"элемент {element_type}:{element_name}" if element_name else f"элемент {element_type}"
+        return (f"символ {char!r} (U+{ord(char):04X}) не представим в кодировке {self.xpo_encoding}: "
+                f"{element}, строка {line}")
+
+
+class _InotifyWatcher:
+    """Наблюдение за каталогом parserXPO через inotify (Linux)."""
+    
+    kind = "inotify"
+    
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CLOSE_WRITE = 0x00000008
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    
+    # struct inotify_event: wd, mask, cookie, len, затем имя
+    EVENT_HEADER = struct.Struct('iIII')
+    
+    def __init__(self, root: Path):
+        self.root = root
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self._watches = {}  # wd -> каталог
+        self._add_watch(root)
+        for element_dir in root.iterdir():
+            if element_dir.is_dir():
+                self._add_watch(element_dir)
+    
+    def _add_watch(self, path: Path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(path)), self.WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch: {path}")
+        self._watches[wd] = path
+    
+    def wait(self, timeout: Optional[float]) -> Set[Path]:
+        """Ждёт события не дольше timeout секунд (None — без ограничения)."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        
+        data = os.read(self._fd, 64 * 1024)
+        changed = set()
+        pos = 0
+        while pos + self.EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = self.EVENT_HEADER.unpack_from(data, pos)
+            pos += self.EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
             
-            # [removed corrupted comment]
-            if not content.startswith('Exportfile for AOT'):
-                return False
+            directory = self._watches.get(wd)
+            if mask & self.IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if directory is None:
+                continue
             
-            # [removed corrupted comment]
-            if '***Element: END' not in content:
-                return False
+            path = directory / os.fsdecode(name) if name else directory
+            # Новый каталог элемента тоже берём под наблюдение
+            if directory == self.root and mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                self._add_watch(path)
+            changed.add(path)
+        
+        return changed
+    
+    def close(self):
+        os.close(self._fd)
+
+
+class _PollingWatcher:
+    """Наблюдение за каталогом parserXPO опросом времени модификации файлов."""
+    
+    kind = "polling"
+    
+    def __init__(self, root: Path, interval: float = WATCH_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self._state = self._snapshot()
+    
+    def _snapshot(self) -> Dict[Path, int]:
+        state = {}
+        for path in self.root.glob("*/*"):
+            try:
+                state[path] = path.stat().st_mtime_ns
+            except OSError:
+                continue
+        return state
+    
+    def wait(self, timeout: Optional[float]) -> Set[Path]:
+        """Ждёт изменений не дольше timeout секунд (None — без ограничения)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self._snapshot()
+            changed = {
+                path for path in current.keys() | self._state.keys()
+                if current.get(path) != self._state.get(path)
+            }
+            self._state = current
+            if changed:
+                return changed
             
-            # [removed corrupted comment]
-            source_count = len(re.findall(r'SOURCE\s+#', content))
-            endsource_count = len(re.findall(r'ENDSOURCE', content))
-            if source_count != endsource_count:
-                return False
+            if deadline is None:
+                time.sleep(self.interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return set()
+            time.sleep(min(self.interval, remaining))
+    
+    def close(self):
+        pass
+
+
+def create_parser_watcher(root: Path):
+    """Создаёт наблюдатель за parserXPO: inotify на Linux, иначе опрос."""
+    if sys.platform.startswith('linux'):
+        try:
+            return _InotifyWatcher(root)
+        except (OSError, AttributeError):
+            pass
+    return _PollingWatcher(root)
+
+
+def is_writer_output(xpo_file: Path) -> bool:
+    """Проверяет, что файл — результат работы writer (`*_WR.xpo`, `*_WR_delta.xpo`), а не исходный экспорт."""
+    return xpo_file.stem.endswith(('_WR', '_WR_delta'))
+
+
+def list_parser_elements(parser_dir: Path) -> Dict[Tuple[str, str], Path]:
+    """
+    Возвращает элементы каталога parserXPO: (тип, имя) -> каталог элемента.
+    Учитываются только каталоги с properties.txt, как и в write_back.
+    """
+    elements = {}
+    for element_dir in Path(parser_dir).iterdir():
+        if not element_dir.is_dir():
+            continue
+        props_file = element_dir / "properties.txt"
+        if not props_file.exists():
+            continue
+        element_type = XPOWriter._get_element_type(props_file)
+        if element_type:
+            elements[(element_type, element_dir.name)] = element_dir
+    return elements
+
+
+def build_project_index(xpo_dir: str = "XPO", parser_dir: str = "parserXPO") -> Dict[Path, List[Tuple[str, str]]]:
+    """
+    Строит индекс «проектный XPO -> изменённые элементы parserXPO, которые в нём есть».
+    
+    Элемент считается изменённым, если хотя бы один его XPP‑файл новее XPO.
+    Проект, для которого изменённых элементов нет по времени, не читается
+    вовсе; остальные читаются один раз и только по заголовкам элементов
+    (см. XPOWriter.list_elements). В индекс попадают только проекты,
+    в которых есть что записывать.
+    
+    Args:
+        xpo_dir: каталог с проектными XPO.
+        parser_dir: каталог `parserXPO`.
+        
+    Returns:
+        Словарь {путь_к_XPO: [(тип, имя), ...]} в порядке имён файлов.
+    """
+    newest_xpp = {}
+    for element_key, element_dir in list_parser_elements(Path(parser_dir)).items():
+        xpp_mtimes = [xpp_file.stat().st_mtime for xpp_file in element_dir.glob("*.xpp")]
+        if xpp_mtimes:
+            newest_xpp[element_key] = max(xpp_mtimes)
+    
+    index = {}
+    for xpo_file in sorted(Path(xpo_dir).glob("*.xpo")):
+        if is_writer_output(xpo_file):
+            continue
+        
+        xpo_mtime = xpo_file.stat().st_mtime
+        changed = {element_key for element_key, mtime in newest_xpp.items() if mtime > xpo_mtime}
+        if not changed:
+            continue
+        
+        affected = sorted(XPOWriter(str(xpo_file), parser_dir).list_elements() & changed)
+        if affected:
+            index[xpo_file] = affected
+    
+    return index
+
+
+def _write_back_worker(xpo_file: str, parser_dir: str, delta: bool = False,
+                       elements: Optional[List[Tuple[str, str]]] = None) -> Dict:
+    """
+    Выполняет write_back одного проекта в дочернем процессе, только для
+    элементов elements из индекса проектов.
+    Вывод writer перехватывается, чтобы логи проектов не перемешивались.
+    """
+    result = {
+        'xpo_file': xpo_file,
+        'output_file': None,
+        'updated_methods': [],
+        'log': '',
+        'error': None,
+    }
+    log_buffer = io.StringIO()
+    with contextlib.redirect_stdout(log_buffer):
+        try:
+            writer = XPOWriter(xpo_file, parser_dir)
+            output_file = writer.write_back(delta=delta, elements=elements)
+            result['output_file'] = str(output_file) if output_file else None
+            result['updated_methods'] = writer.updated_methods
+        except Exception as e:
+            result['error'] = str(e)
+    result['log'] = log_buffer.getvalue()
+    return result
+
+
+def write_back_all(xpo_dir: str = "XPO", parser_dir: str = "parserXPO",
+                   max_workers: Optional[int] = None, delta: bool = False) -> List[Dict]:
+    """
+    Пакетная запись: обновляет все проектные XPO, затронутые правками в parserXPO.
+    Затронутые проекты определяются по индексу build_project_index; каждый
+    обрабатывается в пуле процессов только для своих изменённых элементов.
+    
+    Args:
+        xpo_dir: каталог с проектными XPO.
+        parser_dir: каталог `parserXPO`.
+        max_workers: число процессов (по умолчанию — по числу ядер).
+        delta: писать только изменённые элементы (см. XPOWriter.write_back).
+        
+    Returns:
+        Список результатов по проектам (см. _write_back_worker), в порядке имён
+        файлов; проекты без изменённых методов в список не попадают.
+    """
+    index = build_project_index(xpo_dir, parser_dir)
+    if not index:
+        return []
+    
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_write_back_worker, str(xpo_file), parser_dir, delta, elements)
+            for xpo_file, elements in index.items()
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            if result['output_file'] or result['error']:
+                results.append(result)
+    
+    results.sort(key=lambda r: r['xpo_file'])
+    return results
+
+
+def print_batch_report(results: List[Dict]):
+    """Печатает сводный отчёт пакетной записи."""
+    print("\n" + "=" * 60)
+    print("СВОДНЫЙ ОТЧЁТ ПАКЕТНОЙ ЗАПИСИ")
+    print("=" * 60)
+    
+    total_methods = 0
+    failed = 0
+    for result in results:
+        xpo_name = Path(result['xpo_file']).name
+        if result['error']:
+            failed += 1
+            print(f"ОШИБКА  {xpo_name}: {result['error']}")
+        elif result['output_file']:
+            total_methods += len(result['updated_methods'])
+            print(f"OK      {xpo_name} -> {Path(result['output_file']).name} "
+                  f"(методов: {len(result['updated_methods'])})")
+            for method in result['updated_methods']:
+                print(f"          {method}")
+        else:
+            print(f"--      {xpo_name}: изменений нет")
+    
+    print("-" * 60)
+    print(f"Проектов: {len(results)}, обновлено методов: {total_methods}, ошибок: {failed}")
+    print("=" * 60)
+
+
+def _hash_xpo_elements(xpo_file: Path) -> Tuple[bytes, List[Dict]]:
+    """
+    Читает XPO как байты и хэширует каждый элемент (и заголовок файла).
+    
+    Returns:
+        Кортеж (содержимое файла, список элементов с type, name, start, end, hash).
+    """
+    with open(xpo_file, 'rb') as f:
+        data = f.read()
+    
+    matches = list(ELEMENT_BYTES_PATTERN.finditer(data))
+    elements = [{
+        'type': 'HEADER',
+        'name': '',
+        'start': 0,
+        'end': matches[0].start() if matches else len(data),
+    }]
+    for i, match in enumerate(matches):
+        start = match.start()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(data)
+        element_type = match.group(1).decode('ascii')
+        # latin-1 сохраняет соответствие символ = байт, имена элементов — ASCII
+        element_name = extract_element_name(element_type, data[start:end].decode('latin-1')) or ''
+        elements.append({'type': element_type, 'name': element_name, 'start': start, 'end': end})
+    
+    for element in elements:
+        element['hash'] = hashlib.sha1(data[element['start']:element['end']]).hexdigest()
+    
+    return data, elements
+
+
+def _split_element_by_sources(element_text: str) -> List[Tuple[str, str, int]]:
+    """
+    Делит текст элемента на чередующиеся сегменты: ('text', текст, позиция)
+    вне блоков SOURCE и ('source', путь, позиция) для каждого блока SOURCE.
+    """
+    segments = []
+    pos = 0
+    for path, span in index_source_spans(element_text).items():
+        segments.append(('text', element_text[pos:span['start']], pos))
+        segments.append(('source', path, span['start']))
+        pos = span['end']
+    segments.append(('text', element_text[pos:], pos))
+    return segments
+
+
+def _compare_touched_element(original: str, output: str) -> Tuple[List[str], Optional[Tuple[int, str]]]:
+    """
+    Сравнивает изменённый элемент: различия допустимы только внутри блоков SOURCE.
+    
+    Returns:
+        Кортеж (пути изменённых блоков SOURCE,
+        (смещение в элементе выходного файла, описание) первой посторонней
+        правки или None).
+    """
+    original_spans = index_source_spans(original)
+    output_spans = index_source_spans(output)
+    original_segments = _split_element_by_sources(original)
+    output_segments = _split_element_by_sources(output)
+    
+    for (kind, value, _), (out_kind, out_value, out_pos) in zip(original_segments, output_segments):
+        if kind != out_kind or value != out_value:
+            if kind == 'text' and out_kind == 'text':
+                prefix = os.path.commonprefix([value, out_value])
+                return [], (out_pos + len(prefix), "изменение вне блоков SOURCE")
+            return [], (out_pos, "изменён набор или порядок блоков SOURCE")
+    if len(original_segments) != len(output_segments):
+        return [], (len(output), "изменён набор блоков SOURCE")
+    
+    changed = [
+        path for path, span in original_spans.items()
+        if original[span['start']:span['end']] != output[output_spans[path]['start']:output_spans[path]['end']]
+    ]
+    return changed, None
+
+
+def verify_roundtrip(original_file: str, output_file: str,
+                     expected_methods: Optional[Set[str]] = None) -> Dict:
+    """
+    Проверяет эквивалентность исходного XPO и результата writer.
+    
+    Оба файла хэшируются поэлементно, один за другим: разбор занят
+    регулярными выражениями под GIL, а передача содержимого файлов из
+    дочерних процессов стоила бы дороже самого хэширования. Нетронутые
+    элементы должны совпадать побайтно, а изменённые — отличаться только
+    внутри блоков SOURCE методов самого элемента (путь без '/'). Для
+    delta‑файла (`*_WR_delta.xpo`) отсутствие неизменённых элементов не
+    считается ошибкой.
+    
+    Args:
+        original_file: исходный XPO.
+        output_file: `_WR.xpo` или `_WR_delta.xpo`.
+        expected_methods: ожидаемые изменения вида 'CLS:Имя.метод'; если заданы,
+            изменение любого другого SOURCE считается посторонним.
             
-            return True
-        except Exception:
-            return False
+    Returns:
+        Отчёт: ok, untouched, touched [{element, methods}],
+        problems [{element, offset, message}], seconds.
+    """
+    started = time.perf_counter()
+    partial = Path(output_file).stem.endswith('_WR_delta')
+    
+    original_data, original_elements = _hash_xpo_elements(Path(original_file))
+    output_data, output_elements = _hash_xpo_elements(Path(output_file))
+    
+    def keyed(elements):
+        # Одноимённые элементы различаем порядковым номером
+        result = {}
+        for element in elements:
+            key = (element['type'], element['name'])
+            occurrence = 1
+            while (key, occurrence) in result:
+                occurrence += 1
+            result[(key, occurrence)] = element
+        return result
+    
+    original_by_key = keyed(original_elements)
+    output_by_key = keyed(output_elements)
+    
+    report = {'ok': True, 'untouched': 0, 'touched': [], 'problems': [], 'seconds': 0.0}
+    
+    def problem(element_label, offset, message):
+        report['problems'].append({'element': element_label, 'offset': offset, 'message': message})
+    
+    for key, element in original_by_key.items():
+        (element_type, element_name), _ = key
+        label = f"{element_type}:{element_name}" if element_name else element_type
+        output_element = output_by_key.get(key)
+        
+        if output_element is None:
+            if not partial:
+                problem(label, None, "элемент отсутствует в выходном файле")
+            continue
+        
+        if output_element['hash'] == element['hash']:
+            report['untouched'] += 1
+            continue
+        
+        changed, collateral = _compare_touched_element(
+            original_data[element['start']:element['end']].decode('latin-1'),
+            output_data[output_element['start']:output_element['end']].decode('latin-1')
+        )
+        if collateral:
+            offset, message = collateral
+            problem(label, output_element['start'] + offset, message)
+            continue
+        
+        for path in changed:
+            if '/' in path or (expected_methods is not None and f"{label}.{path}" not in expected_methods):
+                problem(label, None, f"изменён блок SOURCE {path}, который writer не должен был менять")
+        report['touched'].append({'element': label, 'methods': changed})
+    
+    for key, output_element in output_by_key.items():
+        if key not in original_by_key:
+            (element_type, element_name), _ = key
+            problem(f"{element_type}:{element_name}", output_element['start'], "лишний элемент в выходном файле")
+    
+    report['ok'] = not report['problems']
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+
+def print_verify_report(report: Dict):
+    """Печатает отчёт проверки roundtrip."""
+    print("\n" + "=" * 60)
+    print("ПРОВЕРКА ROUNDTRIP: " + ("OK" if report['ok'] else "ОБНАРУЖЕНЫ ПОСТОРОННИЕ ИЗМЕНЕНИЯ"))
+    print("=" * 60)
+    print(f"Нетронутых элементов (совпадают побайтно): {report['untouched']}")
+    print(f"Изменённых элементов: {len(report['touched'])}")
+    for touched in report['touched']:
+        print(f"  {touched['element']}: {', '.join(touched['methods'])}")
+    if report['problems']:
+        print("Проблемы:")
+        for item in report['problems']:
+            position = f" (байт {item['offset']})" if item['offset'] is not None else ""
+            print(f"  {item['element']}{position}: {item['message']}")
+    print(f"Время проверки: {report['seconds']:.2f} с")
+    print("=" * 60)
 
 
 def main():
     """CLI‑обёртка для запуска XPOWriter из консоли."""
-    import sys
+    # Флаги отделяем от позиционных аргументов
+    batch = '--all' in sys.argv
+    delta = '--delta' in sys.argv
+    watch = '--watch' in sys.argv
+    verify = '--verify' in sys.argv
+    args_without_flags = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    
+    if batch:
+        # Пакетный режим: все проектные XPO из каталога XPO
+        parser_dir = args_without_flags[0] if args_without_flags else "parserXPO"
+        print("Пакетная запись изменений XPP во все затронутые XPO.")
+        print(f"Каталог parserXPO: {parser_dir}")
+        print("-" * 60)
+        try:
+            results = write_back_all("XPO", parser_dir, delta=delta)
+        except FileNotFoundError as e:
+            print(f"Ошибка: {e}")
+            sys.exit(1)
+        if not results:
+            print("Нет проектов с изменёнными методами.")
+            return
+        print_batch_report(results)
+        if any(result['error'] for result in results):
+            sys.exit(1)
+        return
     
     # Если XPO‑файл не передан в аргументах, пытаемся найти его в каталоге XPO
-    if len(sys.argv) < 2:
+    if not args_without_flags:
         xpo_dir = Path("XPO")
         if xpo_dir.exists():
-            xpo_files = list(xpo_dir.glob("*.xpo"))
+            xpo_files = [f for f in xpo_dir.glob("*.xpo") if not is_writer_output(f)]
             if xpo_files:
                 print(f"Найдено XPO‑файлов в каталоге XPO: {len(xpo_files)}")
                 for i, xpo_file in enumerate(xpo_files, 1):
@@ -400,20 +1159,21 @@ def main():
                 else:
                     print("Укажите XPO‑файл явно: python xpo_writer.py <имя_файла.xpo> [каталог_parserXPO]")
                     print("Доступно несколько файлов в каталоге XPO.")
+                    print("Для обработки всех проектов сразу: python xpo_writer.py --all [каталог_parserXPO]")
                     sys.exit(1)
             else:
                 print("В каталоге XPO не найдено файлов с расширением .xpo.")
-                print("Использование: python xpo_writer.py <имя_файла.xpo> [каталог_parserXPO]")
+                print("Использование: python xpo_writer.py <имя_файла.xpo> [каталог_parserXPO] [--delta] [--watch] [--verify]")
                 print(f"Текущий каталог XPO: {xpo_dir.resolve()}")
                 sys.exit(1)
         else:
             print("Каталог XPO не найден.")
-            print("Использование: python xpo_writer.py <имя_файла.xpo> [каталог_parserXPO]")
+            print("Использование: python xpo_writer.py <имя_файла.xpo> [каталог_parserXPO] [--delta] [--watch] [--verify]")
             sys.exit(1)
     else:
-        xpo_file = sys.argv[1]
+        xpo_file = args_without_flags[0]
     
-    parser_dir = sys.argv[2] if len(sys.argv) > 2 else "parserXPO"
+    parser_dir = args_without_flags[1] if len(args_without_flags) > 1 else "parserXPO"
     
     try:
         writer = XPOWriter(xpo_file, parser_dir)
@@ -421,16 +1181,27 @@ def main():
         print("Запуск записи изменений XPP обратно в XPO.")
         print(f"Исходный XPO: {xpo_file}")
         print(f"Каталог parserXPO: {parser_dir}")
+        if delta:
+            print("Режим: только изменённые элементы (delta)")
         print("-" * 60)
         
-        output_file = writer.write_back()
+        if watch:
+            writer.watch(delta=delta)
+            return
+        
+        output_file = writer.write_back(delta=delta)
         
         if output_file:
             print(f"\nГотово: XPO‑файл успешно обновлён.")
+            if verify:
+                # Проверка перед импортом в AOT: меняться могли только записанные методы
+                report = verify_roundtrip(xpo_file, str(output_file), set(writer.updated_methods))
+                print_verify_report(report)
+                sys.exit(0 if report['ok'] else 1)
         else:
             print(f"\nНет изменений для записи в XPO.")
             
-    except FileNotFoundError as e:
+    except (FileNotFoundError, ValueError) as e:
         print(f"Ошибка: {e}")
         sys.exit(1)
     except Exception as e: